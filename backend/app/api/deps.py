@@ -1,4 +1,4 @@
-from typing import Generator, Optional
+from typing import AsyncGenerator, Generator, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
@@ -8,6 +8,7 @@ from sqlalchemy import select
 
 from app.core.config import settings
 from app.core.database import get_db
+from app.core.shards import mail_store
 from app.models.user import User
 
 reusable_oauth2 = OAuth2PasswordBearer(
@@ -72,3 +73,26 @@ async def get_current_active_superuser(
             status_code=400, detail="权限不足"
         )
     return current_user
+
+
+async def get_mail_db(
+    current_user: User = Depends(get_current_user),
+) -> AsyncGenerator[AsyncSession, None]:
+    """当前用户邮件数据 (文件夹、邮件、验证码) 的读写会话：按用户分库时连接其分库，否则与 get_db 相同"""
+    async with mail_store(current_user.id) as store:
+        async with store.session() as session:
+            try:
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+
+async def get_mail_read_db(
+    current_user: User = Depends(get_current_user),
+) -> AsyncGenerator[AsyncSession, None]:
+    """当前用户邮件数据的只读会话 (对应 get_read_db)"""
+    async with mail_store(current_user.id) as store:
+        async with store.read_session() as session:
+            yield session
@@ -3,7 +3,7 @@ API v1 路由
 """
 from fastapi import APIRouter
 
-from app.api.v1 import auth, users, accounts, emails, folders, websocket, settings
+from app.api.v1 import auth, users, accounts, emails, folders, websocket, settings, jobs
 
 api_v1 = APIRouter()
 
@@ -14,4 +14,5 @@ api_v1.include_router(accounts.router, prefix="/accounts", tags=["邮箱账户"]
 api_v1.include_router(folders.router, prefix="/folders", tags=["文件夹"])
 api_v1.include_router(emails.router, prefix="/emails", tags=["邮件"])
 api_v1.include_router(websocket.router, prefix="/ws", tags=["WebSocket"])
-api_v1.include_router(settings.router, prefix="/settings", tags=["系统设置"])
\ No newline at end of file
+api_v1.include_router(settings.router, prefix="/settings", tags=["系统设置"])
+api_v1.include_router(jobs.router, prefix="/jobs", tags=["后台任务"])
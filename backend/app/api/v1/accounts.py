@@ -1,19 +1,29 @@
 from typing import List, Optional, Generic, TypeVar
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks
+import asyncio
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, desc
-from pydantic import BaseModel
+from sqlalchemy import select, delete, desc, func
+from pydantic import BaseModel, Field
 from pydantic.generics import GenericModel
 import csv
 import io
-import re
 
-from app.core.database import get_db
-from app.api.deps import get_current_user
+from app.core.config import settings
+from app.core.database import get_db, get_read_db
+from app.api.deps import get_current_user, get_mail_read_db
+from app.core.shards import apply_shard_counters
 from app.models.user import User
-from app.models.email import Email
 from app.models.email_account import EmailAccount, ProviderType, AccountStatus, AuthType
-from app.services.imap_sync import sync_emails, sync_account_task
+from app.models.folder import Folder
+from app.models.job import Job, JobKind, JobPriority
+from app.services.imap_sync import get_effective_proxy, sync_limit_keys, CODE_LOOKUP_SOURCE
+from app.services.events import email_events
+from app.services.job_queue import enqueue_job, wait_for_job
+from app.services.verification_codes import latest_code
+from app.services.rate_limiter import rate_limiter
+from app.services.response_cache import response_cache
+from app.services.scheduler import request_sync
 
 router = APIRouter()
 
@@ -65,6 +75,10 @@ class UpdateAccountSchema(BaseModel):
     imap_server: Optional[str] = None
     imap_port: Optional[int] = None
 
+    # 保留策略：0 为不限制，显式传 null 恢复使用全局配置
+    retention_days: Optional[int] = Field(None, ge=0)
+    retention_max_per_folder: Optional[int] = Field(None, ge=0)
+
 class AccountResponse(BaseModel):
     id: int
     email_address: str
@@ -75,6 +89,7 @@ class AccountResponse(BaseModel):
     status_message: Optional[str]
     total_emails: int
     unread_count: int
+    storage_used: int = 0
     last_sync_at: Optional[str]
     # OAuth 详情 (仅在编辑时需要回显部分)
     client_id: Optional[str] = None
@@ -82,6 +97,8 @@ class AccountResponse(BaseModel):
     imap_port: Optional[int] = None
     imap_username: Optional[str] = None
     proxy_url: Optional[str] = None
+    retention_days: Optional[int] = None
+    retention_max_per_folder: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -148,7 +165,6 @@ async def get_default_credentials(
 @router.post("/batch-import", status_code=status.HTTP_201_CREATED)
 async def batch_import_accounts(
     file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -184,7 +200,7 @@ async def batch_import_accounts(
         
         imported_count = 0
         errors = []
-        new_account_ids = []
+        new_accounts = []
         
         for row in rows:
             email = row.get('email_address', '').strip()
@@ -244,15 +260,15 @@ async def batch_import_accounts(
                 
             db.add(new_account)
             await db.flush()  # 获取 ID
-            new_account_ids.append(new_account.id)
+            new_accounts.append(new_account)
             imported_count += 1
             
         await db.commit()
+        await response_cache.invalidate(current_user.id)
         
         # 触发后台同步
-        if background_tasks and new_account_ids:
-            for acc_id in new_account_ids:
-                background_tasks.add_task(sync_account_task, acc_id)
+        for acc in new_accounts:
+            await request_sync(db, acc, user_id=current_user.id, source="import")
         
         return {
             "success": True, 
@@ -268,7 +284,6 @@ async def batch_import_accounts(
 @router.post("/", response_model=ApiResponse[AccountResponse], status_code=status.HTTP_201_CREATED)
 async def create_account(
     account_in: CreateAccountSchema,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -323,9 +338,10 @@ async def create_account(
     db.add(new_account)
     await db.commit()
     await db.refresh(new_account)
+    await response_cache.invalidate(current_user.id)
     
     # 触发后台同步
-    background_tasks.add_task(sync_account_task, new_account.id)
+    await request_sync(db, new_account, user_id=current_user.id, source="create")
     
     # 返回统一格式（使用 to_dict() 而不是 include_credentials）
     account_dict = new_account.to_dict()
@@ -335,7 +351,7 @@ async def create_account(
 async def export_accounts(
     limit: int = 1000,
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """导出账户（包含敏感字段）"""
     result = await db.execute(
@@ -367,27 +383,41 @@ async def export_accounts(
 
 @router.get("/", response_model=ApiResponse[List[AccountResponse]])
 async def list_accounts(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """获取账户列表"""
+    """获取账户列表 (响应按用户与分页参数缓存，带 If-None-Match 且未变化时返回 304)"""
+    cached = await response_cache.lookup(
+        "accounts", current_user.id, {"skip": skip, "limit": limit},
+        if_none_match=request.headers.get("If-None-Match"),
+    )
+    if cached.not_modified:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cached.headers())
+    response.headers.update(cached.headers())
+    if cached.hit:
+        return cached.value
     result = await db.execute(
         select(EmailAccount)
-        .where(EmailAccount.user_id == current_user.id)
+        .where(EmailAccount.user_id == current_user.id, EmailAccount.status != AccountStatus.DELETING)
         .offset(skip)
         .limit(limit)
     )
     accounts = result.scalars().all()
+    await apply_shard_counters(current_user.id, accounts)
     # 正常模式：返回安全数据（不包含敏感信息）
-    return {"success": True, "data": [acc.to_dict(include_credentials=False) for acc in accounts]}
+    body = {"success": True, "data": [acc.to_dict(include_credentials=False) for acc in accounts]}
+    await cached.store(body)
+    return body
 
 @router.get("/{account_id}", response_model=ApiResponse[AccountResponse])
 async def get_account(
     account_id: int,
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """获取单个账户详情"""
     result = await db.execute(
@@ -399,6 +429,7 @@ async def get_account(
     account = result.scalars().first()
     if not account:
         raise HTTPException(status_code=404, detail="账户不存在")
+    await apply_shard_counters(current_user.id, [account])
     return {"success": True, "data": account.to_dict(include_credentials=True)}
 
 @router.put("/{account_id}", response_model=ApiResponse[AccountResponse])
@@ -449,18 +480,24 @@ async def update_account(
     if account_in.proxy_url is not None:
         account.proxy_url = account_in.proxy_url if account_in.proxy_url else None
 
+    # 保留策略区分 "未传" 与 "传 null" (恢复全局配置)
+    for field in ("retention_days", "retention_max_per_folder"):
+        if field in account_in.model_fields_set:
+            setattr(account, field, getattr(account_in, field))
+
     await db.commit()
     await db.refresh(account)
+    await response_cache.invalidate(current_user.id, account.id)
+    await apply_shard_counters(current_user.id, [account])
     return {"success": True, "data": account.to_dict(include_credentials=True)}
 
 @router.post("/{account_id}/sync", status_code=status.HTTP_200_OK)
 async def sync_account(
     account_id: int,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """手动触发同步"""
+    """手动触发同步 (已有排队或执行中的同步时返回该任务)"""
     # 检查账户是否存在且属于当前用户
     result = await db.execute(
         select(EmailAccount).where(
@@ -472,10 +509,10 @@ async def sync_account(
     if not account:
         raise HTTPException(status_code=404, detail="账户不存在")
     
-    # 触发后台任务
-    background_tasks.add_task(sync_account_task, account.id)
+    # 放入同步队列
+    job = await request_sync(db, account, user_id=current_user.id, source="manual")
     
-    return {"success": True, "message": "已触发后台同步"}
+    return {"success": True, "message": "已触发后台同步", "data": job.to_dict()}
 
 @router.delete("/{account_id}")
 async def delete_account(
@@ -494,18 +531,68 @@ async def delete_account(
     if not account:
         raise HTTPException(status_code=404, detail="账户不存在")
     
-    await db.delete(account)
-    await db.commit()
+    # 停止同步并交给后台任务分批删除邮件 (完成后删除账户)，进度见 GET /jobs/{id}
+    account.status = AccountStatus.DELETING
+    account.status_message = "删除中"
+    account.sync_enabled = False
+    job, _ = await enqueue_job(
+        db, JobKind.DELETE_ACCOUNT.value, account.id,
+        user_id=current_user.id, priority=JobPriority.MANUAL, source="manual",
+    )
+    await response_cache.invalidate(current_user.id, account.id)
     
-    return {"success": True, "message": "删除成功"}
+    return {"success": True, "message": "已开始删除", "data": job.to_dict()}
+
+async def _inbox_synced_at(db: AsyncSession, account: EmailAccount) -> Optional[datetime]:
+    """收件箱最近一次同步的时间 (完整同步与快速同步取较新者)"""
+    result = await db.execute(
+        select(func.max(Folder.last_sync_at)).where(
+            Folder.account_id == account.id,
+            Folder.folder_type == "inbox"
+        )
+    )
+    times = [t for t in (account.last_sync_at, result.scalar()) if t]
+    return max(times) if times else None
+
+async def _code_freshness(
+    db: AsyncSession,
+    mail_db: AsyncSession,
+    account: EmailAccount,
+    previous: Optional[datetime],
+    job: Optional[Job],
+    reload: bool = True,
+) -> dict:
+    """验证码查询结果的新鲜程度 (reload 为 False 时本次请求没有同步或等待，直接使用查询前的同步时间)"""
+    synced_at = previous
+    if reload:
+        await db.refresh(account)
+        synced_at = await _inbox_synced_at(mail_db, account)
+    if job is not None:
+        job = await db.get(Job, job.id, populate_existing=True) or job
+    return {
+        "synced_at": synced_at.isoformat() if synced_at else None,
+        "age_seconds": round((datetime.utcnow() - synced_at).total_seconds(), 1) if synced_at else None,
+        "refreshed": synced_at is not None and (previous is None or synced_at > previous),
+        "sync_job": job.to_dict() if job else None,
+    }
 
 @router.get("/{account_id}/latest-code", summary="获取最新验证码")
 async def get_latest_code(
     account_id: int,
+    refresh: bool = Query(True, description="数据不够新时先快速同步收件箱"),
+    wait: int = Query(0, ge=0, le=120, description="没有验证码时最多等待的秒数 (长轮询)，超时返回 204"),
+    since: Optional[datetime] = Query(None, description="只查找该时间之后收到的邮件 (ISO 时间或 Unix 时间戳)"),
     db: AsyncSession = Depends(get_db),
+    mail_db: AsyncSession = Depends(get_mail_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取最新验证码"""
+    """
+    获取最新验证码
+    数据超过 CODE_LOOKUP_FRESH_SECONDS 未同步时，把账户以最高优先级放入同步队列
+    (与已有的排队 / 执行中同步合并) 并最多等待 CODE_LOOKUP_SYNC_TIMEOUT_SECONDS 秒，
+    返回结果中的 freshness 说明数据的新鲜程度。
+    wait > 0 时不等待同步任务，而是挂起请求直到同步写入新邮件并找到验证码，或超时返回 204
+    """
     # 检查权限
     result = await db.execute(
         select(EmailAccount).where(
@@ -513,68 +600,62 @@ async def get_latest_code(
             EmailAccount.user_id == current_user.id
         )
     )
-    if not result.scalars().first():
+    account = result.scalars().first()
+    if not account:
         raise HTTPException(status_code=404, detail="账户不存在")
-        
-    # 查询最近邮件
-    stmt = (
-        select(Email)
-        .where(Email.account_id == account_id)
-        .order_by(desc(Email.received_at))
-        .limit(30)
-    )
-    emails = (await db.execute(stmt)).scalars().all()
-    
-    # 正则：匹配 4-8 位数字 (支持 G- 前缀，支持中间有空格)
-    # 使用 \b 边界匹配，兼容 :123456 和 G-123456
-    code_pattern = re.compile(r'\b(\d{3,4}\s?\d{3,4}|\d{4,8})\b')
-    
-    # 辅助函数：去除 HTML 标签
-    def strip_html(html_str):
-        if not html_str: return ""
-        return re.sub(r'<[^>]+>', ' ', html_str)
 
-    keywords = ['code', '验证码', 'verification', 'security', '登录', '确认', 'captcha']
-    
-    for email in emails:
-        # 拼接所有可能包含验证码的区域：主题 + 纯文本 + HTML(去标签)
-        content_parts = [email.subject or ""]
-        if email.body_text:
-            content_parts.append(email.body_text)
-        if email.body_html:
-            content_parts.append(strip_html(email.body_html))
-            
-        full_content = " ".join(content_parts)
-        
-        # 检查关键词
-        if any(k in full_content.lower() for k in keywords):
-            match = code_pattern.search(full_content)
-            if match:
-                # 提取数字（去掉空格）
-                code_val = match.group().replace(' ', '')
-                # 如果匹配的是 G- 后面的，不需要处理，因为 regex 只捕获了数字部分
-                # 但 regex group() 捕获的是 () 内的内容吗？
-                # re.search 返回 match object. match.group() 返回整个匹配串 (Group 0).
-                # 如果有括号，match.group(1) 返回第一个括号内容。
-                # 我的 regex: (\d...|\d...) 是 Group 1.
-                # 所以应该用 match.group(1) 或者 match.group() 如果整个 regex 是捕获组。
-                # 我的 regex: (?:...)(\d...)
-                # 第一个是 non-capturing group. 第二个是 capturing group.
-                # 所以 match.group(1) 是数字部分。
-                # 但 match.group() (默认0) 是整个匹配到的字符串。
-                # 如果 regex 匹配 "123456"，group(0) 是 "123456"。
-                # 如果 regex 匹配 "123 456"，group(0) 是 "123 456"。
-                
-                # Wait, match.group() returns whole match.
-                # My regex lookbehind (?<=G-) is zero-width assertion.
-                # So if input is "G-123456", match is "123456".
-                # So match.group() is correct.
-                
-                return {
-                    "success": True,
-                    "code": code_val,
-                    "email_subject": email.subject,
-                    "received_at": email.received_at
-                }
-                
-    return {"success": False, "code": None}
+    job = None
+    previous = await _inbox_synced_at(mail_db, account)
+    if refresh and account.sync_enabled and account.status not in (AccountStatus.DISABLED, AccountStatus.DELETING):
+        age = (datetime.utcnow() - previous).total_seconds() if previous else None
+        keys = sync_limit_keys(account, await get_effective_proxy(account, db))
+        if (age is None or age > settings.code_lookup_fresh_seconds) and rate_limiter.retry_after(keys) <= 0:
+            job = await request_sync(
+                db, account, user_id=current_user.id,
+                source=CODE_LOOKUP_SOURCE, priority=JobPriority.CODE_LOOKUP
+            )
+            if not wait:
+                await wait_for_job(job.id, timeout=settings.code_lookup_sync_timeout_seconds)
+
+    if since is not None and since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    # 先订阅再查询，避免查询与等待之间到达的新邮件被漏掉
+    with email_events.subscribe(account_id) as new_email:
+        while True:
+            new_email.clear()
+            found = await _find_latest_code(mail_db, account_id, since)
+            remaining = deadline - loop.time()
+            if found is not None or remaining <= 0:
+                break
+            # 结束本次读事务并归还连接，等待期间不占用连接池
+            await db.commit()
+            await mail_db.commit()
+            # 同步由独立 Worker 执行时收不到进程内事件，定期重新查询数据库兜底
+            try:
+                await asyncio.wait_for(new_email.wait(), timeout=min(remaining, settings.code_wait_recheck_seconds))
+            except asyncio.TimeoutError:
+                pass
+
+    if found is None and wait:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    freshness = await _code_freshness(db, mail_db, account, previous, job, reload=job is not None or wait > 0)
+    if found is not None:
+        return {**found, "freshness": freshness}
+    return {"success": False, "code": None, "freshness": freshness}
+
+
+async def _find_latest_code(db: AsyncSession, account_id: int, since: Optional[datetime] = None) -> Optional[dict]:
+    """查询同步时提取的最新验证码"""
+    code = await latest_code(db, account_id, since)
+    if code is None:
+        return None
+    return {
+        "success": True,
+        "code": code.code,
+        "email_subject": code.subject,
+        "received_at": code.received_at
+    }
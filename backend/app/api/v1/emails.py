@@ -1,26 +1,97 @@
 """
 邮件 API 路由
 """
-from typing import Optional
+import asyncio
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+from urllib.parse import quote
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy import select, func, desc, or_, delete, update
-from sqlalchemy.orm import selectinload
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import select, func, desc, or_, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.models.user import User
 from app.models.email import Email
+from app.models.email_address import EmailAddress
 from app.models.email_account import EmailAccount
-from app.api.deps import get_current_active_user  # 从 deps 引入
+from app.models.job import JobKind, JobPriority
+from app.models.verification_code import VerificationCode
+from app.services import raw_store
+from app.services.counters import CounterDeltas
+from app.services.email_addresses import recipient_criteria
+from app.services.email_bodies import load_bodies
+from app.services.job_queue import enqueue_job
+from app.services.response_cache import response_cache
+from app.services.search import build_match_query, fts_ready, match_subquery
+from app.api.deps import get_current_active_user, get_mail_db, get_mail_read_db  # 从 deps 引入
 
 router = APIRouter()
 
 
+class EmailUpdate(BaseModel):
+    is_read: Optional[bool] = None
+    is_flagged: Optional[bool] = None
+    is_deleted: Optional[bool] = None
+
+
+def _encode_cursor(email: Email) -> str:
+    """游标 = 本页最后一封邮件的 (received_at, id)，对客户端不透明"""
+    raw = json.dumps([email.received_at.isoformat() if email.received_at else None, email.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        received_at, email_id = json.loads(raw)
+        return datetime.fromisoformat(received_at), int(email_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """带时区的查询参数转为不带时区的 UTC 时间 (与数据库中的存储方式一致)"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def _with_accounts(catalog: AsyncSession, emails) -> list:
+    """邮件列表项 (不含正文)，附带所属账户的地址与类型"""
+    # 账户信息在主库 (按用户分库时邮件与账户不在同一个数据库)，按本页涉及的账户一次查询
+    accounts = {}
+    if emails:
+        result = await catalog.execute(
+            select(EmailAccount.id, EmailAccount.email_address, EmailAccount.provider)
+            .where(EmailAccount.id.in_({e.account_id for e in emails}))
+        )
+        accounts = {row.id: row for row in result.all()}
+
+    data = []
+    for e in emails:
+        d = e.to_dict(include_body=False)
+        account = accounts.get(e.account_id)
+        if account:
+            d['account_email'] = account.email_address
+            # 处理 Enum
+            d['account_provider'] = getattr(account.provider, 'value', str(account.provider))
+        data.append(d)
+    return data
+
+
 @router.get("/", summary="获取邮件列表")
 async def list_emails(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="游标分页：首页传空字符串，之后传上一页返回的 next_cursor"),
+    include_total: Optional[bool] = Query(None, description="是否统计总数 (页码分页默认统计，游标分页默认不统计)"),
     account_id: Optional[int] = None,
     folder_id: Optional[int] = None,
     is_read: Optional[bool] = None,
@@ -28,10 +99,29 @@ async def list_emails(
     is_deleted: Optional[bool] = Query(False), # 默认只显示未删除的
     has_attachments: Optional[bool] = None,
     q: Optional[str] = None,
-    db: AsyncSession = Depends(get_db),
+    sort: str = Query("date", pattern="^(date|relevance)$", description="有搜索词时可按相关度 (relevance) 排序"),
+    db: AsyncSession = Depends(get_mail_read_db),
+    catalog: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """获取当前用户的邮件列表"""
+    """
+    获取当前用户的邮件列表
+    - 页码分页 (page)：兼容旧客户端，深页需要 OFFSET 跳过前面所有行
+    - 游标分页 (cursor)：按 (received_at, id) 定位，任意一页的开销与第一页相同
+    - 搜索 (q)：全文索引匹配主题、发件人和正文 (支持前缀与中文)，索引不可用时按主题 / 发件人模糊匹配
+    - 响应按用户与查询参数缓存，账户数据变化时失效；带 If-None-Match 且未变化时返回 304 (见 app/services/response_cache.py)
+    """
+    cached = await response_cache.lookup("emails", current_user.id, {
+        "page": page, "page_size": page_size, "cursor": cursor, "include_total": include_total,
+        "account_id": account_id, "folder_id": folder_id, "is_read": is_read, "is_flagged": is_flagged,
+        "is_deleted": is_deleted, "has_attachments": has_attachments, "q": q, "sort": sort,
+    }, account_id=account_id, if_none_match=request.headers.get("If-None-Match"))
+    if cached.not_modified:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cached.headers())
+    response.headers.update(cached.headers())
+    if cached.hit:
+        return cached.value
+
     # 基础查询：关联账户表，筛选属于当前用户的账户
     stmt = (
         select(Email)
@@ -51,7 +141,18 @@ async def list_emails(
         stmt = stmt.where(Email.is_deleted == is_deleted)
     if has_attachments is not None:
         stmt = stmt.where(Email.has_attachments == has_attachments)
-    if q:
+    ranked = None
+    dialect = db.bind.dialect.name
+    match = build_match_query(q, dialect) if q else None
+    if match and await fts_ready(db):
+        if sort == "relevance":
+            if cursor is not None:
+                raise HTTPException(status_code=400, detail="按相关度排序不支持游标分页")
+            ranked = match_subquery(match, dialect, ranked=True).subquery()
+            stmt = stmt.join(ranked, ranked.c.email_id == Email.id)
+        else:
+            stmt = stmt.where(Email.id.in_(match_subquery(match, dialect)))
+    elif q:
         search_filter = or_(
             Email.subject.ilike(f"%{q}%"),
             Email.from_address.ilike(f"%{q}%"),
@@ -59,38 +160,133 @@ async def list_emails(
         )
         stmt = stmt.where(search_filter)
 
-    # 计算总数 (由于 join 可能会复杂，这里简化处理，或者分两步)
-    # 正规写法是 subquery count
-    count_stmt = select(func.count()).select_from(stmt.subquery())
-    total_result = await db.execute(count_stmt)
-    total = total_result.scalar() or 0
+    use_cursor = cursor is not None
+    if include_total is None:
+        include_total = not use_cursor
 
-    # 排序分页
-    stmt = stmt.order_by(desc(Email.received_at), desc(Email.created_at))
-    stmt = stmt.options(selectinload(Email.account))
-    stmt = stmt.offset((page - 1) * page_size).limit(page_size)
+    total = None
+    if include_total:
+        count_stmt = select(func.count()).select_from(stmt.subquery())
+        total = (await db.execute(count_stmt)).scalar() or 0
+
+    if ranked is not None:
+        stmt = stmt.order_by(ranked.c.rank, desc(Email.received_at), desc(Email.id))
+    else:
+        # 排序与索引一致 (received_at DESC, id DESC)，翻页时无需排序
+        stmt = stmt.order_by(desc(Email.received_at), desc(Email.id))
+    if use_cursor:
+        if cursor:
+            received_at, last_id = _decode_cursor(cursor)
+            stmt = stmt.where(or_(
+                Email.received_at < received_at,
+                and_(Email.received_at == received_at, Email.id < last_id),
+            ))
+        # 多取一条判断是否还有下一页
+        stmt = stmt.limit(page_size + 1)
+    else:
+        stmt = stmt.offset((page - 1) * page_size).limit(page_size)
 
     result = await db.execute(stmt)
     emails = result.scalars().all()
-    
-    data = []
-    for e in emails:
-        d = e.to_dict(include_body=False)
-        if e.account:
-            d['account_email'] = e.account.email_address
-            # 处理 Enum
-            d['account_provider'] = getattr(e.account.provider, 'value', str(e.account.provider))
-        data.append(d)
+    has_more = use_cursor and len(emails) > page_size
+    emails = emails[:page_size]
 
-    return {
-        "success": True,
-        "data": data,
-        "pagination": {
+    data = await _with_accounts(catalog, emails)
+
+    if use_cursor:
+        pagination = {
+            "page_size": page_size,
+            "next_cursor": _encode_cursor(emails[-1]) if has_more else None,
+            "has_more": has_more,
+            "total": total,
+        }
+    else:
+        pagination = {
             "page": page,
             "page_size": page_size,
             "total": total,
-            "total_pages": (total + page_size - 1) // page_size if page_size > 0 else 0
+            "total_pages": (total + page_size - 1) // page_size if total is not None else None,
         }
+
+    body = {
+        "success": True,
+        "data": data,
+        "pagination": pagination,
+    }
+    await cached.store(body)
+    return body
+
+
+def _recipient_criteria(address: str) -> list:
+    criteria = recipient_criteria(address)
+    if criteria is None:
+        raise HTTPException(status_code=400, detail="无效的邮件地址")
+    return criteria
+
+
+@router.get("/by-recipient", summary="按收件地址查询邮件")
+async def list_emails_by_recipient(
+    address: str = Query(..., max_length=255, description="收件地址；以 @ 开头时匹配该域名下的所有地址 (catch-all)"),
+    limit: int = Query(20, ge=1, le=100),
+    since: Optional[datetime] = Query(None, description="只返回该时间之后收到的邮件"),
+    db: AsyncSession = Depends(get_mail_read_db),
+    catalog: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    当前用户所有账户中发给该地址的最新邮件 (收件人 / 抄送 / 密送 / Delivered-To)
+    从 email_addresses 的地址索引按时间倒序读取并关联邮件，一次查询完成，不扫描 to_addresses；
+    按域名查询时同一封邮件发给该域名下多个地址只返回一次
+    """
+    stmt = (
+        select(Email)
+        .select_from(EmailAddress)
+        .join(Email, Email.id == EmailAddress.email_id)
+        .join(EmailAccount, Email.account_id == EmailAccount.id)
+        .where(EmailAccount.user_id == current_user.id)
+        .where(*_recipient_criteria(address))
+        .where(Email.is_deleted == False)
+    )
+    since = _naive_utc(since)
+    if since is not None:
+        stmt = stmt.where(EmailAddress.received_at > since)
+    # 按域名匹配时同一封邮件可能对应多行，多取一些再按 ID 去重 (scalars() 对同一封邮件返回同一个对象)
+    fetch = limit * 2 if address.startswith("@") else limit
+    stmt = stmt.order_by(desc(EmailAddress.received_at), desc(EmailAddress.email_id)).limit(fetch)
+    emails = list({e.id: e for e in (await db.execute(stmt)).scalars().all()}.values())[:limit]
+    return {"success": True, "data": await _with_accounts(catalog, emails)}
+
+
+@router.get("/by-recipient/latest-code", summary="按收件地址获取最新验证码")
+async def get_latest_code_by_recipient(
+    address: str = Query(..., max_length=255, description="收件地址；以 @ 开头时匹配该域名下的所有地址 (catch-all)"),
+    since: Optional[datetime] = Query(None, description="只查找该时间之后收到的邮件"),
+    db: AsyncSession = Depends(get_mail_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """当前用户所有账户中发给该地址的最新验证码 (只查询已同步的数据，需要先同步时使用账户的 latest-code)"""
+    stmt = (
+        select(VerificationCode)
+        .select_from(EmailAddress)
+        .join(VerificationCode, VerificationCode.email_id == EmailAddress.email_id)
+        .join(EmailAccount, VerificationCode.account_id == EmailAccount.id)
+        .where(EmailAccount.user_id == current_user.id)
+        .where(*_recipient_criteria(address))
+    )
+    since = _naive_utc(since)
+    if since is not None:
+        stmt = stmt.where(EmailAddress.received_at > since)
+    stmt = stmt.order_by(desc(EmailAddress.received_at), desc(EmailAddress.email_id)).limit(1)
+    code = (await db.execute(stmt)).scalars().first()
+    if code is None:
+        return {"success": False, "code": None}
+    return {
+        "success": True,
+        "code": code.code,
+        "email_subject": code.subject,
+        "received_at": code.received_at,
+        "account_id": code.account_id,
+        "email_id": code.email_id,
     }
 
 
@@ -101,55 +297,124 @@ async def clear_emails(
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """清空指定账户的收件箱或垃圾箱（仅删除数据库记录）"""
+    """
+    清空指定账户的收件箱或垃圾箱（仅删除数据库记录）
+    收件箱 -> 移入垃圾箱；垃圾箱 -> 彻底删除。由后台任务分批执行，立即返回任务，进度见 GET /jobs/{id}
+    """
     # 验证账户归属
     result = await db.execute(select(EmailAccount).where(EmailAccount.id == account_id, EmailAccount.user_id == current_user.id))
     if not result.scalars().first():
         raise HTTPException(status_code=404, detail="账户不存在")
-        
-    if is_trash:
-        # 清空垃圾箱：删除所有标记为 is_deleted=True 的邮件
-        stmt = delete(Email).where(Email.account_id == account_id, Email.is_deleted == True)
-        res = await db.execute(stmt)
-        count = res.rowcount
-        await db.commit()
-        return {"success": True, "message": f"已彻底清除 {count} 封垃圾邮件"}
-    else:
-        # 清空收件箱：将所有 is_deleted=False 的邮件标记为 is_deleted=True (移入垃圾箱)
-        # 或者直接删除？用户说“清空”，通常意味着不再显示。
-        # 如果是清空收件箱，应该移入垃圾箱？
-        # 用户说“清空所有的邮件”，可能想彻底删除。
-        # 但为了安全，先移入垃圾箱比较好？
-        # 可是如果用户想彻底清空，移入垃圾箱还得再清一次。
-        # 这里我做成：收件箱 -> 移入垃圾箱；垃圾箱 -> 彻底删除。
-        
-        # 将收件箱邮件标记为已删除
-        stmt = update(Email).where(Email.account_id == account_id, Email.is_deleted == False).values(is_deleted=True)
-        res = await db.execute(stmt)
-        count = res.rowcount
-        await db.commit()
-        return {"success": True, "message": f"已将 {count} 封邮件移入垃圾箱"}
 
-@router.get("/{email_id}", summary="获取邮件详情")
-async def get_email(
-    email_id: int,
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
-):
-    """获取单封邮件详情（包含正文）"""
+    kind = JobKind.CLEAR_TRASH if is_trash else JobKind.CLEAR_INBOX
+    job, _ = await enqueue_job(
+        db, kind.value, account_id, user_id=current_user.id, priority=JobPriority.MANUAL, source="manual"
+    )
+    message = "已开始清空垃圾箱" if is_trash else "已开始将邮件移入垃圾箱"
+    return {"success": True, "message": message, "data": job.to_dict()}
+
+async def _get_user_email(db: AsyncSession, email_id: int, user: User) -> Email:
+    """当前用户名下的邮件 (不存在时 404)"""
     stmt = (
         select(Email)
         .join(EmailAccount, Email.account_id == EmailAccount.id)
         .where(Email.id == email_id)
-        .where(EmailAccount.user_id == current_user.id)
+        .where(EmailAccount.user_id == user.id)
     )
-    
-    result = await db.execute(stmt)
-    email = result.scalar_one_or_none()
-    
+    email = (await db.execute(stmt)).scalar_one_or_none()
     if not email:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="邮件不存在"
         )
-    return {"success": True, "data": email.to_dict(include_body=True)}
+    return email
+
+
+def _content_disposition(filename: str) -> str:
+    return f"attachment; filename*=UTF-8''{quote(filename)}"
+
+
+@router.get("/{email_id}", summary="获取邮件详情")
+async def get_email(
+    email_id: int,
+    db: AsyncSession = Depends(get_mail_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取单封邮件详情（包含正文）
+    保存了原始邮件时返回原文中的完整正文与附件列表，否则返回入库时截断的正文
+    """
+    email = await _get_user_email(db, email_id, current_user)
+    await load_bodies(db, [email])
+    data = email.to_dict(include_body=True)
+    data["attachments"] = []
+    if email.raw_digest:
+        details = await asyncio.to_thread(raw_store.message_details, email.raw_digest)
+        if details is not None:
+            data.update(details)
+    return {"success": True, "data": data}
+
+
+@router.get("/{email_id}/raw", summary="下载原始邮件")
+async def download_raw_email(
+    email_id: int,
+    db: AsyncSession = Depends(get_mail_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """从原始邮件存储中流式返回 RFC822 原文 (.eml)"""
+    email = await _get_user_email(db, email_id, current_user)
+    size = await asyncio.to_thread(raw_store.raw_size, email.raw_digest) if email.raw_digest else None
+    if size is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="原始邮件不存在")
+    return StreamingResponse(
+        raw_store.iter_raw(email.raw_digest),
+        media_type="message/rfc822",
+        headers={"Content-Disposition": _content_disposition(f"{email.id}.eml"), "Content-Length": str(size)},
+    )
+
+
+@router.get("/{email_id}/attachments/{index}", summary="下载附件")
+async def download_attachment(
+    email_id: int,
+    index: int,
+    db: AsyncSession = Depends(get_mail_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """从原始邮件中取出第 index 个附件 (编号见邮件详情的 attachments)"""
+    email = await _get_user_email(db, email_id, current_user)
+    attachment = None
+    if email.raw_digest:
+        attachment = await asyncio.to_thread(raw_store.read_attachment, email.raw_digest, index)
+    if attachment is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="附件不存在")
+    filename, content_type, content = attachment
+    return Response(
+        content=content,
+        media_type=content_type,
+        headers={"Content-Disposition": _content_disposition(filename)},
+    )
+
+
+@router.patch("/{email_id}", summary="更新邮件状态")
+async def update_email(
+    email_id: int,
+    data: EmailUpdate,
+    db: AsyncSession = Depends(get_mail_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """标记已读 / 星标 / 移入或移出垃圾箱，同时更新文件夹与账户计数"""
+    email = await _get_user_email(db, email_id, current_user)
+
+    deltas = CounterDeltas()
+    deltas.add_email(email, sign=-1)
+    if data.is_read is not None:
+        email.is_read = data.is_read
+    if data.is_flagged is not None:
+        email.is_flagged = data.is_flagged
+    if data.is_deleted is not None:
+        email.is_deleted = data.is_deleted
+    deltas.add_email(email)
+    await deltas.apply(db)
+    await db.commit()
+    await response_cache.invalidate(current_user.id, email.account_id)
+    return {"success": True, "data": email.to_dict(include_body=False)}
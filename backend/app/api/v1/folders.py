@@ -2,25 +2,37 @@
 文件夹 API 路由
 """
 from typing import Optional
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request, Response, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
 from app.models.user import User
 from app.models.folder import Folder
 from app.models.email_account import EmailAccount
-from app.api.deps import get_current_active_user
+from app.api.deps import get_current_active_user, get_mail_read_db
+from app.services.response_cache import response_cache
 
 router = APIRouter()
 
 @router.get("/", summary="获取文件夹列表")
 async def list_folders(
+    request: Request,
+    response: Response,
     account_id: Optional[int] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_mail_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """获取当前用户的文件夹列表"""
+    """获取当前用户的文件夹列表 (响应按用户与 account_id 缓存，带 If-None-Match 且未变化时返回 304)"""
+    cached = await response_cache.lookup(
+        "folders", current_user.id, {"account_id": account_id},
+        account_id=account_id, if_none_match=request.headers.get("If-None-Match"),
+    )
+    if cached.not_modified:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cached.headers())
+    response.headers.update(cached.headers())
+    if cached.hit:
+        return cached.value
+
     # 基础查询：关联账户表，筛选属于当前用户的账户
     stmt = (
         select(Folder)
@@ -36,7 +48,7 @@ async def list_folders(
     result = await db.execute(stmt)
     folders = result.scalars().all()
     
-    return {
+    body = {
         "success": True,
         "data": [
             {
@@ -52,4 +64,6 @@ async def list_folders(
             }
             for f in folders
         ]
-    }
\ No newline at end of file
+    }
+    await cached.store(body)
+    return body
@@ -0,0 +1,54 @@
+"""
+后台任务 API 路由
+"""
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.models.user import User
+from app.models.job import Job
+from app.models.email_account import EmailAccount
+from app.api.deps import get_current_active_user
+
+router = APIRouter()
+
+
+def _owned_jobs(user: User):
+    """当前用户可见的任务：自己发起的或属于自己账户的"""
+    owned_accounts = select(EmailAccount.id).where(EmailAccount.user_id == user.id)
+    return select(Job).where(or_(Job.user_id == user.id, Job.account_id.in_(owned_accounts)))
+
+
+@router.get("/", summary="获取任务列表")
+async def list_jobs(
+    account_id: Optional[int] = Query(None),
+    status: Optional[str] = Query(None, description="pending / running / succeeded / failed"),
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """获取当前用户的后台任务 (最新的在前)"""
+    stmt = _owned_jobs(current_user)
+    if account_id:
+        stmt = stmt.where(Job.account_id == account_id)
+    if status:
+        stmt = stmt.where(Job.status == status)
+
+    result = await db.execute(stmt.order_by(Job.id.desc()).limit(limit))
+    return {"success": True, "data": [job.to_dict() for job in result.scalars().all()]}
+
+
+@router.get("/{job_id}", summary="获取任务状态")
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """查询单个任务的状态与结果"""
+    result = await db.execute(_owned_jobs(current_user).where(Job.id == job_id))
+    job = result.scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return {"success": True, "data": job.to_dict()}
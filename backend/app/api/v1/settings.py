@@ -8,6 +8,8 @@ from app.core.database import get_db
 from app.models.setting import SystemSetting
 from app.models.user import User
 from app.api.deps import get_current_active_superuser
+from app.services.code_extractor import parse_code_rules
+from app.services.verification_codes import CODE_RULES_KEY
 
 router = APIRouter()
 
@@ -32,6 +34,13 @@ async def update_setting(
     setting = res.scalar_one_or_none()
     
     val = payload.value or ""
+
+    # 自定义验证码规则：保存前校验格式与正则
+    if key == CODE_RULES_KEY:
+        try:
+            parse_code_rules(val)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"验证码规则格式错误: {e}")
     
     if not setting:
         setting = SystemSetting(key=key, value=val)
@@ -9,7 +9,10 @@ from sqlalchemy import select, func
 
 from app.core.database import get_db
 from app.core.security import get_password_hash
+from app.core.shards import shard_router, sharding_enabled
+from app.models.email_account import EmailAccount
 from app.models.user import User
+from app.services.job_queue import close_account_jobs
 from app.api.deps import get_current_user, get_current_active_user # 从 deps 引入
 
 router = APIRouter()
@@ -215,8 +218,13 @@ async def delete_user(
             detail="用户不存在"
         )
     
+    # 用户的账户随用户级联删除：先结束这些账户的活动任务 (置空 account_id 后不与全局任务冲突)
+    await close_account_jobs(db, select(EmailAccount.id).where(EmailAccount.user_id == user_id))
     await db.delete(user)
     await db.commit()
+    # 按用户分库时邮件数据随分库文件一起删除
+    if sharding_enabled():
+        await shard_router.drop(user_id)
     
     return {
         "success": True,
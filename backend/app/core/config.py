@@ -25,6 +25,26 @@ class Settings(BaseSettings):
         default="sqlite+aiosqlite:///./data/mailbox_v2.db",
         alias="DATABASE_URL"
     )
+    # 启动时自动执行数据库迁移 (关闭后需手动执行: python -m app.migrate)
+    db_auto_migrate: bool = Field(default=True, alias="DB_AUTO_MIGRATE")
+    # 连接池 (仅 PostgreSQL 生效；每个进程各自一个连接池)
+    db_pool_size: int = Field(default=10, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=20, alias="DB_MAX_OVERFLOW")
+    db_pool_timeout: int = Field(default=30, alias="DB_POOL_TIMEOUT")
+    # 每个连接缓存的预编译语句数，经 PgBouncer (事务模式) 连接时设为 0
+    db_statement_cache_size: int = Field(default=100, alias="DB_STATEMENT_CACHE_SIZE")
+    # 只读查询使用的数据库 (如 PostgreSQL 只读副本)；为空时 SQLite 使用单独的只读连接池，其他数据库与写入共用连接池
+    database_read_url: Optional[str] = Field(default=None, alias="DATABASE_READ_URL")
+    # SQLite 连接参数 (每个连接建立时设置)：等锁超时、每个连接的页缓存、内存映射读取大小
+    sqlite_busy_timeout_ms: int = Field(default=30000, alias="SQLITE_BUSY_TIMEOUT_MS")
+    sqlite_cache_size_kb: int = Field(default=32768, alias="SQLITE_CACHE_SIZE_KB")
+    sqlite_mmap_size_mb: int = Field(default=256, alias="SQLITE_MMAP_SIZE_MB")
+    # 按用户分库 (仅 SQLite)：每个用户的文件夹、邮件、正文、验证码保存在 MAIL_SHARD_DIR/user_<id>.db，
+    # 主库只保留用户、账户、任务等；不同用户的同步写入互不等锁 (见 app/core/shards.py)
+    mail_shards_enabled: bool = Field(default=False, alias="MAIL_SHARDS_ENABLED")
+    mail_shard_dir: str = Field(default="./data/shards", alias="MAIL_SHARD_DIR")
+    # 每个进程同时打开的分库数 (LRU，超出时关闭最久未用且空闲的分库连接)
+    mail_shard_open_max: int = Field(default=64, alias="MAIL_SHARD_OPEN_MAX")
     
     # 安全配置
     secret_key: str = Field(default="change-me-in-production", alias="SECRET_KEY")
@@ -55,23 +75,107 @@ class Settings(BaseSettings):
     # Redis 配置（可选）
     redis_url: str = Field(default="redis://localhost:6379/0", alias="REDIS_URL")
     redis_enabled: bool = Field(default=False, alias="REDIS_ENABLED")
+    # API 进程数 (Gunicorn / Uvicorn 也从该变量读取默认的 worker 数)
+    web_concurrency: int = Field(default=1, alias="WEB_CONCURRENCY")
+    # 列表接口 (邮件 / 文件夹 / 账户) 响应缓存：默认在进程内，REDIS_ENABLED 时放在 Redis 中 (见 app/services/response_cache.py)
+    # 进程内缓存只在单个 API 进程内有效：WEB_CONCURRENCY > 1 且未启用 Redis 时不缓存响应、不带 ETag；
+    # 独立 Worker 且未启用 Redis 时，Worker 的修改最多延迟 TTL 秒可见
+    response_cache_enabled: bool = Field(default=True, alias="RESPONSE_CACHE_ENABLED")
+    response_cache_ttl_seconds: int = Field(default=30, alias="RESPONSE_CACHE_TTL_SECONDS")
+    response_cache_max_entries: int = Field(default=2000, alias="RESPONSE_CACHE_MAX_ENTRIES")
     
     # 邮件处理配置
     max_email_size: str = Field(default="50MB", alias="MAX_EMAIL_SIZE")
     email_batch_size: int = Field(default=50, alias="EMAIL_BATCH_SIZE")
     fetch_interval_minutes: int = Field(default=5, alias="FETCH_INTERVAL_MINUTES")
-    
+    sync_max_concurrency: int = Field(default=4, alias="SYNC_MAX_CONCURRENCY")
+    # 合并写入：同步结果由进程内的写入任务按时间窗口 / 行数合并成一个事务提交 (见 app/services/write_coalescer.py)
+    write_coalesce_enabled: bool = Field(default=True, alias="WRITE_COALESCE_ENABLED")
+    write_coalesce_window_ms: int = Field(default=10, alias="WRITE_COALESCE_WINDOW_MS")
+    write_coalesce_max_rows: int = Field(default=500, alias="WRITE_COALESCE_MAX_ROWS")
+    # 邮件正文压缩算法: zlib / zstd (需安装 zstandard) / none；只影响新写入的正文
+    email_body_compression: str = Field(default="zlib", alias="EMAIL_BODY_COMPRESSION")
+    email_body_compression_level: int = Field(default=6, alias="EMAIL_BODY_COMPRESSION_LEVEL")
+    # 原始邮件存储：RFC822 原文按 SHA-256 去重保存在磁盘，邮件详情 / 附件下载直接读取 (目前只有 IMAP 同步写入)
+    raw_store_enabled: bool = Field(default=False, alias="RAW_STORE_ENABLED")
+    raw_store_dir: str = Field(default="./data/raw", alias="RAW_STORE_DIR")
+    # 清理已没有邮件引用的原文的间隔 (秒)，0 表示不清理
+    raw_store_gc_interval_seconds: int = Field(default=86400, alias="RAW_STORE_GC_INTERVAL_SECONDS")
+
+    # 同步进程配置：内嵌调度器执行排队任务 (手动同步、清空、删除账户等)，并定时同步所有启用同步的账户、放入维护任务
+    # 使用独立 Worker (python -m app.worker) 或 WEB_CONCURRENCY > 1 时，将 SYNC_EMBEDDED_SCHEDULER 设为 false
+    sync_embedded_scheduler: bool = Field(default=True, alias="SYNC_EMBEDDED_SCHEDULER")
+    sync_worker_processes: int = Field(default=2, alias="SYNC_WORKER_PROCESSES")
+    sync_drain_timeout_seconds: int = Field(default=60, alias="SYNC_DRAIN_TIMEOUT_SECONDS")
+
+    # 后台任务队列配置
+    job_poll_interval_seconds: float = Field(default=1.0, alias="JOB_POLL_INTERVAL_SECONDS")
+    job_lock_seconds: int = Field(default=120, alias="JOB_LOCK_SECONDS")
+    job_max_attempts: int = Field(default=3, alias="JOB_MAX_ATTEMPTS")
+    job_retention_hours: int = Field(default=72, alias="JOB_RETENTION_HOURS")
+    # 文件夹 / 账户计数器对账间隔 (秒)，0 表示不对账
+    counter_reconcile_interval_seconds: int = Field(default=3600, alias="COUNTER_RECONCILE_INTERVAL_SECONDS")
+    # 邮件保留策略 (全局默认，账户可单独设置)：保留最近 N 天 / 每个文件夹最近 N 封，0 表示不限制
+    # 两种策略都至少保留每个文件夹最新的 RETENTION_MIN_KEEP 封 (见 app/services/maintenance.py)
+    retention_days: int = Field(default=0, alias="RETENTION_DAYS")
+    retention_max_per_folder: int = Field(default=0, alias="RETENTION_MAX_PER_FOLDER")
+    # 保留策略与空间回收任务 (incremental_vacuum + ANALYZE) 的间隔 (秒)，0 表示不执行
+    retention_interval_seconds: int = Field(default=3600, alias="RETENTION_INTERVAL_SECONDS")
+    # 维护任务 (保留策略、清空邮件、删除账户) 每批处理的邮件数；占用写事务的时间比例上限 (每批之后休眠，留出时间给同步与 API)
+    retention_batch_size: int = Field(default=500, alias="RETENTION_BATCH_SIZE")
+    maintenance_duty_cycle: float = Field(default=0.2, alias="MAINTENANCE_DUTY_CYCLE")
+
+    # 查询验证码时触发快速同步 (数据比 FRESH 秒更旧时同步，最多等待 TIMEOUT 秒)
+    code_lookup_fresh_seconds: int = Field(default=5, alias="CODE_LOOKUP_FRESH_SECONDS")
+    code_lookup_sync_timeout_seconds: float = Field(default=10, alias="CODE_LOOKUP_SYNC_TIMEOUT_SECONDS")
+    # 验证码长轮询 (wait > 0) 时重新查询数据库的间隔，用于收不到进程内事件的独立 Worker 部署
+    code_wait_recheck_seconds: float = Field(default=5, alias="CODE_WAIT_RECHECK_SECONDS")
+
+    # 多 worker / 多节点租约配置
+    sync_leases_enabled: bool = Field(default=True, alias="SYNC_LEASES_ENABLED")
+    sync_lease_ttl_seconds: int = Field(default=60, alias="SYNC_LEASE_TTL_SECONDS")
+    sync_lease_batch_size: int = Field(default=500, alias="SYNC_LEASE_BATCH_SIZE")
+
+    # 同步限流配置 (令牌桶: 每秒速率 / 突发容量 / 并发上限，0 表示不限制)
+    rate_limit_enabled: bool = Field(default=True, alias="RATE_LIMIT_ENABLED")
+    rate_limit_provider_rate: float = Field(default=2.0, alias="RATE_LIMIT_PROVIDER_RATE")
+    rate_limit_provider_burst: int = Field(default=10, alias="RATE_LIMIT_PROVIDER_BURST")
+    rate_limit_provider_concurrency: int = Field(default=8, alias="RATE_LIMIT_PROVIDER_CONCURRENCY")
+    rate_limit_imap_host_rate: float = Field(default=1.0, alias="RATE_LIMIT_IMAP_HOST_RATE")
+    rate_limit_imap_host_burst: int = Field(default=5, alias="RATE_LIMIT_IMAP_HOST_BURST")
+    rate_limit_imap_host_concurrency: int = Field(default=4, alias="RATE_LIMIT_IMAP_HOST_CONCURRENCY")
+    rate_limit_proxy_rate: float = Field(default=1.0, alias="RATE_LIMIT_PROXY_RATE")
+    rate_limit_proxy_burst: int = Field(default=5, alias="RATE_LIMIT_PROXY_BURST")
+    rate_limit_proxy_concurrency: int = Field(default=4, alias="RATE_LIMIT_PROXY_CONCURRENCY")
+    # 针对单个 key 的覆盖，JSON 格式，例如 {"provider:microsoft": {"rate": 1, "burst": 5, "concurrency": 2}}
+    rate_limit_overrides: dict[str, dict] = Field(default_factory=dict, alias="RATE_LIMIT_OVERRIDES")
+    rate_limit_throttle_backoff_seconds: int = Field(default=60, alias="RATE_LIMIT_THROTTLE_BACKOFF_SECONDS")
+    rate_limit_throttle_max_backoff_seconds: int = Field(default=900, alias="RATE_LIMIT_THROTTLE_MAX_BACKOFF_SECONDS")
+    # 以上为所有同步进程合计的上限，按进程数平分给每个进程；0 表示按本机进程数 (Worker 的 --processes 或 WEB_CONCURRENCY)，
+    # 多个节点同时运行 Worker 时设为所有节点的同步进程总数
+    rate_limit_processes: int = Field(default=0, alias="RATE_LIMIT_PROCESSES")
+
     # 日志配置
     log_level: str = Field(default="INFO", alias="LOG_LEVEL")
     log_format: str = Field(default="json", alias="LOG_FORMAT")
     
-    @property
-    def async_database_url(self) -> str:
-        """获取异步数据库URL"""
-        url = self.database_url
+    @staticmethod
+    def _async_url(url: str) -> str:
         if url.startswith("sqlite://") and "aiosqlite" not in url:
             url = url.replace("sqlite://", "sqlite+aiosqlite://")
+        elif url.startswith(("postgres://", "postgresql://")):
+            url = "postgresql+asyncpg://" + url.split("://", 1)[1]
         return url
+
+    @property
+    def async_database_url(self) -> str:
+        """获取异步数据库URL"""
+        return self._async_url(self.database_url)
+
+    @property
+    def async_database_read_url(self) -> Optional[str]:
+        """只读数据库的异步 URL (未配置时为 None)"""
+        return self._async_url(self.database_read_url) if self.database_read_url else None
     
     @property
     def is_production(self) -> bool:
@@ -9,6 +9,8 @@ MAX_TO_ADDRESSES_LENGTH = 1000
 MAX_BODY_TEXT_LENGTH = 5000
 MAX_BODY_HTML_LENGTH = 10000
 MAX_FROM_NAME_LENGTH = 100
+# 邮件列表的正文摘要长度 (emails.snippet)
+SNIPPET_LENGTH = 200
 
 # IMAP 配置
 IMAP_DEFAULT_PORT = 993
@@ -1,7 +1,9 @@
 """
 数据库模块 - SQLAlchemy 配置和连接管理
 """
-from typing import AsyncGenerator
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator, Dict, Optional
 
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
@@ -9,18 +11,82 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine
 )
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import text, select
+from sqlalchemy import text, select, event
+from sqlalchemy.dialects import postgresql, sqlite
 
 from app.core.config import settings
 
-# 创建异步引擎
-engine = create_async_engine(
-    settings.async_database_url,
-    echo=settings.debug,  # 调试模式下显示SQL语句
-    future=True,
-    pool_pre_ping=True,  # 连接池健康检查
-    pool_recycle=3600,   # 连接回收时间
-)
+
+def _engine_options(url: str) -> dict:
+    """引擎参数：PostgreSQL 等服务端数据库使用可配置的连接池"""
+    options = dict(
+        echo=settings.debug,  # 调试模式下显示SQL语句
+        future=True,
+        pool_pre_ping=True,  # 连接池健康检查
+        pool_recycle=3600,   # 连接回收时间
+    )
+    if url.startswith("postgresql"):
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            connect_args={
+                # SQLAlchemy 适配层与 asyncpg 各自的预编译语句缓存 (经 PgBouncer 事务模式连接时都需为 0)
+                "prepared_statement_cache_size": settings.db_statement_cache_size,
+                "statement_cache_size": settings.db_statement_cache_size,
+            },
+        )
+    return options
+
+
+def _sqlite_pragmas(read_only: bool):
+    """
+    SQLite 的连接参数大多只对当前连接生效，需在每个连接建立时设置：
+    - foreign_keys: 删除账户 / 文件夹时依赖 ON DELETE CASCADE
+    - busy_timeout: 遇到其他连接 (其他进程) 的写锁时等待而不是立即报 database is locked
+    - synchronous=NORMAL: WAL 模式下只在检查点时 fsync
+    - cache_size / mmap_size / temp_store: 页缓存、内存映射读取、临时表 (排序) 放内存
+    只读连接额外开启 query_only，误写入时直接报错
+    """
+    pragmas = [
+        "PRAGMA foreign_keys=ON",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA cache_size=-{settings.sqlite_cache_size_kb}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size_mb * 1024 * 1024}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+    return on_connect
+
+
+def _create_engine(url: str, read_only: bool = False, **options):
+    new_engine = create_async_engine(url, **{**_engine_options(url), **options})
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", _sqlite_pragmas(read_only))
+    return new_engine
+
+
+# 创建异步引擎 (读写)
+engine = _create_engine(settings.async_database_url)
+
+# 只读引擎：API 的列表 / 详情查询使用，不占用写连接
+# - 配置了 DATABASE_READ_URL (如 PostgreSQL 只读副本) 时连接该数据库
+# - SQLite 使用单独的只读连接池 (WAL 模式下读不阻塞写)
+# - 其他情况与读写引擎共用
+if settings.async_database_read_url:
+    read_engine = _create_engine(settings.async_database_read_url, read_only=True)
+elif engine.dialect.name == "sqlite":
+    read_engine = _create_engine(settings.async_database_url, read_only=True)
+else:
+    read_engine = engine
 
 # 异步会话工厂
 AsyncSessionLocal = async_sessionmaker(
@@ -30,46 +96,78 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False,
     autocommit=False,
 )
+ReadSessionLocal = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False,
+    autocommit=False,
+)
+
+# SQLite 同一时间只允许一个写事务：本进程内的同步写入按数据库文件排队 (见 serialized_write)
+_write_locks: Dict[Optional[str], asyncio.Lock] = {}
+
+
+@asynccontextmanager
+async def serialized_write(key: Optional[str] = None) -> AsyncIterator[None]:
+    """
+    同步入库等批量写入在本进程内串行执行 (仅 SQLite)
+    写事务在 asyncio 中排队，不会占着线程在 busy_timeout 里空等，也不会互相等到超时报 database is locked；
+    其他进程的写入仍由 busy_timeout 处理。PostgreSQL 支持行级并发写入，不加锁
+    key: 写入的数据库 (None 为主库，按用户分库时为分库标识)，不同数据库的写入互不排队
+    """
+    if engine.dialect.name != "sqlite":
+        yield
+        return
+    lock = _write_locks.get(key)
+    if lock is None:
+        lock = _write_locks[key] = asyncio.Lock()
+    async with lock:
+        yield
+
 
 # 声明性基类
 Base = declarative_base()
 
 
+def dialect_insert(entity):
+    """
+    当前数据库的 INSERT 语句 (SQLite / PostgreSQL 均支持 on_conflict_do_nothing / on_conflict_do_update)
+    """
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert(entity)
+    return sqlite.insert(entity)
+
+
 async def init_db():
-    """初始化数据库 - 创建所有表 + 预置管理员账号"""
+    """初始化数据库 - 创建所有表 + 执行迁移 + 预置管理员账号"""
     # 必须在此导入所有模型，确保 Base.metadata 能识别到它们
     from app.models.user import User
     from app.models.email_account import EmailAccount
     from app.models.email import Email
+    from app.models.email_body import EmailBody
+    from app.models.email_address import EmailAddress
     from app.models.folder import Folder
     from app.models.setting import SystemSetting
+    from app.models.sync_lease import SyncLease, SyncWorker
+    from app.models.job import Job
+    from app.models.verification_code import VerificationCode
     from app.core.security import get_password_hash
 
     async with engine.begin() as conn:
-        # 开启 WAL 模式 (Write-Ahead Logging) 以提升并发性能
-        try:
+        # SQLite 开启 WAL 模式 (Write-Ahead Logging)，读写互不阻塞 (写入数据库文件，只需设置一次)
+        if engine.dialect.name == "sqlite":
+            # 新建的数据库使用增量回收，删除邮件后由维护任务 incremental_vacuum 缩小文件 (已有表的数据库上不生效)
+            await conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
             await conn.execute(text("PRAGMA journal_mode=WAL"))
-            await conn.execute(text("PRAGMA synchronous=NORMAL"))
-        except Exception:
-            pass
 
         # 创建所有表
         await conn.run_sync(Base.metadata.create_all)
-        
-        # 针对旧数据库的手动迁移 (如果存在的话)
-        try:
-            result = await conn.execute(text("PRAGMA table_info(users)"))
-            cols = [row[1] for row in result.fetchall()]
-            if "must_change_password" not in cols:
-                await conn.execute(text("ALTER TABLE users ADD COLUMN must_change_password BOOLEAN DEFAULT 0"))
-
-            # 检查 email_accounts 表
-            result = await conn.execute(text("PRAGMA table_info(email_accounts)"))
-            cols = [row[1] for row in result.fetchall()]
-            if "proxy_url" not in cols:
-                await conn.execute(text("ALTER TABLE email_accounts ADD COLUMN proxy_url VARCHAR(255)"))
-        except Exception:
-            pass
+
+    # 版本化迁移：补齐旧数据库缺少的列和索引
+    if settings.db_auto_migrate:
+        from app.core.migrations import run_migrations
+        await run_migrations(engine)
 
     # 预置管理员账号
     async with AsyncSessionLocal() as session:
@@ -105,8 +203,23 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    依赖注入用的只读数据库会话 (只执行查询的接口使用)
+    """
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
 async def close_db():
-    """关闭数据库连接"""
+    """关闭数据库连接 (包括已打开的分库)"""
+    from app.core.shards import shard_router
+    await shard_router.close()
+    if read_engine is not engine:
+        await read_engine.dispose()
     await engine.dispose()
 
 
@@ -0,0 +1,353 @@
+"""
+数据库迁移 - 按版本号顺序执行，已执行的版本记录在 schema_migrations 表
+
+新建数据库由 create_all 建好全部表和索引，迁移中的语句需要可重复执行 (IF NOT EXISTS / 先检查再修改)；
+已有数据库启动时 (或 python -m app.migrate) 补齐缺少的列、索引与数据修正。
+
+新增迁移：在本文件末尾用 @migration(版本号, 名称) 注册一个 async 函数，版本号只增不改。
+迁移需同时兼容 SQLite 与 PostgreSQL，只适用于其中一种数据库的语句按 conn.dialect.name 判断。
+按用户分库 (app/core/shards.py) 时分库也记录迁移版本：只修改邮件相关表的迁移注册为 shards=True，
+在分库上同样执行；其他迁移在分库上只记录为已执行。
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import DateTime, inspect, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+MigrationFunc = Callable[[AsyncConnection], Awaitable[None]]
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    upgrade: MigrationFunc
+    shards: bool = False
+
+
+MIGRATIONS: Dict[int, Migration] = {}
+
+
+def migration(version: int, name: str, shards: bool = False):
+    """注册迁移 (shards=True 表示同样在按用户分库的邮件库上执行)"""
+    def decorator(func: MigrationFunc) -> MigrationFunc:
+        if version in MIGRATIONS:
+            raise ValueError(f"迁移版本重复: {version}")
+        MIGRATIONS[version] = Migration(version, name, func, shards)
+        return func
+    return decorator
+
+
+async def _ensure_version_table(conn: AsyncConnection):
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "name VARCHAR(100) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+async def applied_versions(engine: AsyncEngine) -> Dict[int, datetime]:
+    """已执行的迁移 {版本号: 执行时间}"""
+    async with engine.begin() as conn:
+        await _ensure_version_table(conn)
+        result = await conn.execute(text("SELECT version, applied_at FROM schema_migrations"))
+        return {row[0]: row[1] for row in result.fetchall()}
+
+
+async def run_migrations(engine: AsyncEngine, target: Optional[int] = None, shard: bool = False) -> List[int]:
+    """
+    执行尚未执行的迁移 (每个迁移一个事务)
+    target: 只执行到该版本；shard: engine 为按用户分库的邮件库；返回本次执行的版本号
+    """
+    done = await applied_versions(engine)
+    executed = []
+    for version in sorted(MIGRATIONS):
+        if target is not None and version > target:
+            break
+        if version in done:
+            continue
+        item = MIGRATIONS[version]
+        apply = item.shards or not shard
+        if apply:
+            logger.info(f"Applying migration {version}: {item.name}")
+        try:
+            async with engine.begin() as conn:
+                if apply:
+                    await item.upgrade(conn)
+                await conn.execute(
+                    text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": version, "n": item.name, "t": datetime.utcnow()},
+                )
+        except IntegrityError:
+            # 其他进程同时执行了同一迁移 (迁移本身可重复执行)
+            logger.info(f"Migration {version} already applied by another process")
+            continue
+        executed.append(version)
+    return executed
+
+
+async def _columns(conn: AsyncConnection, table: str) -> List[str]:
+    return await conn.run_sync(lambda sync_conn: [c["name"] for c in inspect(sync_conn).get_columns(table)])
+
+
+async def _add_column_if_missing(conn: AsyncConnection, table: str, column: str, ddl: str):
+    if column not in await _columns(conn, table):
+        await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+# ==========================================
+# 迁移列表
+# ==========================================
+
+@migration(1, "legacy_columns")
+async def _legacy_columns(conn: AsyncConnection):
+    """旧版本数据库缺少的列 (原 init_db 中的手动 ALTER)"""
+    await _add_column_if_missing(conn, "users", "must_change_password", "BOOLEAN DEFAULT FALSE")
+    await _add_column_if_missing(conn, "email_accounts", "proxy_url", "VARCHAR(255)")
+
+
+@migration(2, "hot_query_indexes")
+async def _hot_query_indexes(conn: AsyncConnection):
+    """
+    热点查询的复合索引
+    - 邮件列表 (account_id, is_deleted, received_at DESC)
+    - 文件夹内邮件 (account_id, folder_id, received_at)
+    - 同步去重 (account_id, message_id) 唯一：建索引前删除重复邮件，保留最早写入的一封
+    - 按路径查找文件夹 folders(account_id, path)
+    """
+    result = await conn.execute(text(
+        "DELETE FROM emails WHERE message_id IS NOT NULL AND id NOT IN ("
+        "SELECT MIN(id) FROM emails WHERE message_id IS NOT NULL GROUP BY account_id, message_id)"
+    ))
+    if result.rowcount:
+        logger.info(f"Removed {result.rowcount} duplicate emails before adding unique index")
+
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_emails_account_deleted_received "
+        "ON emails (account_id, is_deleted, received_at DESC)"
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_emails_account_folder_received "
+        "ON emails (account_id, folder_id, received_at)"
+    ))
+    await conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_emails_account_message "
+        "ON emails (account_id, message_id)"
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_folders_account_path ON folders (account_id, path)"
+    ))
+    # 让查询规划器拿到新索引的统计信息
+    await conn.execute(text("ANALYZE"))
+
+
+@migration(3, "email_keyset_indexes")
+async def _email_keyset_indexes(conn: AsyncConnection):
+    """
+    邮件列表游标分页 ORDER BY received_at DESC, id DESC
+    - 索引带上 id，翻页时无需排序
+    - received_at 为空的旧邮件用 sent_at / created_at 补齐 (游标不处理 NULL)
+    """
+    await conn.execute(text(
+        "UPDATE emails SET received_at = COALESCE(sent_at, created_at) WHERE received_at IS NULL"
+    ))
+    await conn.execute(text("DROP INDEX IF EXISTS ix_emails_account_deleted_received"))
+    await conn.execute(text(
+        "CREATE INDEX ix_emails_account_deleted_received "
+        "ON emails (account_id, is_deleted, received_at DESC, id DESC)"
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_emails_deleted_received "
+        "ON emails (is_deleted, received_at DESC, id DESC)"
+    ))
+    await conn.execute(text("ANALYZE"))
+
+
+@migration(4, "email_fts", shards=True)
+async def _email_fts(conn: AsyncConnection):
+    """
+    邮件全文索引 (SQLite FTS5，见 app/services/search.py)
+    rowid = emails.id；写入由同步流程负责 (需要对中日韩文字预分词)，删除由触发器同步
+    其他数据库或 SQLite 未编译 FTS5 时跳过，搜索继续使用 LIKE
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    try:
+        await conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5("
+            "subject, sender, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+    except OperationalError as e:
+        logger.warning(f"FTS5 unavailable, full-text search disabled: {e}")
+        return
+    await conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS emails_fts_delete AFTER DELETE ON emails BEGIN "
+        "DELETE FROM emails_fts WHERE rowid = old.id; END"
+    ))
+
+
+@migration(5, "email_search_tsvector")
+async def _email_search_tsvector(conn: AsyncConnection):
+    """
+    PostgreSQL 的邮件全文索引 (对应 SQLite 的 emails_fts，见 app/services/search.py)
+    email_search.document 为加权 tsvector (主题 A / 发件人 B / 正文 D)，GIN 索引；删除邮件时级联删除
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS email_search ("
+        "email_id INTEGER PRIMARY KEY REFERENCES emails (id) ON DELETE CASCADE, "
+        "document TSVECTOR NOT NULL)"
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_email_search_document ON email_search USING GIN (document)"
+    ))
+
+
+@migration(6, "email_bodies")
+async def _email_bodies(conn: AsyncConnection):
+    """
+    邮件正文拆分到 email_bodies 表并压缩存储 (见 app/services/email_bodies.py)
+    按 id 分批把 emails.body_text / body_html 压缩写入新表，然后删除 emails 上的两列
+    迁移不会缩小 SQLite 数据库文件 (迁移期间还会增大)，迁移完成后停机执行一次 VACUUM 回收空间
+    """
+    from app.models.email_body import EmailBody
+    from app.services.email_bodies import body_row, current_codec
+
+    await conn.run_sync(lambda sync_conn: EmailBody.__table__.create(sync_conn, checkfirst=True))
+    columns = await _columns(conn, "emails")
+    if "body_text" not in columns or "body_html" not in columns:
+        return
+
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(EmailBody).on_conflict_do_nothing(index_elements=[EmailBody.email_id])
+    codec = current_codec()
+    cursor = 0
+    moved = 0
+    while True:
+        result = await conn.execute(
+            text(
+                "SELECT id, body_text, body_html FROM emails WHERE id > :cursor "
+                "AND (body_text IS NOT NULL OR body_html IS NOT NULL) ORDER BY id LIMIT 1000"
+            ),
+            {"cursor": cursor},
+        )
+        batch = result.fetchall()
+        if not batch:
+            break
+        rows = [row for row in (body_row(*item, codec=codec) for item in batch) if row]
+        if rows:
+            await conn.execute(stmt, rows)
+        cursor = batch[-1][0]
+        moved += len(rows)
+    logger.info(f"Moved {moved} email bodies to email_bodies ({codec})")
+
+    try:
+        await conn.execute(text("ALTER TABLE emails DROP COLUMN body_text"))
+        await conn.execute(text("ALTER TABLE emails DROP COLUMN body_html"))
+    except OperationalError:
+        # SQLite 3.35 以前不支持 DROP COLUMN：保留列但清空 (模型不再读写这两列)
+        await conn.execute(text("UPDATE emails SET body_text = NULL, body_html = NULL"))
+
+
+@migration(7, "email_raw_digest")
+async def _email_raw_digest(conn: AsyncConnection):
+    """emails.raw_digest：RFC822 原文在磁盘存储中的摘要 (见 app/services/raw_store.py)，清理任务按索引查引用"""
+    await _add_column_if_missing(conn, "emails", "raw_digest", "VARCHAR(64)")
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_emails_raw_digest ON emails (raw_digest)"))
+
+
+@migration(8, "account_retention")
+async def _account_retention(conn: AsyncConnection):
+    """账户级保留策略 email_accounts.retention_days / retention_max_per_folder (为空时使用全局配置)"""
+    await _add_column_if_missing(conn, "email_accounts", "retention_days", "INTEGER")
+    await _add_column_if_missing(conn, "email_accounts", "retention_max_per_folder", "INTEGER")
+
+
+@migration(9, "account_status_deleting")
+async def _account_status_deleting(conn: AsyncConnection):
+    """AccountStatus.DELETING：SQLite 的枚举列是 VARCHAR，无需修改；PostgreSQL 需给枚举类型加值"""
+    if conn.dialect.name != "postgresql":
+        return
+    await conn.execute(text("ALTER TYPE accountstatus ADD VALUE IF NOT EXISTS 'DELETING'"))
+
+
+@migration(10, "email_addresses", shards=True)
+async def _email_addresses(conn: AsyncConnection):
+    """
+    邮件地址索引 email_addresses (见 app/services/email_addresses.py)
+    按 id 分批解析已有邮件的发件人 / 收件人头部写入新表 (Delivered-To 没有保存，历史邮件只有头部中的地址)
+    """
+    from app.models.email_address import EmailAddress
+    from app.services.email_addresses import address_rows
+
+    await conn.run_sync(lambda sync_conn: EmailAddress.__table__.create(sync_conn, checkfirst=True))
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(EmailAddress).on_conflict_do_nothing()
+    cursor = 0
+    parsed = 0
+    while True:
+        result = await conn.execute(
+            text(
+                "SELECT id, received_at, from_address, to_addresses, cc_addresses, bcc_addresses, reply_to FROM emails "
+                "WHERE id > :cursor ORDER BY id LIMIT 1000"
+            ).columns(received_at=DateTime),
+            {"cursor": cursor},
+        )
+        batch = result.fetchall()
+        if not batch:
+            break
+        rows = []
+        for email_id, received_at, from_address, to_addresses, cc_addresses, bcc_addresses, reply_to in batch:
+            rows.extend(address_rows(email_id, received_at, {
+                "from": from_address, "to": to_addresses, "cc": cc_addresses, "bcc": bcc_addresses, "reply_to": reply_to,
+            }))
+        if rows:
+            await conn.execute(stmt, rows)
+        cursor = batch[-1][0]
+        parsed += len(batch)
+    logger.info(f"Indexed addresses of {parsed} emails")
+
+
+@migration(11, "email_plain_text", shards=True)
+async def _email_plain_text(conn: AsyncConnection):
+    """
+    emails.snippet 列表摘要 与 email_bodies.plain_data 压缩的纯文本 (见 app/services/plain_text.py)
+    历史邮件由后台回填任务 (JobKind.BACKFILL_TEXT) 生成，回填完成前这些邮件的摘要为空
+    """
+    await _add_column_if_missing(conn, "emails", "snippet", "VARCHAR(255)")
+    blob = "BYTEA" if conn.dialect.name == "postgresql" else "BLOB"
+    await _add_column_if_missing(conn, "email_bodies", "plain_data", blob)
+
+
+@migration(12, "job_claim_filters")
+async def _job_claim_filters(conn: AsyncConnection):
+    """
+    jobs.not_before：账户限流冷却中的任务延后到该时间之后再认领
+    uq_jobs_active_account 改为 (kind, COALESCE(account_id, 0))：原索引中 account_id 为 NULL 的全局任务互不冲突，
+    重建前先结束重复的活动全局任务 (每种类型保留最早的一个)
+    """
+    await _add_column_if_missing(conn, "jobs", "not_before", "TIMESTAMP")
+    await conn.execute(text(
+        "UPDATE jobs SET status = 'failed', error = '重复的全局任务', lock_expires_at = NULL "
+        "WHERE account_id IS NULL AND status IN ('pending', 'running') AND id NOT IN ("
+        "SELECT MIN(id) FROM jobs WHERE account_id IS NULL AND status IN ('pending', 'running') GROUP BY kind)"
+    ))
+    await conn.execute(text("DROP INDEX IF EXISTS uq_jobs_active_account"))
+    await conn.execute(text(
+        "CREATE UNIQUE INDEX uq_jobs_active_account ON jobs (kind, COALESCE(account_id, 0)) "
+        "WHERE status IN ('pending', 'running')"
+    ))
@@ -0,0 +1,323 @@
+"""
+按用户分库 - 每个用户的邮件数据保存在单独的 SQLite 文件 (MAIL_SHARDS_ENABLED)
+
+主库 (DATABASE_URL) 保留用户、账户、任务、租约、设置等目录数据；文件夹、邮件、正文、地址索引、验证码与全文索引
+位于 MAIL_SHARD_DIR/user_<id>.db：
+- SQLite 的写锁按文件区分：不同用户的同步入库、批量删除互不等锁 (本进程内按分库排队，见 serialized_write)
+- 删除用户时直接删除其分库文件
+- 分库中的 email_accounts 是账户的影子表 (id、user_id 与计数器)：外键级联、按 user_id 关联账户的查询、
+  计数器增量 (CounterDeltas) 在分库内照常执行，与邮件写入在同一事务中；
+  API 返回账户时用影子表的计数器覆盖主库中的值 (apply_shard_counters)
+- 分库在首次使用时打开 (建表并执行 shards=True 的迁移)，每个进程最多同时打开 MAIL_SHARD_OPEN_MAX 个，
+  超出时关闭最久未用且没有会话在使用的分库
+
+未开启或主库不是 SQLite 时 mail_store 等函数返回主库，调用方不需要区分两种模式。
+"""
+import asyncio
+import logging
+import os
+import re
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Set
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core.config import settings
+from app.core.database import (
+    AsyncSessionLocal, ReadSessionLocal, Base, engine, serialized_write, _create_engine
+)
+
+logger = logging.getLogger(__name__)
+
+# 每个分库的连接池 (每个连接各有 SQLITE_CACHE_SIZE_KB 的页缓存，分库数量多时不宜过大)
+SHARD_POOL_SIZE = 2
+SHARD_MAX_OVERFLOW = 8
+SHARD_FILE_PATTERN = re.compile(r"^user_(\d+)\.db$")
+SHADOW_COUNTERS = ("total_emails", "unread_count", "storage_used")
+SHADOW_ACCOUNTS_DDL = (
+    "CREATE TABLE IF NOT EXISTS email_accounts ("
+    "id INTEGER PRIMARY KEY, "
+    "user_id INTEGER NOT NULL, "
+    "total_emails INTEGER NOT NULL DEFAULT 0, "
+    "unread_count INTEGER NOT NULL DEFAULT 0, "
+    "storage_used INTEGER NOT NULL DEFAULT 0, "
+    # ORM 的 UPDATE 会同时写入 updated_at (onupdate)
+    "updated_at DATETIME)"
+)
+
+
+def sharding_enabled() -> bool:
+    return settings.mail_shards_enabled and engine.dialect.name == "sqlite"
+
+
+def _mail_tables():
+    from app.models.email import Email
+    from app.models.email_address import EmailAddress
+    from app.models.email_body import EmailBody
+    from app.models.folder import Folder
+    from app.models.verification_code import VerificationCode
+    return [Folder.__table__, Email.__table__, EmailBody.__table__, VerificationCode.__table__, EmailAddress.__table__]
+
+
+@dataclass
+class MailStore:
+    """一个用户的邮件数据所在的数据库 (user_id 为空表示主库)"""
+    engine: AsyncEngine
+    session: async_sessionmaker
+    read_session: async_sessionmaker
+    user_id: Optional[int] = None
+    # 已确认存在影子行的账户
+    shadow_accounts: Set[int] = field(default_factory=set)
+
+    @property
+    def sharded(self) -> bool:
+        return self.user_id is not None
+
+    def write(self):
+        """本库的串行写入 (见 serialized_write)"""
+        return serialized_write(None if self.user_id is None else f"shard:{self.user_id}")
+
+
+central_store = MailStore(engine, AsyncSessionLocal, ReadSessionLocal)
+
+
+@dataclass
+class _OpenShard:
+    store: MailStore
+    users: int = 0
+
+
+async def _open_shard(user_id: int, path: str) -> MailStore:
+    from app.core.migrations import run_migrations
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    shard_engine = _create_engine(
+        f"sqlite+aiosqlite:///{path}", pool_size=SHARD_POOL_SIZE, max_overflow=SHARD_MAX_OVERFLOW
+    )
+    async with shard_engine.begin() as conn:
+        # 与主库相同：新文件使用增量回收与 WAL
+        await conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        await conn.execute(text("PRAGMA journal_mode=WAL"))
+        await conn.execute(text(SHADOW_ACCOUNTS_DDL))
+        await conn.run_sync(lambda sync_conn: Base.metadata.create_all(sync_conn, tables=_mail_tables()))
+    await run_migrations(shard_engine, shard=True)
+    session = async_sessionmaker(
+        shard_engine,
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autoflush=False,
+        autocommit=False,
+    )
+    return MailStore(shard_engine, session, session, user_id)
+
+
+class ShardRouter:
+    """用户 ID -> 分库 (按需打开，超过 MAIL_SHARD_OPEN_MAX 时按 LRU 关闭空闲的分库)"""
+
+    def __init__(self):
+        self._open: "OrderedDict[int, _OpenShard]" = OrderedDict()
+        self._lock: Optional[asyncio.Lock] = None
+        self.opened = 0
+        self.closed = 0
+
+    @staticmethod
+    def path(user_id: int) -> str:
+        return os.path.join(settings.mail_shard_dir, f"user_{user_id}.db")
+
+    def exists(self, user_id: int) -> bool:
+        return user_id in self._open or os.path.exists(self.path(user_id))
+
+    def user_ids(self) -> List[int]:
+        """已有分库文件的用户 (升序)"""
+        if not os.path.isdir(settings.mail_shard_dir):
+            return []
+        ids = []
+        for name in os.listdir(settings.mail_shard_dir):
+            match = SHARD_FILE_PATTERN.match(name)
+            if match:
+                ids.append(int(match.group(1)))
+        return sorted(ids)
+
+    @asynccontextmanager
+    async def open(self, user_id: int) -> AsyncIterator[MailStore]:
+        """打开用户的分库 (不存在时创建)，退出前该分库不会被 LRU 关闭"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            shard = self._open.get(user_id)
+            if shard is None:
+                shard = _OpenShard(await _open_shard(user_id, self.path(user_id)))
+                self._open[user_id] = shard
+                self.opened += 1
+            self._open.move_to_end(user_id)
+            shard.users += 1
+        try:
+            yield shard.store
+        finally:
+            shard.users -= 1
+            await self._evict()
+
+    async def _evict(self):
+        excess = len(self._open) - settings.mail_shard_open_max
+        if excess <= 0:
+            return
+        idle = [user_id for user_id, shard in self._open.items() if shard.users == 0][:excess]
+        for user_id in idle:
+            shard = self._open.pop(user_id)
+            await shard.store.engine.dispose()
+            self.closed += 1
+
+    async def drop(self, user_id: int):
+        """关闭并删除用户的分库文件 (用户删除后调用)"""
+        shard = self._open.pop(user_id, None)
+        if shard is not None:
+            await shard.store.engine.dispose()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.unlink(self.path(user_id) + suffix)
+            except FileNotFoundError:
+                pass
+        logger.info(f"Dropped mail shard of user {user_id}")
+
+    async def close(self):
+        while self._open:
+            _, shard = self._open.popitem()
+            await shard.store.engine.dispose()
+
+
+shard_router = ShardRouter()
+
+
+@asynccontextmanager
+async def mail_store(user_id: Optional[int]) -> AsyncIterator[MailStore]:
+    """用户的邮件库 (未分库或 user_id 为空时为主库)"""
+    if user_id is None or not sharding_enabled():
+        yield central_store
+        return
+    async with shard_router.open(user_id) as store:
+        yield store
+
+
+@asynccontextmanager
+async def account_mail_store(account_id: int) -> AsyncIterator[Optional[MailStore]]:
+    """账户所属用户的邮件库 (分库模式下账户已不存在时为 None)"""
+    if not sharding_enabled():
+        yield central_store
+        return
+    from app.models.email_account import EmailAccount
+
+    async with ReadSessionLocal() as db:
+        user_id = (await db.execute(select(EmailAccount.user_id).where(EmailAccount.id == account_id))).scalar()
+    if user_id is None:
+        yield None
+        return
+    async with shard_router.open(user_id) as store:
+        yield store
+
+
+def mail_store_ids() -> List[Optional[int]]:
+    """所有邮件库 (传给 mail_store)：未分库时只有主库，分库时为已有分库的用户"""
+    if not sharding_enabled():
+        return [None]
+    return shard_router.user_ids()
+
+
+async def ensure_shadow_account(store: MailStore, account_id: int, user_id: int):
+    """在分库中补齐账户的影子行 (写入文件夹 / 邮件之前调用；主库中什么也不做)"""
+    if not store.sharded or account_id in store.shadow_accounts:
+        return
+    async with store.write():
+        async with store.session() as db:
+            await db.execute(
+                text("INSERT OR IGNORE INTO email_accounts (id, user_id) VALUES (:id, :user_id)"),
+                {"id": account_id, "user_id": user_id},
+            )
+            await db.commit()
+    store.shadow_accounts.add(account_id)
+
+
+async def apply_shard_counters(user_id: int, accounts: Sequence):
+    """按用户分库时，用分库影子表中的计数器覆盖账户对象上的值 (不标记为修改，不会写回主库)"""
+    if not sharding_enabled() or not accounts or not shard_router.exists(user_id):
+        return
+    from app.models.email_account import EmailAccount
+
+    async with mail_store(user_id) as store:
+        async with store.read_session() as db:
+            result = await db.execute(
+                select(EmailAccount.id, *(getattr(EmailAccount, name) for name in SHADOW_COUNTERS))
+                .where(EmailAccount.id.in_([account.id for account in accounts]))
+            )
+            counters = {row[0]: row[1:] for row in result.all()}
+    for account in accounts:
+        for name, value in zip(SHADOW_COUNTERS, counters.get(account.id, (0, 0, 0))):
+            set_committed_value(account, name, value)
+
+
+def _copy_script(central_path: str, user_id: int, with_fts: bool) -> str:
+    def columns(table) -> str:
+        return ", ".join(column.name for column in table.columns)
+
+    folders, emails, bodies, codes, addresses = _mail_tables()
+    statements = [
+        f"ATTACH DATABASE '{central_path.replace(chr(39), chr(39) * 2)}' AS central",
+        "BEGIN",
+        "INSERT OR REPLACE INTO email_accounts (id, user_id, total_emails, unread_count, storage_used) "
+        "SELECT id, user_id, total_emails, unread_count, storage_used "
+        f"FROM central.email_accounts WHERE user_id = {int(user_id)}",
+        f"INSERT INTO folders ({columns(folders)}) SELECT {columns(folders)} FROM central.folders "
+        "WHERE account_id IN (SELECT id FROM main.email_accounts)",
+        f"INSERT INTO emails ({columns(emails)}) SELECT {columns(emails)} FROM central.emails "
+        "WHERE account_id IN (SELECT id FROM main.email_accounts)",
+        f"INSERT INTO email_bodies ({columns(bodies)}) SELECT {columns(bodies)} FROM central.email_bodies "
+        "WHERE email_id IN (SELECT id FROM main.emails)",
+        f"INSERT INTO verification_codes ({columns(codes)}) SELECT {columns(codes)} FROM central.verification_codes "
+        "WHERE account_id IN (SELECT id FROM main.email_accounts)",
+        f"INSERT INTO email_addresses ({columns(addresses)}) SELECT {columns(addresses)} FROM central.email_addresses "
+        "WHERE email_id IN (SELECT id FROM main.emails)",
+    ]
+    if with_fts:
+        statements.append(
+            "INSERT INTO emails_fts (rowid, subject, sender, body) "
+            "SELECT rowid, subject, sender, body FROM central.emails_fts WHERE rowid IN (SELECT id FROM main.emails)"
+        )
+    statements += ["COMMIT", "DETACH DATABASE central"]
+    return ";\n".join(statements) + ";"
+
+
+async def copy_to_shards() -> Dict[int, int]:
+    """
+    把主库中的邮件数据按用户复制到分库 (开启 MAIL_SHARDS_ENABLED 前停机执行，见 DEPLOY.md)
+    每个用户一个事务 (分库 ATTACH 主库后 INSERT ... SELECT)，分库中已有邮件的用户跳过；主库中的数据不修改
+    返回: {用户 ID: 复制的邮件数}
+    """
+    from app.models.email_account import EmailAccount
+
+    if engine.dialect.name != "sqlite":
+        raise RuntimeError("按用户分库只支持 SQLite")
+    async with AsyncSessionLocal() as db:
+        user_ids = (await db.execute(
+            select(EmailAccount.user_id).distinct().order_by(EmailAccount.user_id)
+        )).scalars().all()
+        with_fts = (await db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'emails_fts'")
+        )).first() is not None
+
+    copied = {}
+    for user_id in user_ids:
+        async with shard_router.open(user_id) as store:
+            async with store.write():
+                async with store.engine.connect() as conn:
+                    if (await conn.execute(text("SELECT 1 FROM emails LIMIT 1"))).first():
+                        logger.info(f"Shard of user {user_id} already has emails, skipped")
+                        continue
+                    # ATTACH 不能在事务中执行，整个脚本交给 sqlite3 的 executescript
+                    raw = await conn.get_raw_connection()
+                    await raw.driver_connection.executescript(_copy_script(engine.url.database, user_id, with_fts))
+                    copied[user_id] = (await conn.execute(text("SELECT count(*) FROM emails"))).scalar()
+        logger.info(f"Copied {copied[user_id]} emails of user {user_id} to {shard_router.path(user_id)}")
+    return copied
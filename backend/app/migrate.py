@@ -0,0 +1,74 @@
+"""
+数据库迁移命令
+
+    python -m app.migrate            # 建表并执行全部未执行的迁移
+    python -m app.migrate --status   # 查看迁移状态
+    python -m app.migrate --target 2 # 只执行到版本 2
+    python -m app.migrate --to-shards  # 把主库中的邮件按用户复制到分库 (开启 MAIL_SHARDS_ENABLED 前停机执行)
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from typing import List, Optional
+
+
+async def _status():
+    from app.core.database import engine
+    from app.core.migrations import MIGRATIONS, applied_versions
+
+    done = await applied_versions(engine)
+    for version in sorted(MIGRATIONS):
+        applied_at = done.get(version)
+        state = f"applied {applied_at}" if applied_at else "pending"
+        print(f"{version:>4}  {MIGRATIONS[version].name:<30} {state}")
+
+
+async def _upgrade(target: Optional[int]):
+    from app.core.config import settings
+    from app.core.database import engine, init_db
+    from app.core.migrations import run_migrations
+
+    # 只用 init_db 建表，迁移由这里按 target 执行
+    settings.db_auto_migrate = False
+    await init_db()
+    executed = await run_migrations(engine, target=target)
+    print(f"Applied migrations: {executed}" if executed else "Database is up to date")
+
+
+async def _to_shards():
+    from app.core.database import init_db
+    from app.core.shards import copy_to_shards
+
+    await init_db()
+    copied = await copy_to_shards()
+    print(f"Copied {sum(copied.values())} emails of {len(copied)} users to shards")
+
+
+async def _run(args):
+    from app.core.database import close_db
+    try:
+        if args.status:
+            await _status()
+        elif args.to_shards:
+            await _to_shards()
+        else:
+            await _upgrade(args.target)
+    finally:
+        await close_db()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Mailbox Manager 数据库迁移")
+    parser.add_argument("--status", action="store_true", help="只查看迁移状态")
+    parser.add_argument("--target", type=int, default=None, help="只执行到指定版本")
+    parser.add_argument("--to-shards", action="store_true", help="把主库中的邮件按用户复制到分库")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
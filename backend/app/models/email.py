@@ -4,7 +4,7 @@
 from datetime import datetime
 from typing import TYPE_CHECKING, Optional
 
-from sqlalchemy import String, Integer, Boolean, DateTime, ForeignKey, Text, LargeBinary
+from sqlalchemy import String, Integer, Boolean, DateTime, ForeignKey, Text, LargeBinary, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.core.database import Base
@@ -42,11 +42,18 @@ class Email(Base):
     cc_addresses: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     bcc_addresses: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     reply_to: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    # 正文摘要 (纯文本前 SNIPPET_LENGTH 个字符)，列表直接返回，无需读取正文
+    snippet: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     
-    # 邮件内容
-    body_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
-    body_html: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
-    
+    # 邮件内容：压缩存储在 email_bodies 表，不随邮件查询加载
+    # 同步入库时由构造参数传入；读取已有邮件的正文需先调用 app.services.email_bodies.load_bodies
+    body_text = None
+    body_html = None
+    # 正文渲染的纯文本 (见 app/services/plain_text.py)：压缩存储在 email_bodies.plain_data，入库时计算，由 load_bodies 读取
+    plain_text = None
+    # Delivered-To / X-Original-To 头部：不存列，同步入库时传入，只写入 email_addresses (见 app/services/email_addresses.py)
+    delivered_to = None
+
     # 邮件状态
     is_read: Mapped[bool] = mapped_column(Boolean, default=False, index=True)
     is_flagged: Mapped[bool] = mapped_column(Boolean, default=False)
@@ -56,6 +63,8 @@ class Email(Base):
     has_attachments: Mapped[bool] = mapped_column(Boolean, default=False)
     attachments_count: Mapped[int] = mapped_column(Integer, default=0)
     size_bytes: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # RFC822 原文在磁盘存储中的 SHA-256 (见 app/services/raw_store.py)，未保存原文时为空
+    raw_digest: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
     
     # 时间戳
     sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
@@ -68,8 +77,9 @@ class Email(Base):
     )
     
     # 关联关系
-    account: Mapped["EmailAccount"] = relationship("EmailAccount", back_populates="emails")
-    folder: Mapped["Folder"] = relationship("Folder", back_populates="emails")
+    # 不自动加载，需要账户信息时显式 selectinload(Email.account)
+    account: Mapped["EmailAccount"] = relationship("EmailAccount", back_populates="emails", lazy="raise")
+    folder: Mapped["Folder"] = relationship("Folder", back_populates="emails", lazy="raise")
     
     def __repr__(self) -> str:
         return f"<Email(id={self.id}, subject={self.subject[:30] if self.subject else None}, from={self.from_address})>"
@@ -90,12 +100,14 @@ class Email(Base):
             "cc_addresses": self.cc_addresses,
             "bcc_addresses": self.bcc_addresses,
             "reply_to": self.reply_to,
+            "snippet": self.snippet,
             "is_read": self.is_read,
             "is_flagged": self.is_flagged,
             "is_deleted": self.is_deleted,
             "has_attachments": self.has_attachments,
             "attachments_count": self.attachments_count,
             "size_bytes": self.size_bytes,
+            "has_raw": self.raw_digest is not None,
             "sent_at": self.sent_at.isoformat() if self.sent_at else None,
             "received_at": self.received_at.isoformat() if self.received_at else None,
             "created_at": self.created_at.isoformat() if self.created_at else None,
@@ -106,4 +118,18 @@ class Email(Base):
             data["body_text"] = self.body_text
             data["body_html"] = self.body_html
             
-        return data
\ No newline at end of file
+        return data
+
+
+# 热点查询的复合索引 (已有数据库由 app/core/migrations.py 补建)
+# 邮件列表 (游标分页): WHERE account_id = ? AND is_deleted = ? ORDER BY received_at DESC, id DESC
+Index(
+    "ix_emails_account_deleted_received",
+    Email.account_id, Email.is_deleted, Email.received_at.desc(), Email.id.desc(),
+)
+# 不限账户的邮件列表: WHERE is_deleted = ? ORDER BY received_at DESC, id DESC (按所属用户过滤)
+Index("ix_emails_deleted_received", Email.is_deleted, Email.received_at.desc(), Email.id.desc())
+# 文件夹内邮件: WHERE account_id = ? AND folder_id = ? ORDER BY received_at
+Index("ix_emails_account_folder_received", Email.account_id, Email.folder_id, Email.received_at)
+# 同步去重: 同一账户的 message_id 唯一
+Index("uq_emails_account_message", Email.account_id, Email.message_id, unique=True)
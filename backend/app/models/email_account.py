@@ -36,6 +36,7 @@ class AccountStatus(str, PyEnum):
     SYNCING = "syncing"          # 同步中
     DISABLED = "disabled"        # 已禁用
     AUTH_REQUIRED = "auth_required"  # 需要重新授权
+    DELETING = "deleting"        # 删除中 (后台任务分批删除邮件，完成后删除账户)
 
 
 class EmailAccount(Base):
@@ -92,6 +93,9 @@ class EmailAccount(Base):
     sync_enabled: Mapped[bool] = mapped_column(Boolean, default=True)
     last_sync_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     sync_folder: Mapped[str] = mapped_column(String(255), default="INBOX")
+    # 保留策略 (见 app/services/maintenance.py)：为空时使用全局配置 RETENTION_*，0 表示不限制
+    retention_days: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    retention_max_per_folder: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     
     # 统计信息
     total_emails: Mapped[int] = mapped_column(Integer, default=0)
@@ -110,18 +114,22 @@ class EmailAccount(Base):
     )
     
     # 关联关系
-    user: Mapped["User"] = relationship("User", back_populates="email_accounts")
+    # 关系不自动加载 (lazy="raise")，需要时在查询中显式 selectinload / joinedload；
+    # 删除账户时由数据库外键 ON DELETE CASCADE 删除邮件和文件夹 (passive_deletes)，不把它们加载到内存
+    user: Mapped["User"] = relationship("User", back_populates="email_accounts", lazy="raise")
     emails: Mapped[list["Email"]] = relationship(
         "Email",
         back_populates="account",
         cascade="all, delete-orphan",
-        lazy="selectin"
+        passive_deletes=True,
+        lazy="raise"
     )
     folders: Mapped[list["Folder"]] = relationship(
         "Folder",
         back_populates="account",
         cascade="all, delete-orphan",
-        lazy="selectin"
+        passive_deletes=True,
+        lazy="raise"
     )
     
     def __repr__(self) -> str:
@@ -141,6 +149,8 @@ class EmailAccount(Base):
             "sync_enabled": self.sync_enabled,
             "last_sync_at": self.last_sync_at.isoformat() if self.last_sync_at else None,
             "sync_folder": self.sync_folder,
+            "retention_days": self.retention_days,
+            "retention_max_per_folder": self.retention_max_per_folder,
             "total_emails": self.total_emails,
             "unread_count": self.unread_count,
             "storage_used": self.storage_used,
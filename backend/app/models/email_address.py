@@ -0,0 +1,42 @@
+"""
+邮件地址模型 - 同步写入邮件时解析发件人 / 收件人头部，按地址查询邮件只需一次索引查找
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+
+class EmailAddress(Base):
+    """邮件中出现的地址 (每封邮件每个角色每个地址一条，读写见 app/services/email_addresses.py)"""
+
+    __tablename__ = "email_addresses"
+
+    # 主键以 email_id 开头，删除邮件时级联删除走主键索引
+    email_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("emails.id", ondelete="CASCADE"), primary_key=True
+    )
+    # 角色: from / to / cc / bcc / reply_to / delivered_to
+    role: Mapped[str] = mapped_column(String(16), primary_key=True)
+    # 小写的 addr-spec (local@domain)，不含显示名
+    address: Mapped[str] = mapped_column(String(255), primary_key=True)
+    domain: Mapped[str] = mapped_column(String(255), nullable=False)
+    # 冗余邮件的接收时间：按地址查询最新邮件时直接按索引顺序读取，无需取出全部匹配再排序
+    received_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<EmailAddress(email_id={self.email_id}, role={self.role}, address={self.address})>"
+
+
+# 按地址 / 按域名 (catch-all) 查询最新邮件: WHERE address = ? AND role IN (...) ORDER BY received_at DESC, email_id DESC
+Index(
+    "ix_email_addresses_address_received",
+    EmailAddress.address, EmailAddress.received_at.desc(), EmailAddress.email_id.desc(),
+)
+Index(
+    "ix_email_addresses_domain_received",
+    EmailAddress.domain, EmailAddress.received_at.desc(), EmailAddress.email_id.desc(),
+)
@@ -0,0 +1,28 @@
+"""
+邮件正文模型 - 正文从 emails 表拆出并压缩存储，列表 / 计数查询不再读取正文
+"""
+from typing import Optional
+
+from sqlalchemy import String, Integer, ForeignKey, LargeBinary
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+
+class EmailBody(Base):
+    """邮件正文 (每封邮件最多一条，读写见 app/services/email_bodies.py)"""
+
+    __tablename__ = "email_bodies"
+
+    email_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("emails.id", ondelete="CASCADE"), primary_key=True
+    )
+    # 压缩算法: zlib / zstd / none (按行记录，修改配置后旧正文仍可读取)
+    codec: Mapped[str] = mapped_column(String(10), nullable=False, default="zlib")
+    text_data: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    html_data: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    # 正文渲染的纯文本 (全文索引、验证码回填直接使用)
+    plain_data: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<EmailBody(email_id={self.email_id}, codec={self.codec})>"
@@ -4,7 +4,7 @@
 from datetime import datetime
 from typing import TYPE_CHECKING, Optional
 
-from sqlalchemy import String, Integer, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import String, Integer, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.core.database import Base
@@ -53,12 +53,13 @@ class Folder(Base):
     )
     
     # 关联关系
-    account: Mapped["EmailAccount"] = relationship("EmailAccount", back_populates="folders")
+    account: Mapped["EmailAccount"] = relationship("EmailAccount", back_populates="folders", lazy="raise")
     emails: Mapped[list["Email"]] = relationship(
         "Email",
         back_populates="folder",
         cascade="all, delete-orphan",
-        lazy="selectin"
+        passive_deletes=True,
+        lazy="raise"
     )
     
     def __repr__(self) -> str:
@@ -78,4 +79,8 @@ class Folder(Base):
             "last_sync_at": self.last_sync_at.isoformat() if self.last_sync_at else None,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
-        }
\ No newline at end of file
+        }
+
+
+# 同步时按路径查找文件夹: WHERE account_id = ? AND path = ?
+Index("ix_folders_account_path", Folder.account_id, Folder.path)
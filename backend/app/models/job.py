@@ -0,0 +1,125 @@
+"""
+后台任务模型 - 同步等任务的排队、去重与状态查询
+"""
+import json
+from datetime import datetime
+from enum import Enum as PyEnum, IntEnum
+from typing import Optional
+
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Text, Index, func, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+
+class JobKind(str, PyEnum):
+    """任务类型"""
+    SYNC = "sync"                    # 同步账户邮件
+    BACKFILL_CODES = "backfill_codes"  # 回填历史邮件的验证码
+    RECONCILE_COUNTERS = "reconcile_counters"  # 按邮件表修正文件夹 / 账户计数
+    BACKFILL_SEARCH = "backfill_search"  # 把历史邮件写入全文索引
+    GC_RAW_STORE = "gc_raw_store"    # 删除已没有邮件引用的原始邮件文件
+    RETENTION = "retention"          # 按保留策略删除旧邮件，回收数据库空间并更新统计信息
+    CLEAR_INBOX = "clear_inbox"      # 把账户的邮件分批移入垃圾箱
+    CLEAR_TRASH = "clear_trash"      # 分批彻底删除账户垃圾箱中的邮件
+    DELETE_ACCOUNT = "delete_account"  # 分批删除账户的邮件，然后删除账户
+    BACKFILL_TEXT = "backfill_text"  # 为历史邮件生成纯文本与摘要
+
+
+class JobStatus(str, PyEnum):
+    """任务状态"""
+    PENDING = "pending"              # 排队中
+    RUNNING = "running"              # 执行中 (持有账户锁)
+    SUCCEEDED = "succeeded"          # 成功
+    FAILED = "failed"                # 失败
+
+
+class JobPriority(IntEnum):
+    """任务优先级 (数值越大越先执行)"""
+    SCHEDULED = 0                    # 调度器定时同步
+    MANUAL = 10                      # 用户手动触发 / 新建 / 导入
+    CODE_LOOKUP = 20                 # 查询验证码时触发的快速同步
+
+
+# 仍在排队或执行中的状态
+ACTIVE_JOB_STATUSES = (JobStatus.PENDING.value, JobStatus.RUNNING.value)
+
+
+class Job(Base):
+    """后台任务"""
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_priority", "status", "priority", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)
+
+    # 关联 (任务结束后账户可能已被删除，因此置空而不是级联删除)
+    account_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("email_accounts.id", ondelete="SET NULL"), nullable=True, index=True
+    )
+    user_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True
+    )
+
+    # 调度信息
+    priority: Mapped[int] = mapped_column(Integer, default=JobPriority.SCHEDULED, nullable=False)
+    status: Mapped[str] = mapped_column(String(20), default=JobStatus.PENDING.value, nullable=False)
+    source: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)  # manual, scheduled, create, import...
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # 账户限流冷却中被放回队列的任务在此时间之前不会被认领
+    not_before: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    # 执行者与锁 (lock_expires_at 过期视为 worker 已失联，任务重新排队)
+    worker_id: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    lock_expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    # 结果
+    message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    result: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # JSON
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    # 时间戳
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False
+    )
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return f"<Job(id={self.id}, kind={self.kind}, account_id={self.account_id}, status={self.status})>"
+
+    def to_dict(self) -> dict:
+        """转换为字典"""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "account_id": self.account_id,
+            "priority": self.priority,
+            "status": self.status,
+            "source": self.source,
+            "attempts": self.attempts,
+            "not_before": self.not_before.isoformat() if self.not_before else None,
+            "message": self.message,
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+# 同一账户同一类型最多只有一个活动任务 (重复请求合并到已有任务，已有数据库由 app/core/migrations.py 重建)；
+# 全局任务的 account_id 为 NULL，按 COALESCE 后的 0 参与唯一约束，同一类型也只有一个
+Index(
+    "uq_jobs_active_account",
+    Job.kind, func.coalesce(Job.account_id, 0),
+    unique=True,
+    sqlite_where=text("status IN ('pending', 'running')"),
+    postgresql_where=text("status IN ('pending', 'running')"),
+)
@@ -0,0 +1,50 @@
+"""
+同步租约模型 - 多进程 / 多节点之间分配账户
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import String, Integer, DateTime, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+
+class SyncWorker(Base):
+    """同步 Worker 注册表 (通过心跳判断存活)"""
+
+    __tablename__ = "sync_workers"
+
+    worker_id: Mapped[str] = mapped_column(String(100), primary_key=True)
+    hostname: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    pid: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+    # 分片 (account_id % shard_count == shard_index)，单进程时为 0 / 1
+    shard_index: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    shard_count: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
+
+    started_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False
+    )
+    heartbeat_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False, index=True
+    )
+
+    def __repr__(self) -> str:
+        return f"<SyncWorker(worker_id={self.worker_id}, heartbeat_at={self.heartbeat_at})>"
+
+
+class SyncLease(Base):
+    """账户同步租约：worker_id 为空或 expires_at 已过期即可被认领"""
+
+    __tablename__ = "sync_leases"
+
+    account_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("email_accounts.id", ondelete="CASCADE"), primary_key=True
+    )
+    worker_id: Mapped[Optional[str]] = mapped_column(String(100), nullable=True, index=True)
+    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
+    acquired_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<SyncLease(account_id={self.account_id}, worker_id={self.worker_id}, expires_at={self.expires_at})>"
@@ -47,7 +47,8 @@ class User(Base):
         "EmailAccount",
         back_populates="user",
         cascade="all, delete-orphan",
-        lazy="selectin"
+        passive_deletes=True,
+        lazy="raise"
     )
     
     def __repr__(self) -> str:
@@ -0,0 +1,59 @@
+"""
+验证码模型 - 同步写入邮件时提取，查询最新验证码只需一次索引查找
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Text, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+
+class VerificationCode(Base):
+    """从邮件中提取的验证码 (每封邮件最多一条)"""
+
+    __tablename__ = "verification_codes"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+
+    # 外键关联
+    account_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("email_accounts.id", ondelete="CASCADE"), nullable=False
+    )
+    email_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("emails.id", ondelete="CASCADE"), nullable=False, unique=True
+    )
+
+    # 验证码信息 (冗余邮件主题 / 发件人，查询时无需关联 emails 表)
+    code: Mapped[str] = mapped_column(String(32), nullable=False)
+    sender: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    subject: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    received_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return f"<VerificationCode(id={self.id}, account_id={self.account_id}, code={self.code})>"
+
+    def to_dict(self) -> dict:
+        """转换为字典"""
+        return {
+            "id": self.id,
+            "account_id": self.account_id,
+            "email_id": self.email_id,
+            "code": self.code,
+            "sender": self.sender,
+            "subject": self.subject,
+            "received_at": self.received_at.isoformat() if self.received_at else None,
+        }
+
+
+# 最新验证码查询: WHERE account_id = ? ORDER BY received_at DESC LIMIT 1
+Index(
+    "ix_verification_codes_account_received",
+    VerificationCode.account_id,
+    VerificationCode.received_at.desc(),
+)
@@ -0,0 +1,298 @@
+"""
+验证码提取 - 在同步写入邮件时调用，结果存入 verification_codes 表
+
+提取流程：
+1. 模板规则：按发件人 / 域名匹配的自定义正则 (system_settings.code_rules) 与内置模板，命中即返回
+2. 关键词：Aho-Corasick 自动机一次扫描找出所有中英文关键词 (正向: 验证码 / code，负向: 订单 / phone)
+3. 候选打分：正文中的数字 / 大写字母数字串按与关键词的距离、长度、上下文打分，取最高分
+"""
+import json
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from email.utils import parseaddr
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.services.plain_text import render_plain_text
+
+# 候选验证码：4-8 位数字 (允许 3+3 / 4+4 中间有空格或横线)，前后不能紧挨字母数字或日期 / 金额分隔符
+# 兼容 :123456 和 G-123456 (匹配结果只包含数字部分)
+NUMERIC_PATTERN = re.compile(
+    r'(?<![A-Za-z0-9_])(?<!\d[.,:/-])(\d{3,4}[ -]\d{3,4}|\d{4,8})(?![A-Za-z0-9_]|[.,:/-]\d)'
+)
+# 大写字母 + 数字混合的验证码 (如 K7P2QX)，只在靠近关键词时采用
+ALNUM_PATTERN = re.compile(
+    r'(?<![A-Za-z0-9_])(?=[A-Z0-9]*\d)(?=[A-Z0-9]*[A-Z])([A-Z0-9]{5,8})(?![A-Za-z0-9_])'
+)
+YEAR_PATTERN = re.compile(r'(19|20)\d\d')
+
+# 正向关键词：出现时才认为邮件包含验证码
+KEYWORDS = (
+    'code', 'verification', 'verify', 'security code', 'one-time', 'otp', 'passcode',
+    'pin', 'captcha', '2fa', 'two-factor', 'sign in', 'login', 'log in', 'security',
+    '验证码', '校验码', '动态码', '确认码', '安全码', '认证码', '激活码', '授权码', '动态密码',
+    '驗證碼', '認證碼', '登录', '登入', '验证', '确认',
+)
+# 负向关键词：候选前面紧挨着这些词时降分 (订单号、电话、金额等)
+NEGATIVE_KEYWORDS = (
+    'order', 'invoice', 'tracking', 'phone', 'tel', 'mobile', 'amount', 'total', 'price',
+    'account number', 'reference', 'ref', 'zip', 'postal', 'id', 'no.', '#', '$', '¥', '€', '£',
+    '订单', '单号', '发票', '运单', '快递', '电话', '手机', '金额', '合计', '价格', '尾号', '编号',
+    '邮编', '工号', '￥',
+)
+
+MIN_SCORE = 2.0
+
+
+class KeywordMatcher:
+    """
+    多关键词匹配 (Aho-Corasick)
+    构建一次后对任意长度的文本只需线性扫描一遍，得到所有关键词出现的位置
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[str, ...]] = [()]
+
+        for keyword in {k.lower() for k in keywords if k}:
+            node = 0
+            for ch in keyword:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[node][ch] = nxt
+                node = nxt
+            self._out[node] = self._out[node] + (keyword,)
+
+        # BFS 构建失配指针，并把失配节点的输出合并进来
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """在 (已转小写的) 文本中查找关键词，返回 (start, end, keyword)；英文关键词要求单词边界"""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for keyword in out[node]:
+                start = i - len(keyword) + 1
+                if keyword[0].isascii() and keyword[0].isalnum() and start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if keyword[-1].isascii() and keyword[-1].isalnum() and i + 1 < len(text) and _is_word_char(text[i + 1]):
+                    continue
+                yield start, i + 1, keyword
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and (ch.isalnum() or ch == '_')
+
+
+@dataclass
+class CodeRule:
+    """
+    验证码模板规则
+    senders / domains 为空时对所有邮件生效；pattern 中名为 code 的分组 (或第一个分组) 即验证码
+    """
+    name: str
+    pattern: str
+    senders: Sequence[str] = ()
+    domains: Sequence[str] = ()
+    _compiled: Optional[re.Pattern] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self.senders = tuple(s.lower() for s in self.senders)
+        self.domains = tuple(d.lower().lstrip('@.') for d in self.domains)
+        self._compiled = re.compile(self.pattern, re.IGNORECASE)
+        if self._compiled.groups == 0:
+            raise ValueError(f"规则 {self.name} 的 pattern 需要包含捕获分组")
+
+    def applies_to(self, sender: str) -> bool:
+        """sender 为小写的 addr-spec (见 sender_address)"""
+        if not self.senders and not self.domains:
+            return True
+        if sender in self.senders:
+            return True
+        domain = sender.rpartition('@')[2]
+        return any(domain == d or domain.endswith('.' + d) for d in self.domains)
+
+    def search(self, content: str) -> Optional[str]:
+        match = self._compiled.search(content)
+        if not match:
+            return None
+        code = match.groupdict().get('code') or match.group(1)
+        return re.sub(r'[\s-]', '', code) if code else None
+
+
+def sender_address(value: Optional[str]) -> str:
+    """
+    From 头部中的小写地址：IMAP 同步保存的是解码后的完整头部 ("GitHub <noreply@github.com>")，
+    直接按 @ 切分会得到 "github.com>"，发件人 / 域名规则永远不会命中
+    """
+    if not value:
+        return ""
+    address = parseaddr(value)[1] or value
+    return address.strip().strip("<>").lower()
+
+
+# 内置模板 (自定义规则优先)
+BUILTIN_RULES = (
+    CodeRule(name="google", pattern=r'\bG-(?P<code>\d{5,8})\b'),
+)
+
+
+@dataclass
+class CodeMatch:
+    code: str
+    score: float
+    rule: Optional[str] = None
+
+
+class CodeExtractor:
+    """验证码规则引擎 (构建时预编译全部规则与关键词自动机，可在多次提取间复用)"""
+
+    def __init__(self, rules: Sequence[CodeRule] = (), min_score: float = MIN_SCORE):
+        self.rules = tuple(rules) + BUILTIN_RULES
+        self.min_score = min_score
+        self._keywords = KeywordMatcher(KEYWORDS)
+        self._negatives = KeywordMatcher(NEGATIVE_KEYWORDS)
+
+    def extract(
+        self,
+        subject: Optional[str],
+        body_text: Optional[str],
+        body_html: Optional[str],
+        sender: Optional[str] = None,
+        plain_text: Optional[str] = None,
+    ) -> Optional[CodeMatch]:
+        """
+        sender: From 头部或地址 (可带显示名)
+        plain_text: 入库时已渲染的纯文本 (见 app/services/plain_text.py)，为空时按正文渲染
+        """
+        subject = subject or ""
+        if plain_text is None:
+            plain_text = render_plain_text(body_text, body_html)
+        # 拼接所有可能包含验证码的区域：主题 + 正文纯文本
+        content = "\n".join((subject, plain_text))
+
+        # 1. 模板规则
+        sender = sender_address(sender)
+        for rule in self.rules:
+            if rule.applies_to(sender):
+                code = rule.search(content)
+                if code:
+                    return CodeMatch(code=code, score=float('inf'), rule=rule.name)
+
+        # 2. 关键词
+        lowered = content.lower()
+        hits = [(start, end) for start, end, _ in self._keywords.finditer(lowered)]
+        if not hits:
+            return None
+        negatives = [end for _, end, _ in self._negatives.finditer(lowered)]
+
+        # 3. 候选打分
+        best: Optional[CodeMatch] = None
+        subject_end = len(subject)
+        for pattern, alnum in ((NUMERIC_PATTERN, False), (ALNUM_PATTERN, True)):
+            for match in pattern.finditer(content):
+                score = _score(match, hits, negatives, subject_end, alnum)
+                if best is None or score > best.score:
+                    best = CodeMatch(code=re.sub(r'[\s-]', '', match.group(1)), score=score)
+
+        if best is None or best.score < self.min_score:
+            return None
+        return best
+
+
+def _score(match: re.Match, hits: List[Tuple[int, int]], negatives: List[int], subject_end: int, alnum: bool) -> float:
+    start, end = match.span(1)
+    digits = re.sub(r'[\s-]', '', match.group(1))
+    score = -1.0 if alnum else 0.0
+
+    # 与最近关键词的距离：关键词在前 (验证码：123456) 优于在后 (123456 是您的验证码)
+    before = min((start - k_end for _, k_end in hits if k_end <= start), default=None)
+    after = min((k_start - end for k_start, _ in hits if k_start >= end), default=None)
+    if before is not None and before <= 40:
+        score += 3.0
+    elif after is not None and after <= 20:
+        score += 2.5
+    elif before is not None and before <= 150:
+        score += 2.0
+    else:
+        score += 0.5
+
+    # 紧挨在候选前面的负向词 (订单号 12345678、电话 1380000)
+    if any(0 <= start - n_end <= 15 for n_end in negatives):
+        score -= 3.0
+
+    if start < subject_end:
+        score += 1.0
+    if len(digits) == 6:
+        score += 1.0
+    elif len(digits) in (4, 8):
+        score += 0.3
+    if len(digits) == 4 and YEAR_PATTERN.fullmatch(digits):
+        score -= 1.5
+    return score
+
+
+def parse_code_rules(raw: Optional[str]) -> List[CodeRule]:
+    """
+    解析自定义规则 JSON：
+    [{"name": "github", "domains": ["github.com"], "pattern": "code:\\\\s*(?P<code>\\\\d{6})"}]
+    格式错误时抛出 ValueError
+    """
+    if not raw or not raw.strip():
+        return []
+    try:
+        items = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON 解析失败: {e}")
+    if not isinstance(items, list):
+        raise ValueError("规则必须是数组")
+
+    rules = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("pattern"):
+            raise ValueError(f"第 {i + 1} 条规则缺少 pattern")
+        try:
+            rules.append(CodeRule(
+                name=str(item.get("name") or f"rule_{i + 1}"),
+                pattern=item["pattern"],
+                senders=item.get("senders") or (),
+                domains=item.get("domains") or (),
+            ))
+        except re.error as e:
+            raise ValueError(f"第 {i + 1} 条规则的 pattern 无效: {e}")
+    return rules
+
+
+# 不含自定义规则的默认引擎
+default_extractor = CodeExtractor()
+
+
+def extract_code(
+    subject: Optional[str],
+    body_text: Optional[str],
+    body_html: Optional[str],
+    sender: Optional[str] = None,
+    extractor: Optional[CodeExtractor] = None,
+    plain_text: Optional[str] = None,
+) -> Optional[str]:
+    """从邮件中提取验证码，没有时返回 None"""
+    match = (extractor or default_extractor).extract(subject, body_text, body_html, sender, plain_text)
+    return match.code if match else None
@@ -0,0 +1,96 @@
+"""
+邮件计数器 - Folder.total_count / unread_count 与 EmailAccount.total_emails / unread_count / storage_used
+
+写入、标记、删除邮件时在同一事务中以 SQL 增量 (col = col + :delta) 更新，并发事务之间不会互相覆盖；
+计数漂移由定期对账任务修正 (见 app/services/maintenance.py)
+
+统计口径：total / unread 只计未删除 (不在垃圾箱) 的邮件，storage_used 计账户下所有邮件的 size_bytes
+"""
+from collections import defaultdict
+from typing import Dict, List
+
+from sqlalchemy import select, update, func, case, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.email import Email
+from app.models.email_account import EmailAccount
+from app.models.folder import Folder
+
+
+class CounterDeltas:
+    """一次操作对各文件夹 / 账户计数器的增量，apply 时合并成每个对象一条 UPDATE"""
+
+    def __init__(self):
+        self.folders: Dict[int, List[int]] = defaultdict(lambda: [0, 0])  # folder_id -> [total, unread]
+        self.accounts: Dict[int, List[int]] = defaultdict(lambda: [0, 0, 0])  # account_id -> [total, unread, storage]
+
+    def add(self, account_id: int, folder_id: int, total: int = 0, unread: int = 0, storage: int = 0):
+        folder = self.folders[folder_id]
+        folder[0] += total
+        folder[1] += unread
+        account = self.accounts[account_id]
+        account[0] += total
+        account[1] += unread
+        account[2] += storage
+
+    def add_email(self, email: Email, sign: int = 1):
+        """按邮件当前状态计入 (sign=-1 表示移除；修改标记前后各调用一次即得到变化量)"""
+        visible = not email.is_deleted
+        self.add(
+            email.account_id,
+            email.folder_id,
+            total=sign if visible else 0,
+            unread=sign if visible and not email.is_read else 0,
+            storage=sign * (email.size_bytes or 0),
+        )
+
+    async def add_query(self, db: AsyncSession, *criteria, sign: int = -1, storage: bool = True):
+        """
+        按条件统计将被批量修改 / 删除的邮件并计入 (需在执行修改语句之前调用)
+        storage=False 时只计未删除 / 未读数 (如移入垃圾箱，占用空间不变)
+        """
+        visible = Email.is_deleted == False
+        stmt = (
+            select(
+                Email.account_id,
+                Email.folder_id,
+                func.sum(case((visible, 1), else_=0)),
+                func.sum(case((and_(visible, Email.is_read == False), 1), else_=0)),
+                func.coalesce(func.sum(Email.size_bytes), 0),
+            )
+            .where(*criteria)
+            .group_by(Email.account_id, Email.folder_id)
+        )
+        for account_id, folder_id, total, unread, size in (await db.execute(stmt)).all():
+            self.add(
+                account_id,
+                folder_id,
+                total=sign * int(total or 0),
+                unread=sign * int(unread or 0),
+                storage=sign * int(size) if storage else 0,
+            )
+
+    async def apply(self, db: AsyncSession):
+        """写入增量 (调用方负责提交)"""
+        for folder_id, (total, unread) in self.folders.items():
+            if total or unread:
+                await db.execute(
+                    update(Folder)
+                    .where(Folder.id == folder_id)
+                    .values(total_count=Folder.total_count + total, unread_count=Folder.unread_count + unread)
+                    .execution_options(synchronize_session=False)
+                )
+        for account_id, (total, unread, storage) in self.accounts.items():
+            if total or unread or storage:
+                await db.execute(
+                    update(EmailAccount)
+                    .where(EmailAccount.id == account_id)
+                    .values(
+                        total_emails=EmailAccount.total_emails + total,
+                        unread_count=EmailAccount.unread_count + unread,
+                        storage_used=EmailAccount.storage_used + storage,
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+        self.folders.clear()
+        self.accounts.clear()
@@ -0,0 +1,104 @@
+"""
+邮件地址索引 - 发件人 / 收件人头部解析后写入 email_addresses 表
+
+emails.from_address / to_addresses 保存的是解码后的原始头部 (可能带显示名、多个地址)，
+按地址查找只能全表 LIKE。同步入库时用 email.utils.getaddresses 解析出小写的地址与域名，
+由 save_new_emails 在同一事务中写入；已有邮件由迁移补齐。删除邮件时由外键级联删除
+"""
+from datetime import datetime
+from email.utils import getaddresses
+from typing import Iterable, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import dialect_insert
+from app.models.email import Email
+from app.models.email_address import EmailAddress
+
+# 角色 -> Email 上的属性 (delivered_to 不存列，只在同步入库时由 Delivered-To / X-Original-To 头部传入)
+ROLE_FIELDS = {
+    "from": "from_address",
+    "to": "to_addresses",
+    "cc": "cc_addresses",
+    "bcc": "bcc_addresses",
+    "reply_to": "reply_to",
+    "delivered_to": "delivered_to",
+}
+# "发给某个地址" 的邮件：收件人 / 抄送 / 密送，以及 catch-all 转发时只出现在 Delivered-To 中的地址
+RECIPIENT_ROLES = ("to", "cc", "bcc", "delivered_to")
+
+
+def normalize_address(value: Optional[str]) -> Optional[str]:
+    """addr-spec 转为小写；不是 local@domain 形式时返回 None"""
+    if not value:
+        return None
+    address = value.strip().strip("<>").lower()
+    local, sep, domain = address.rpartition("@")
+    if not sep or not local or not domain or len(address) > 255:
+        return None
+    return address
+
+
+def parse_addresses(value: Optional[str]) -> List[str]:
+    """解析地址头部 ("张三 <a@x.com>, b@y.com")，返回去重后的小写地址"""
+    if not value:
+        return []
+    addresses = []
+    for _, addr in getaddresses([value]):
+        address = normalize_address(addr)
+        if address and address not in addresses:
+            addresses.append(address)
+    return addresses
+
+
+def address_rows(email_id: int, received_at: Optional[datetime], headers: dict) -> List[dict]:
+    """
+    一封邮件的 email_addresses 行，headers 为 {角色: 头部值}
+    同一地址在多个收件角色中出现时只记录第一个 (按 RECIPIENT_ROLES 顺序)，按地址查询时每封邮件只匹配一行
+    """
+    rows = []
+    recipients = set()
+    for role, value in headers.items():
+        for address in parse_addresses(value):
+            if role in RECIPIENT_ROLES:
+                if address in recipients:
+                    continue
+                recipients.add(address)
+            rows.append({
+                "email_id": email_id,
+                "role": role,
+                "address": address,
+                "domain": address.rpartition("@")[2],
+                "received_at": received_at,
+            })
+    return rows
+
+
+async def save_addresses(db: AsyncSession, emails: Iterable[Email]):
+    """写入已分配 ID 的邮件的地址 (调用方负责提交)"""
+    rows = []
+    for email in emails:
+        headers = {role: getattr(email, field, None) for role, field in ROLE_FIELDS.items()}
+        rows.extend(address_rows(email.id, email.received_at, headers))
+    if rows:
+        stmt = dialect_insert(EmailAddress).on_conflict_do_nothing()
+        await db.execute(stmt, rows)
+
+
+def recipient_criteria(address: str) -> Optional[list]:
+    """
+    发给 address 的 email_addresses 行的查询条件 (调用方从 email_addresses 出发关联邮件，
+    按 received_at DESC, email_id DESC 排序即可顺着索引读取，取到 LIMIT 条即停止)
+    address 以 @ 开头时按域名匹配 (catch-all 域名下的所有别名)；地址无效时返回 None
+    """
+    if address.startswith("@"):
+        domain = address[1:].strip().lower()
+        if not domain or "@" in domain:
+            return None
+        criteria = EmailAddress.domain == domain
+    else:
+        normalized = normalize_address(address)
+        if normalized is None:
+            return None
+        criteria = EmailAddress.address == normalized
+    return [criteria, EmailAddress.role.in_(RECIPIENT_ROLES)]
@@ -0,0 +1,185 @@
+"""
+邮件正文存储 - 正文压缩后写入 email_bodies 表
+
+只有邮件详情 (get_email) 与需要正文的回填任务 (验证码、全文索引) 读取正文；
+同步入库时正文已在内存中，由 save_new_emails 在同一事务中写入。
+正文渲染的纯文本 (app/services/plain_text.py) 同样压缩存储在这里，历史邮件由回填任务补齐纯文本与摘要
+"""
+import json
+import logging
+import zlib
+from datetime import datetime
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.constants import MAX_BODY_TEXT_LENGTH, MAX_BODY_HTML_LENGTH
+from app.core.database import AsyncSessionLocal, dialect_insert
+from app.core.shards import mail_store, mail_store_ids, sharding_enabled
+from app.models.email import Email
+from app.models.email_body import EmailBody
+from app.models.job import Job, JobKind
+from app.models.setting import SystemSetting
+from app.services.job_queue import enqueue_job, update_job_progress
+from app.services.plain_text import make_snippet, render_plain_text
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，未安装时使用 zlib
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 500
+# 历史邮件的纯文本与摘要全部生成后写入 system_settings，避免每次启动重复入队
+BACKFILL_DONE_KEY = "plain_text_backfilled"
+
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+CODEC_NONE = "none"
+CODECS = (CODEC_ZLIB, CODEC_ZSTD, CODEC_NONE)
+
+_codec_warned = False
+
+
+def current_codec() -> str:
+    """按配置选择新正文的压缩算法 (zstd 未安装或配置无效时回退到 zlib)"""
+    global _codec_warned
+    codec = settings.email_body_compression.lower()
+    if codec not in CODECS or (codec == CODEC_ZSTD and zstandard is None):
+        if not _codec_warned:
+            logger.warning(f"Email body compression '{codec}' unavailable, using zlib")
+            _codec_warned = True
+        return CODEC_ZLIB
+    return codec
+
+
+def compress(value: Optional[str], codec: str) -> Optional[bytes]:
+    if value is None:
+        return None
+    data = value.encode("utf-8")
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=settings.email_body_compression_level).compress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, settings.email_body_compression_level)
+    return data
+
+
+def decompress(data: Optional[bytes], codec: str) -> Optional[str]:
+    if data is None:
+        return None
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("正文使用 zstd 压缩，需要安装 zstandard")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == CODEC_ZLIB:
+        data = zlib.decompress(data)
+    return data.decode("utf-8")
+
+
+def body_row(email_id: int, body_text: Optional[str], body_html: Optional[str],
+             codec: Optional[str] = None, plain_text: Optional[str] = None) -> Optional[dict]:
+    """email_bodies 的一行 (正文截断到 MAX_BODY_*_LENGTH，完整内容见原始邮件存储；没有正文时返回 None)"""
+    if not body_text and not body_html:
+        return None
+    codec = codec or current_codec()
+    return {
+        "email_id": email_id,
+        "codec": codec,
+        "text_data": compress(body_text[:MAX_BODY_TEXT_LENGTH] if body_text else None, codec),
+        "html_data": compress(body_html[:MAX_BODY_HTML_LENGTH] if body_html else None, codec),
+        "plain_data": compress(plain_text[:MAX_BODY_TEXT_LENGTH] if plain_text else None, codec),
+    }
+
+
+async def save_bodies(db: AsyncSession, emails: Iterable[Email]):
+    """写入已分配 ID 的邮件正文与纯文本 (调用方负责提交)"""
+    codec = current_codec()
+    rows = [
+        row for row in (body_row(e.id, e.body_text, e.body_html, codec, e.plain_text) for e in emails) if row
+    ]
+    if rows:
+        stmt = dialect_insert(EmailBody).on_conflict_do_nothing(index_elements=[EmailBody.email_id])
+        await db.execute(stmt, rows)
+
+
+async def load_bodies(db: AsyncSession, emails: Sequence[Email]):
+    """读取正文并填充到 email.body_text / body_html / plain_text (一次查询)"""
+    by_id = {email.id: email for email in emails}
+    if not by_id:
+        return
+    result = await db.execute(select(EmailBody).where(EmailBody.email_id.in_(by_id)))
+    for body in result.scalars().all():
+        email = by_id[body.email_id]
+        email.body_text = decompress(body.text_data, body.codec)
+        email.body_html = decompress(body.html_data, body.codec)
+        email.plain_text = decompress(body.plain_data, body.codec)
+
+
+async def ensure_plain_text_backfill(db: AsyncSession) -> Optional[Job]:
+    """历史邮件还没生成纯文本与摘要时入队回填任务 (已有活动任务时合并)"""
+    result = await db.execute(select(SystemSetting).where(SystemSetting.key == BACKFILL_DONE_KEY))
+    if result.scalars().first():
+        return None
+    job, created = await enqueue_job(db, JobKind.BACKFILL_TEXT.value, None, source="startup")
+    if created:
+        logger.info("Queued plain text backfill")
+    return job
+
+
+async def run_plain_text_backfill_job(job: Job) -> dict:
+    """
+    为历史邮件生成纯文本 (email_bodies.plain_data) 与摘要 (emails.snippet)
+    逐个邮件库 (按用户分库时逐个分库) 按 email.id 递增分批处理，进度 (分库与游标) 写入任务结果，
+    任务中断后重新认领时从游标继续；没有正文的邮件摘要保持为空
+    """
+    progress = json.loads(job.result) if job.result else {}
+    store_id = progress.get("store")
+    cursor = progress.get("last_email_id", 0)
+    rendered = progress.get("rendered", 0)
+
+    store_ids = mail_store_ids()
+    if store_id is not None and sharding_enabled():
+        # 从中断时的分库继续
+        store_ids = [i for i in store_ids if i >= store_id]
+
+    for store_id in store_ids:
+        if progress.get("store") != store_id:
+            cursor = 0
+        async with mail_store(store_id) as store:
+            while True:
+                async with store.session() as db:
+                    stmt = (
+                        select(Email)
+                        .where(Email.id > cursor, Email.snippet.is_(None))
+                        .order_by(Email.id)
+                        .limit(BACKFILL_BATCH_SIZE)
+                    )
+                    emails = (await db.execute(stmt)).scalars().all()
+                    if not emails:
+                        break
+
+                    by_id = {email.id: email for email in emails}
+                    result = await db.execute(select(EmailBody).where(EmailBody.email_id.in_(by_id)))
+                    for body in result.scalars().all():
+                        plain_text = render_plain_text(
+                            decompress(body.text_data, body.codec), decompress(body.html_data, body.codec)
+                        )
+                        # 纯文本按该行的压缩算法存储 (与同一行的正文一致)
+                        body.plain_data = compress(plain_text[:MAX_BODY_TEXT_LENGTH] if plain_text else None, body.codec)
+                        by_id[body.email_id].snippet = make_snippet(plain_text)
+                    await db.commit()
+
+                cursor = emails[-1].id
+                rendered += len(emails)
+                progress = {"store": store_id, "last_email_id": cursor, "rendered": rendered}
+                await update_job_progress(job.id, message=f"已处理 {rendered} 封邮件", result=progress)
+
+    async with AsyncSessionLocal() as db:
+        await db.merge(SystemSetting(key=BACKFILL_DONE_KEY, value=datetime.utcnow().isoformat()))
+        await db.commit()
+
+    logger.info(f"Plain text backfill finished: {rendered} emails")
+    return progress
@@ -0,0 +1,50 @@
+"""
+进程内事件中心 - 同步写入新邮件后唤醒等待中的请求 (如验证码长轮询)
+
+只在同一进程内有效：使用独立 Worker 时 API 进程收不到事件，
+等待方需要配合定期重新查询数据库作为兜底。
+"""
+import asyncio
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Hashable, Iterator, Set
+
+
+class EventHub:
+    """按 key 订阅 / 发布的事件中心"""
+
+    def __init__(self):
+        self._waiters: Dict[Hashable, Set[asyncio.Event]] = defaultdict(set)
+
+    @contextmanager
+    def subscribe(self, key: Hashable) -> Iterator[asyncio.Event]:
+        """订阅 key，返回的 Event 在 publish(key) 时被置位 (由订阅方自行 clear)"""
+        event = asyncio.Event()
+        self._waiters[key].add(event)
+        try:
+            yield event
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[key]
+
+    def publish(self, key: Hashable) -> int:
+        """唤醒 key 的所有订阅者，返回被唤醒的数量"""
+        waiters = self._waiters.get(key, ())
+        for event in waiters:
+            event.set()
+        return len(waiters)
+
+    def subscriber_count(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+
+# 新邮件事件 (key 为 account_id)
+email_events = EventHub()
+
+
+def notify_new_emails(account_id: int):
+    """同步提交新邮件后调用"""
+    email_events.publish(account_id)
@@ -8,18 +8,20 @@ import email
 import logging
 import socks
 from urllib.parse import urlparse
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 import requests
 import httpx
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 from app.core.database import AsyncSessionLocal
+from app.core.shards import ensure_shadow_account, mail_store
 from app.models.email_account import EmailAccount, ProviderType, AuthType, AccountStatus
 from app.models.email import Email
 from app.models.folder import Folder
 from app.models.setting import SystemSetting
+from app.models.job import Job
 from app.core.constants import (
     MICROSOFT_TOKEN_URL,
     GOOGLE_TOKEN_URL,
@@ -37,9 +39,24 @@ from app.services.sync_helpers import (
     batch_check_existing_emails,
     truncate_email_fields
 )
+from app.services.events import notify_new_emails
+from app.services.plain_text import fill_plain_text
+from app.services.write_coalescer import persist_sync_results
+from app.services import raw_store
+from app.services.rate_limiter import (
+    rate_limiter,
+    parse_retry_after,
+    is_imap_throttle_error,
+    imap_throttle_scopes,
+    narrowest_keys,
+)
 
 logger = logging.getLogger(__name__)
 
+# 验证码查询触发的同步任务来源，只快速同步收件箱最新的几封
+CODE_LOOKUP_SOURCE = "code_lookup"
+QUICK_SYNC_LIMIT = 5
+
 # 获取代理（账户优先，其次全局）
 async def get_effective_proxy(account: EmailAccount, db: AsyncSession) -> Optional[str]:
     if account.proxy_url:
@@ -49,6 +66,17 @@ async def get_effective_proxy(account: EmailAccount, db: AsyncSession) -> Option
     setting = result.scalars().first()
     return setting.value if setting and setting.value else None
 
+
+def uses_graph_api(account: EmailAccount) -> bool:
+    """Microsoft OAuth2 账户走 Graph API，其余走 IMAP"""
+    return account.provider == ProviderType.MICROSOFT and account.auth_type == AuthType.OAUTH2
+
+
+def sync_limit_keys(account: EmailAccount, proxy_url: Optional[str]) -> List[str]:
+    """同步该账户时需要占用的限流 key (provider / 账户 / IMAP 主机 / 代理)"""
+    imap_host = None if uses_graph_api(account) else account.imap_server
+    return rate_limiter.keys_for(account.provider.value, imap_host, proxy_url, account.id)
+
 # IMAP Proxy Support
 class ProxyIMAP4_SSL(imaplib.IMAP4_SSL):
     def __init__(self, host, port=imaplib.IMAP4_SSL_PORT, proxy_url=None):
@@ -108,12 +136,16 @@ class ProxyIMAP4_SSL(imaplib.IMAP4_SSL):
 # GRAPH_URL = "https://graph.microsoft.com/v1.0"
 
 
-async def _imap_login_and_fetch(account: EmailAccount, proxy_url: Optional[str], limit: int):
+async def _imap_login_and_fetch(account: EmailAccount, proxy_url: Optional[str], limit: int, quick: bool = False):
     """运行阻塞 IMAP 逻辑在线程池"""
-    return await asyncio.to_thread(_imap_login_and_fetch_blocking, account, proxy_url, limit)
+    return await asyncio.to_thread(_imap_login_and_fetch_blocking, account, proxy_url, limit, quick)
 
 
-def _imap_login_and_fetch_blocking(account: EmailAccount, proxy_url: Optional[str], limit: int):
+def _imap_login_and_fetch_blocking(account: EmailAccount, proxy_url: Optional[str], limit: int, quick: bool = False):
+    """
+    登录并抓取邮件
+    quick=True 时只搜索收件箱中今天收到的邮件 (SEARCH SINCE)，用于验证码查询时的快速同步
+    """
     imap_server = account.imap_server
     imap_port = account.imap_port or 993
     username = account.imap_username or account.email_address
@@ -143,11 +175,16 @@ def _imap_login_and_fetch_blocking(account: EmailAccount, proxy_url: Optional[st
         folders_to_sync = FOLDER_CONFIGS["gmail"]
     else:
         folders_to_sync = FOLDER_CONFIGS["default"]
+
+    criteria = ["ALL"]
+    if quick:
+        folders_to_sync = [f for f in folders_to_sync if f[2] == "inbox"]
+        criteria = ["SINCE", datetime.utcnow().strftime("%d-%b-%Y")]
     
     for folder_path, folder_name, folder_type in folders_to_sync:
         try:
             imap.select(folder_path)
-            typ, messages = imap.search(None, "ALL")
+            typ, messages = imap.search(None, *criteria)
             if typ != "OK":
                 continue
             
@@ -161,11 +198,15 @@ def _imap_login_and_fetch_blocking(account: EmailAccount, proxy_url: Optional[st
                         continue
                     raw_email = msg_data[0][1]
                     msg = email.message_from_bytes(raw_email)
-                    # 附加文件夹信息
-                    all_results.append((eid, msg, folder_path, folder_name, folder_type))
-                except Exception:
+                    # 附加原文与文件夹信息
+                    all_results.append((eid, msg, raw_email, folder_path, folder_name, folder_type))
+                except Exception as e:
+                    if is_imap_throttle_error(e):
+                        raise
                     continue
         except Exception as e:
+            if is_imap_throttle_error(e):
+                raise
             logger.warning(f"Failed to sync folder {folder_path}: {e}")
             continue
 
@@ -223,26 +264,24 @@ def _refresh_access_token(account: EmailAccount, proxies: Optional[dict] = None)
         logger.error(f"Error refreshing token: {e}")
         return None
 
-def _decode_mime_header(header_value: Optional[str]) -> str:
-    """解码 MIME 头部"""
-    if not header_value:
-        return ""
-    decoded_parts = decode_header(header_value)
-    result = []
-    for content, encoding in decoded_parts:
-        if isinstance(content, bytes):
-            try:
-                result.append(content.decode(encoding or "utf-8", errors="ignore"))
-            except LookupError:
-                result.append(content.decode("utf-8", errors="ignore"))
-        else:
-            result.append(str(content))
-    return "".join(result)
+def _graph_recipients(msg: dict, key: str) -> str:
+    """Graph 邮件的收件人列表 (toRecipients / ccRecipients / bccRecipients) 转为逗号分隔的地址"""
+    addresses = [r.get("emailAddress", {}).get("address") for r in msg.get(key) or []]
+    return ", ".join(addr for addr in addresses if addr)
+
 
-async def sync_microsoft_graph(account: EmailAccount, db: AsyncSession, limit: int = 50, proxies: Optional[dict] = None) -> int:
+async def sync_microsoft_graph(
+    account: EmailAccount,
+    db: AsyncSession,
+    limit: int = 50,
+    proxies: Optional[dict] = None,
+    limit_keys: Optional[List[str]] = None,
+    quick: bool = False
+) -> int:
     """
     使用 Microsoft Graph API 同步邮件 (绕过 IMAP)
-    同步收件箱和垃圾箱
+    同步收件箱和垃圾箱；遇到 429/503 时按 Retry-After 反馈给限流器并停止本轮请求
+    quick=True 时只拉取收件箱今天收到的最新几封 ($filter + $top)
     """
     logger.info(f"Syncing via Graph API for {account.email_address}")
     
@@ -265,113 +304,147 @@ async def sync_microsoft_graph(account: EmailAccount, db: AsyncSession, limit: i
     
     # 使用配置中的文件夹
     folders_to_sync = FOLDER_CONFIGS["microsoft"]
+    if quick:
+        folders_to_sync = [f for f in folders_to_sync if f[2] == "inbox"]
     
     total_new_count = 0
+    throttled = False
     
-    # 预加载文件夹缓存
-    folders_cache = await load_folders_cache(db, account.id)
+    # 文件夹与邮件在账户所属用户的邮件库 (按用户分库时为其分库)
+    async with mail_store(account.user_id) as store, store.session() as mail_db:
+        await ensure_shadow_account(store, account.id, account.user_id)
+        # 预加载文件夹缓存
+        folders_cache = await load_folders_cache(mail_db, account.id)
     
-    for folder_path, folder_name, folder_type in folders_to_sync:
-        try:
-            # 使用辅助函数确保文件夹存在
-            if folder_path in folders_cache:
-                folder = folders_cache[folder_path]
-            else:
-                folder = await ensure_folder_exists(db, account.id, folder_path, folder_name, folder_type)
-                folders_cache[folder_path] = folder
+        for folder_path, folder_name, folder_type in folders_to_sync:
+            try:
+                # 使用辅助函数确保文件夹存在
+                if folder_path in folders_cache:
+                    folder = folders_cache[folder_path]
+                else:
+                    folder = await ensure_folder_exists(mail_db, account.id, folder_path, folder_name, folder_type)
+                    folders_cache[folder_path] = folder
                 
-            url = f"{GRAPH_URL}/me/mailFolders/{folder_path}/messages"
-            params = {
-                "$top": limit,
-                "$orderby": "receivedDateTime desc",
-                "$select": "id,subject,from,toRecipients,ccRecipients,bccRecipients,replyTo,body,isRead,hasAttachments,receivedDateTime,createdDateTime"
-            }
+                url = f"{GRAPH_URL}/me/mailFolders/{folder_path}/messages"
+                params = {
+                    "$top": limit,
+                    "$orderby": "receivedDateTime desc",
+                    "$select": "id,subject,from,toRecipients,ccRecipients,bccRecipients,replyTo,body,isRead,hasAttachments,receivedDateTime,createdDateTime"
+                }
+                if quick:
+                    today = datetime.utcnow().strftime("%Y-%m-%dT00:00:00Z")
+                    params["$filter"] = f"receivedDateTime ge {today}"
             
-            async with httpx.AsyncClient(proxy=proxies.get("http://") if proxies else None) as client:
-                resp = await client.get(url, headers=headers, params=params, timeout=30.0)
+                async with httpx.AsyncClient(proxy=proxies.get("http://") if proxies else None) as client:
+                    resp = await client.get(url, headers=headers, params=params, timeout=30.0)
                 
-                if resp.status_code != 200:
-                    logger.warning(f"Graph API Error for folder {folder_path}: {resp.status_code}")
-                    continue
+                    if resp.status_code in (429, 503):
+                        throttled = True
+                        retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                        # 429 按邮箱限流，只暂停该账户；503 为服务整体不可用，暂停整个 provider
+                        scopes = ("provider",) if resp.status_code == 503 else ("account",)
+                        rate_limiter.throttled(
+                            narrowest_keys(limit_keys or sync_limit_keys(account, None), scopes), retry_after
+                        )
+                        logger.warning(f"Graph API throttled for {account.email_address}: {resp.status_code}, Retry-After={retry_after}")
+                        break
+
+                    if resp.status_code != 200:
+                        logger.warning(f"Graph API Error for folder {folder_path}: {resp.status_code}")
+                        continue
                     
-                data = resp.json()
-                messages = data.get("value", [])
+                    data = resp.json()
+                    messages = data.get("value", [])
                 
-                new_count = 0
-                for msg in messages:
-                    message_id = msg.get("id")
-                    
-                    # 查重
-                    exists = await db.execute(select(Email).where(
-                        Email.account_id == account.id,
-                        Email.message_id == message_id
-                    ))
-                    if exists.scalars().first():
-                        continue
+                    # 查重 (整页一次查询；并发写入的重复由 save_new_emails 的 ON CONFLICT 兜底)
+                    existing = await batch_check_existing_emails(mail_db, account.id, [m.get("id") for m in messages])
+                    new_emails = []
+                    for msg in messages:
+                        message_id = msg.get("id")
+                        if message_id in existing:
+                            continue
                         
-                    # 解析字段
-                    subject = msg.get("subject") or "(无主题)"
-                    from_addr = msg.get("from", {}).get("emailAddress", {}).get("address", "")
-                    from_name = msg.get("from", {}).get("emailAddress", {}).get("name", "")
+                        # 解析字段
+                        subject = msg.get("subject") or "(无主题)"
+                        from_addr = msg.get("from", {}).get("emailAddress", {}).get("address", "")
+                        from_name = msg.get("from", {}).get("emailAddress", {}).get("name", "")
                     
-                    # 收件人列表
-                    to_addrs = []
-                    for recipient in msg.get("toRecipients", []):
-                        addr = recipient.get("emailAddress", {}).get("address")
-                        if addr: to_addrs.append(addr)
-                    to_str = ", ".join(to_addrs)
+                        # 收件人列表
+                        to_str = _graph_recipients(msg, "toRecipients")
+                        cc_str = _graph_recipients(msg, "ccRecipients")
+                        bcc_str = _graph_recipients(msg, "bccRecipients")
                     
-                    # Body
-                    body_content = msg.get("body", {}).get("content", "")
-                    body_type = msg.get("body", {}).get("contentType", "text").lower()
+                        # Body
+                        body_content = msg.get("body", {}).get("content", "")
+                        body_type = msg.get("body", {}).get("contentType", "text").lower()
                     
-                    body_html = body_content if body_type == "html" else None
-                    body_text = body_content if body_type == "text" else None
+                        body_html = body_content if body_type == "html" else None
+                        body_text = body_content if body_type == "text" else None
                     
-                    # 时间
-                    received_str = msg.get("receivedDateTime")
-                    received_at = datetime.fromisoformat(received_str.replace("Z", "+00:00")) if received_str else datetime.utcnow()
+                        # 时间
+                        received_str = msg.get("receivedDateTime")
+                        received_at = (
+                            datetime.fromisoformat(received_str.replace("Z", "+00:00"))
+                            .astimezone(timezone.utc).replace(tzinfo=None)  # 统一存储为不带时区的 UTC 时间
+                            if received_str else datetime.utcnow()
+                        )
                     
-                    new_email = Email(
-                        account_id=account.id,
-                        folder_id=folder.id,
-                        uid=message_id, # Graph API ID 作为 UID
-                        message_id=message_id,
-                        subject=subject[:255],
-                        from_name=from_name[:100],
-                        from_address=from_addr[:255],
-                        to_addresses=to_str[:1000],
-                        body_text=body_text[:5000] if body_text else None,
-                        body_html=body_html[:10000] if body_html else None,
-                        received_at=received_at,
-                        is_read=msg.get("isRead", False),
-                        has_attachments=msg.get("hasAttachments", False)
-                    )
-                    db.add(new_email)
-                    new_count += 1
+                        new_email = Email(
+                            account_id=account.id,
+                            folder_id=folder.id,
+                            uid=message_id, # Graph API ID 作为 UID
+                            message_id=message_id,
+                            subject=subject[:255],
+                            from_name=from_name[:100],
+                            from_address=from_addr[:255],
+                            to_addresses=to_str[:1000],
+                            cc_addresses=cc_str or None,
+                            bcc_addresses=bcc_str or None,
+                            body_text=body_text or None,
+                            body_html=body_html or None,
+                            received_at=received_at,
+                            is_read=msg.get("isRead", False),
+                            has_attachments=msg.get("hasAttachments", False)
+                        )
+                        new_emails.append(new_email)
                 
-                total_new_count += new_count
-                logger.info(f"Synced {new_count} emails from folder {folder_path}")
+                    # 每个文件夹单独写入，写事务不跨越下一次 Graph API 请求 (纯文本与摘要在事务之外计算)
+                    fill_plain_text(new_emails)
+                    new_count = await persist_sync_results(store, mail_db, account.id, new_emails)
+                    folder.last_sync_at = datetime.utcnow()
+                    total_new_count += new_count
+                    logger.info(f"Synced {new_count} emails from folder {folder_path}")
                 
-        except Exception as e:
-            logger.warning(f"Failed to sync folder {folder_path}: {e}")
-            continue
+            except Exception as e:
+                logger.warning(f"Failed to sync folder {folder_path}: {e}")
+                continue
     
+        # 文件夹的同步时间
+        await mail_db.commit()
+
     account.status = AccountStatus.ACTIVE
-    account.status_message = "正常 (API)"
-    account.last_sync_at = datetime.utcnow()
+    if throttled:
+        account.status_message = "触发限流 (API)，稍后自动重试"
+    else:
+        account.status_message = "正常 (API)"
+    if not quick:
+        # 快速同步只覆盖收件箱，不推迟下一次完整同步
+        account.last_sync_at = datetime.utcnow()
     await db.commit()
+    if total_new_count:
+        notify_new_emails(account.id)
     return total_new_count
 
 
 
-async def sync_emails(account_id: int, db: AsyncSession, limit: int = 50) -> int:
+async def sync_emails(account_id: int, db: AsyncSession, limit: int = 50, quick: bool = False) -> int:
     """
     同步指定账户的邮件 (自动分发 IMAP 或 Graph API)
+    quick=True 时只同步收件箱中今天的邮件 (验证码查询触发的快速同步)，不更新账户的 last_sync_at
     """
     result = await db.execute(select(EmailAccount).where(EmailAccount.id == account_id))
     account = result.scalars().first()
-    if not account or account.status == AccountStatus.DISABLED:
+    if not account or account.status in (AccountStatus.DISABLED, AccountStatus.DELETING):
         return 0
 
     proxy_url = await get_effective_proxy(account, db)
@@ -379,120 +452,152 @@ async def sync_emails(account_id: int, db: AsyncSession, limit: int = 50) -> int
     
     logger.info(f"[PROXY CHECK] Account {account.id} ({account.email_address}) - Proxy URL: {proxy_url}")
 
-    if account.provider == ProviderType.MICROSOFT and account.auth_type == AuthType.OAUTH2:
+    limit_keys = sync_limit_keys(account, proxy_url)
+
+    if uses_graph_api(account):
         logger.info(f"[PROXY CHECK] Using Graph API with proxies: {proxies}")
-        return await sync_microsoft_graph(account, db, limit, proxies=proxies)
+        async with rate_limiter.acquire(limit_keys):
+            return await sync_microsoft_graph(account, db, limit, proxies=proxies, limit_keys=limit_keys, quick=quick)
 
     try:
-        fetched = await _imap_login_and_fetch(account, proxy_url, limit)
+        async with rate_limiter.acquire(limit_keys):
+            fetched = await _imap_login_and_fetch(account, proxy_url, limit, quick=quick)
         # 同步成功，更新状态为 ACTIVE
         account.status = AccountStatus.ACTIVE
         account.status_message = "正常"
         await db.commit()
     except Exception as e:
+        if is_imap_throttle_error(e):
+            # 服务端限流不是账户本身的错误：反馈给限流器，保持账户状态
+            logger.warning(f"IMAP throttled for {account.email_address}: {e}")
+            rate_limiter.throttled(narrowest_keys(limit_keys, imap_throttle_scopes(e)))
+            account.status_message = f"触发限流，稍后自动重试: {str(e)}"
+            await db.commit()
+            return 0
         logger.error(f"IMAP error: {e}")
         account.status = AccountStatus.ERROR
         account.status_message = f"连接失败: {str(e)}"
         await db.commit()
         return 0
 
-    if not fetched:
-        return 0
-
-    new_count = 0
-    for eid, msg, folder_path, folder_name, folder_type in fetched:
-        try:
-            # 确保文件夹存在
-            folder_res = await db.execute(select(Folder).where(
-                Folder.account_id == account.id, Folder.path == folder_path
-            ))
-            folder = folder_res.scalars().first()
-            if not folder:
-                folder = Folder(
+    synced_at = datetime.utcnow()
+    # 文件夹与邮件在账户所属用户的邮件库 (按用户分库时为其分库)
+    async with mail_store(account.user_id) as store, store.session() as mail_db:
+        await ensure_shadow_account(store, account.id, account.user_id)
+        if quick:
+            await mail_db.execute(
+                update(Folder)
+                .where(Folder.account_id == account.id, Folder.folder_type == "inbox")
+                .values(last_sync_at=synced_at)
+            )
+            await mail_db.commit()
+
+        if not fetched:
+            return 0
+
+        folders_cache = await load_folders_cache(mail_db, account.id)
+        message_ids = [msg.get("Message-ID", "").strip() or f"{account.id}-{eid.decode()}" for eid, msg, *_ in fetched]
+        # 查重 (一次查询；并发写入的重复由 save_new_emails 的 ON CONFLICT 兜底)
+        seen = await batch_check_existing_emails(mail_db, account.id, message_ids)
+        new_emails = []
+        new_raws = []
+        for message_id, (eid, msg, raw_email, folder_path, folder_name, folder_type) in zip(message_ids, fetched):
+            try:
+                if message_id in seen:
+                    continue
+                seen.add(message_id)
+
+                # 确保文件夹存在
+                folder = folders_cache.get(folder_path)
+                if folder is None:
+                    folder = await ensure_folder_exists(mail_db, account.id, folder_path, folder_name, folder_type)
+                    folders_cache[folder_path] = folder
+
+                subject = decode_mime_header(msg.get("Subject"))
+                from_header = decode_mime_header(msg.get("From"))
+                to_header = decode_mime_header(msg.get("To"))
+                cc_header = decode_mime_header(msg.get("Cc"))
+                delivered_to = ", ".join(msg.get_all("Delivered-To", []) + msg.get_all("X-Original-To", []))
+                body_text, body_html = parse_email_body(msg)
+
+                new_emails.append(Email(
                     account_id=account.id,
-                    name=folder_name,
-                    path=folder_path,
-                    is_system=True,
-                    folder_type=folder_type
-                )
-                db.add(folder)
-                await db.commit()
-                await db.refresh(folder)
-            
-            message_id = msg.get("Message-ID", "").strip() or f"{account.id}-{eid.decode()}"
-            exists = await db.execute(select(Email).where(
-                Email.account_id == account.id,
-                Email.message_id == message_id
-            ))
-            if exists.scalars().first():
+                    folder_id=folder.id,
+                    uid=eid.decode(),
+                    message_id=message_id,
+                    subject=subject[:255] if subject else "(无主题)",
+                    from_address=from_header[:255] if from_header else "",
+                    to_addresses=to_header[:1000] if to_header else "",
+                    cc_addresses=cc_header or None,
+                    delivered_to=delivered_to or None,
+                    # 正文截断在写入 email_bodies 时进行，提取验证码 / 全文索引使用完整正文
+                    body_text=body_text or None,
+                    body_html=body_html or None,
+                    size_bytes=len(raw_email),
+                    received_at=datetime.utcnow(),
+                    is_read=False
+                ))
+                new_raws.append(raw_email)
+            except Exception as e:
+                logger.error(f"Error parsing email {eid}: {e}")
                 continue
 
-            subject = _decode_mime_header(msg.get("Subject"))
-            from_header = _decode_mime_header(msg.get("From"))
-            to_header = _decode_mime_header(msg.get("To"))
-
-            body_text = ""
-            body_html = ""
-            if msg.is_multipart():
-                for part in msg.walk():
-                    content_type = part.get_content_type()
-                    content_disposition = str(part.get("Content-Disposition"))
-                    if "attachment" not in content_disposition:
-                        payload = part.get_payload(decode=True)
-                        if payload:
-                            charset = part.get_content_charset() or "utf-8"
-                            try:
-                                decoded = payload.decode(charset, errors="ignore")
-                                if content_type == "text/html":
-                                    body_html += decoded
-                                else:
-                                    body_text += decoded
-                            except:
-                                pass
+        if new_emails and raw_store.enabled():
+            try:
+                digests = await asyncio.to_thread(raw_store.put_many, new_raws)
+            except OSError as e:
+                logger.error(f"Failed to write raw emails for account {account.id}: {e}")
             else:
-                payload = msg.get_payload(decode=True)
-                if payload:
-                    charset = msg.get_content_charset() or "utf-8"
-                    try:
-                        decoded = payload.decode(charset, errors="ignore")
-                        if msg.get_content_type() == "text/html":
-                            body_html = decoded
-                        else:
-                            body_text = decoded
-                    except:
-                        pass
-
-            new_email = Email(
-                account_id=account.id,
-                folder_id=folder.id,
-                uid=eid.decode(),
-                message_id=message_id,
-                subject=subject[:255] if subject else "(无主题)",
-                from_address=from_header[:255] if from_header else "",
-                to_addresses=to_header[:1000] if to_header else "",
-                body_text=body_text[:5000] if body_text else None,
-                body_html=body_html[:10000] if body_html else None,
-                received_at=datetime.utcnow(),
-                is_read=False
-            )
-            db.add(new_email)
-            new_count += 1
-        except Exception as e:
-            logger.error(f"Error parsing email {eid}: {e}")
-            continue
+                for email_obj, digest in zip(new_emails, digests):
+                    email_obj.raw_digest = digest
+
+        # 写事务只包含入库与提交 (IMAP 抓取、解析、渲染纯文本、写原文都在事务之外)
+        fill_plain_text(new_emails)
+        new_count = await persist_sync_results(store, mail_db, account.id, new_emails, None if quick else synced_at)
+        if new_count:
+            notify_new_emails(account.id)
+        return new_count
+
+async def run_sync_job(job: Job) -> dict:
+    """
+    任务队列中的同步任务 (由 JobRunner 在持有账户锁时调用)
+    """
+    quick = job.source == CODE_LOOKUP_SOURCE
+    if quick:
+        limit = QUICK_SYNC_LIMIT
+    else:
+        limit = 100 if job.source == "scheduled" else 50
+    async with AsyncSessionLocal() as db:
+        count = await sync_emails(job.account_id, db, limit=limit, quick=quick)
+        account = await db.get(EmailAccount, job.account_id)
+        return {
+            "new_emails": count,
+            "quick": quick,
+            "account_status": account.status.value if account else None,
+            "status_message": account.status_message if account else None,
+        }
+
+
+async def sync_retry_after(job: Job) -> float:
+    """
+    同步任务的账户还需冷却的秒数 (JobRunner 认领后、执行前检查)
+    大于 0 时任务延后放回队列，避免在 rate_limiter.acquire 中等待时占着执行槽
+    """
+    async with AsyncSessionLocal() as db:
+        account = await db.get(EmailAccount, job.account_id)
+        if account is None:
+            return 0.0
+        return rate_limiter.retry_after(sync_limit_keys(account, await get_effective_proxy(account, db)))
 
-    account.last_sync_at = datetime.utcnow()
-    await db.commit()
-    return new_count
 
-async def sync_account_task(account_id: int):
+async def sync_account_task(account_id: int, limit: int = 50):
     """
     后台任务包装器：创建独立的数据库会话并执行同步
     """
     async with AsyncSessionLocal() as db:
         try:
             logger.info(f"Starting background sync for account {account_id}")
-            count = await sync_emails(account_id, db)
+            count = await sync_emails(account_id, db, limit=limit)
             logger.info(f"Background sync finished for account {account_id}: {count} emails")
         except Exception as e:
             logger.error(f"Background sync failed for account {account_id}: {e}")
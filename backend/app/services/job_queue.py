@@ -0,0 +1,520 @@
+"""
+后台任务队列 - 去重入队、按优先级认领、账户级互斥
+
+- 入队：同一账户同一类型已有排队 / 执行中的任务时直接合并到该任务 (排队中的会提升优先级)，
+  由 jobs 表上的部分唯一索引兜底并发入队 (全局任务的 account_id 为 NULL，按 0 参与去重)。
+- 认领：按 priority DESC, id 取下一个排队任务，同一账户已有执行中的任务时跳过 (账户锁，全局任务之间同样互斥)；
+  账户任务只由负责该账户的 worker 认领 (分片与租约条件与调度器派发同步时相同)，not_before 未到的任务跳过。
+- 认领后账户仍在限流冷却中时，任务带 not_before 放回队列，不占着执行槽等待限流器。
+- 执行者定期续期 lock_expires_at；过期的执行中任务视为 worker 失联，重新排队。
+"""
+import asyncio
+import json
+import logging
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update, delete, exists, func, or_, and_, true, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.job import Job, JobStatus, JobPriority, ACTIVE_JOB_STATUSES
+from app.models.sync_lease import SyncLease
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Job], Awaitable[Optional[dict]]]
+# 返回任务还需等待的秒数 (账户限流冷却)，大于 0 时任务延后重新排队
+JobThrottle = Callable[[Job], Awaitable[float]]
+
+# 限流冷却中的任务至少延后的秒数 (避免并发已满时反复认领)
+MIN_DEFER_SECONDS = 1.0
+
+# PostgreSQL 认领任务时使用的咨询锁 ID
+CLAIM_LOCK_KEY = 0x6A6F6273
+
+# 本进程内运行的 JobRunner，入队后立即唤醒 (跨进程依赖轮询)
+_local_runners: List["JobRunner"] = []
+
+
+async def get_active_job(db: AsyncSession, kind: str, account_id: Optional[int]) -> Optional[Job]:
+    """查询账户当前排队或执行中的任务"""
+    result = await db.execute(
+        select(Job).where(
+            Job.kind == kind,
+            Job.account_id == account_id,
+            Job.status.in_(ACTIVE_JOB_STATUSES),
+        )
+    )
+    return result.scalars().first()
+
+
+async def enqueue_job(
+    db: AsyncSession,
+    kind: str,
+    account_id: Optional[int] = None,
+    *,
+    user_id: Optional[int] = None,
+    priority: int = JobPriority.SCHEDULED,
+    source: Optional[str] = None,
+) -> Tuple[Job, bool]:
+    """
+    入队任务 (会提交会话)
+    返回: (任务, 是否新建)；已有活动任务时返回该任务
+    """
+    for _ in range(2):
+        existing = await get_active_job(db, kind, account_id)
+        if existing is not None:
+            if existing.status == JobStatus.PENDING.value and priority > existing.priority:
+                # 只提升优先级，排队中的任务内容不变 (完整同步同样覆盖收件箱)
+                existing.priority = int(priority)
+                await db.commit()
+                _notify_local_runners()
+            return existing, False
+
+        job = Job(
+            kind=kind,
+            account_id=account_id,
+            user_id=user_id,
+            priority=int(priority),
+            status=JobStatus.PENDING.value,
+            source=source,
+        )
+        db.add(job)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # 并发请求先一步入队了同一账户的任务
+            await db.rollback()
+            continue
+        _notify_local_runners()
+        return job, True
+
+    raise RuntimeError(f"Failed to enqueue {kind} job for account {account_id}")
+
+
+async def enqueue_jobs(
+    db: AsyncSession,
+    kind: str,
+    account_ids: Iterable[int],
+    *,
+    priority: int = JobPriority.SCHEDULED,
+    source: Optional[str] = None,
+) -> int:
+    """批量入队 (跳过已有活动任务的账户)，返回新建的任务数"""
+    account_ids = list(account_ids)
+    if not account_ids:
+        return 0
+
+    result = await db.execute(
+        select(Job.account_id).where(
+            Job.kind == kind,
+            Job.account_id.in_(account_ids),
+            Job.status.in_(ACTIVE_JOB_STATUSES),
+        )
+    )
+    active = set(result.scalars().all())
+    new_ids = [account_id for account_id in account_ids if account_id not in active]
+    if not new_ids:
+        return 0
+
+    db.add_all([
+        Job(kind=kind, account_id=account_id, priority=int(priority), status=JobStatus.PENDING.value, source=source)
+        for account_id in new_ids
+    ])
+    try:
+        await db.commit()
+    except IntegrityError:
+        # 与其他入队请求冲突，退回逐个入队
+        await db.rollback()
+        created = 0
+        for account_id in new_ids:
+            _, is_new = await enqueue_job(db, kind, account_id, priority=priority, source=source)
+            created += int(is_new)
+        return created
+
+    _notify_local_runners()
+    return len(new_ids)
+
+
+def owned_jobs_condition(worker_id: str, shard_index: int = 0, shard_count: int = 1, leased: bool = False, now=None):
+    """
+    worker 可以认领的任务：与调度器派发同步时的条件相同 (account_id % shard_count == shard_index，
+    启用租约时还要持有该账户未过期的租约)；全局任务 (account_id 为空) 任何 worker 都可以认领
+    """
+    conditions = []
+    if shard_count > 1:
+        conditions.append(Job.account_id % shard_count == shard_index)
+    if leased:
+        conditions.append(Job.account_id.in_(
+            select(SyncLease.account_id).where(
+                SyncLease.worker_id == worker_id,
+                SyncLease.expires_at >= (now or datetime.utcnow()),
+            )
+        ))
+    if not conditions:
+        return true()
+    return or_(Job.account_id.is_(None), and_(*conditions))
+
+
+async def claim_next_job(
+    worker_id: str,
+    lock_seconds: Optional[int] = None,
+    *,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    leased: bool = False,
+) -> Optional[Job]:
+    """
+    认领下一个可执行的任务
+    跳过：同一账户已有执行中的任务、not_before 未到、不属于本 worker 的分片 / 租约的账户任务
+    """
+    now = datetime.utcnow()
+    lock_until = now + timedelta(seconds=lock_seconds or settings.job_lock_seconds)
+    running = aliased(Job)
+    # 全局任务 (account_id 为空) 按 0 比较：维护类任务 (回填、对账、保留策略等) 依次执行，不同时写库
+    account_busy = exists().where(
+        func.coalesce(running.account_id, 0) == func.coalesce(Job.account_id, 0),
+        running.status == JobStatus.RUNNING.value,
+    )
+    claimable = and_(
+        Job.status == JobStatus.PENDING.value,
+        or_(Job.not_before.is_(None), Job.not_before <= now),
+        owned_jobs_condition(worker_id, shard_index, shard_count, leased, now),
+        ~account_busy,
+    )
+
+    async with AsyncSessionLocal() as db:
+        # 失联 worker 的任务：超过重试次数则失败，否则重新排队
+        await db.execute(
+            update(Job)
+            .where(
+                Job.status == JobStatus.RUNNING.value,
+                Job.lock_expires_at < now,
+                Job.attempts >= settings.job_max_attempts,
+            )
+            .values(status=JobStatus.FAILED.value, error="执行超时或 worker 失联", finished_at=now, lock_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        await db.execute(
+            update(Job)
+            .where(Job.status == JobStatus.RUNNING.value, Job.lock_expires_at < now)
+            .values(status=JobStatus.PENDING.value, worker_id=None, lock_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        for _ in range(3):
+            if db.bind.dialect.name == "postgresql":
+                # SQLite 的写事务本身是串行的；PostgreSQL 读已提交隔离下并发认领可能都看不到对方刚认领的同账户任务，
+                # 用事务级咨询锁串行化认领 (提交时释放)
+                await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CLAIM_LOCK_KEY})
+            candidate = (await db.execute(
+                select(Job.id)
+                .where(claimable)
+                .order_by(Job.priority.desc(), Job.id)
+                .limit(1)
+            )).scalar()
+            if candidate is None:
+                return None
+
+            # 状态与账户锁在 UPDATE 中再次检查，并发认领时只有一个 worker 成功
+            result = await db.execute(
+                update(Job)
+                .where(Job.id == candidate, claimable)
+                .values(
+                    status=JobStatus.RUNNING.value,
+                    worker_id=worker_id,
+                    lock_expires_at=lock_until,
+                    started_at=now,
+                    attempts=Job.attempts + 1,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            if result.rowcount == 1:
+                return await db.get(Job, candidate)
+    return None
+
+
+async def wait_for_job(job_id: int, timeout: float, poll_interval: float = 0.5) -> Optional[Job]:
+    """等待任务结束 (最多 timeout 秒)，返回任务的最新状态"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        async with AsyncSessionLocal() as db:
+            job = await db.get(Job, job_id)
+        if job is None or job.status not in ACTIVE_JOB_STATUSES:
+            return job
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            return job
+        await asyncio.sleep(min(poll_interval, remaining))
+
+
+async def extend_job_lock(job_id: int, worker_id: str, lock_seconds: Optional[int] = None):
+    """续期任务锁"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.worker_id == worker_id, Job.status == JobStatus.RUNNING.value)
+            .values(lock_expires_at=datetime.utcnow() + timedelta(seconds=lock_seconds or settings.job_lock_seconds))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def update_job_progress(job_id: int, message: Optional[str] = None, result: Optional[dict] = None):
+    """更新执行中任务的进度信息"""
+    values = {}
+    if message is not None:
+        values["message"] = message
+    if result is not None:
+        values["result"] = json.dumps(result, ensure_ascii=False)
+    if not values:
+        return
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Job).where(Job.id == job_id).values(**values))
+        await db.commit()
+
+
+async def finish_job(job_id: int, status: JobStatus, result: Optional[dict] = None, error: Optional[str] = None):
+    """标记任务结束并释放账户锁"""
+    values = {
+        "status": status.value,
+        "finished_at": datetime.utcnow(),
+        "lock_expires_at": None,
+    }
+    if result is not None:
+        values["result"] = json.dumps(result, ensure_ascii=False)
+    if error is not None:
+        values["error"] = error[:2000]
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Job).where(Job.id == job_id).values(**values))
+        await db.commit()
+
+
+async def requeue_job(job_id: int):
+    """把未完成的任务放回队列 (worker 退出时)"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == JobStatus.RUNNING.value)
+            .values(status=JobStatus.PENDING.value, worker_id=None, lock_expires_at=None)
+        )
+        await db.commit()
+
+
+async def defer_job(job_id: int, seconds: float):
+    """把刚认领的任务放回队列，seconds 秒后才能再次认领 (不计入重试次数)"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == JobStatus.RUNNING.value)
+            .values(
+                status=JobStatus.PENDING.value,
+                worker_id=None,
+                lock_expires_at=None,
+                not_before=datetime.utcnow() + timedelta(seconds=seconds),
+                attempts=Job.attempts - 1,
+            )
+        )
+        await db.commit()
+
+
+async def close_account_jobs(db: AsyncSession, account_ids, current_job_id: Optional[int] = None):
+    """
+    账户即将被删除：结束其排队 / 执行中的任务 (不提交，与删除账户在同一事务中提交)
+    jobs.account_id 随账户删除置空，仍处于活动状态的任务会与同类型的全局任务在唯一索引上冲突；
+    account_ids 可以是 ID 列表或子查询，current_job_id 为正在执行删除的任务 (标记为成功，结果由 JobRunner 随后写入)
+    """
+    now = datetime.utcnow()
+    active = (Job.account_id.in_(account_ids), Job.status.in_(ACTIVE_JOB_STATUSES))
+    if current_job_id is not None:
+        await db.execute(
+            update(Job)
+            .where(Job.id == current_job_id, *active)
+            .values(status=JobStatus.SUCCEEDED.value, finished_at=now, lock_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+    await db.execute(
+        update(Job)
+        .where(*active)
+        .values(status=JobStatus.FAILED.value, error="账户已删除", finished_at=now, lock_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def purge_finished_jobs(db: AsyncSession, older_than: timedelta) -> int:
+    """清理已结束的历史任务"""
+    result = await db.execute(
+        delete(Job).where(
+            Job.status.not_in(ACTIVE_JOB_STATUSES),
+            Job.finished_at < datetime.utcnow() - older_than,
+        )
+    )
+    await db.commit()
+    return result.rowcount or 0
+
+
+def _notify_local_runners():
+    for runner in _local_runners:
+        runner.wake()
+
+
+class JobRunner:
+    """
+    任务执行器：并发认领并执行任务，同一账户同一时间只执行一个任务
+    shard_index / shard_count / leased 限定认领的账户任务 (与调度器相同)；
+    throttles 按任务类型检查账户是否在限流冷却中，冷却中的任务延后放回队列
+    """
+
+    def __init__(
+        self,
+        handlers: Dict[str, JobHandler],
+        worker_id: str,
+        max_concurrency: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        *,
+        shard_index: int = 0,
+        shard_count: int = 1,
+        leased: bool = False,
+        throttles: Optional[Dict[str, JobThrottle]] = None,
+    ):
+        self.handlers = handlers
+        self.worker_id = worker_id
+        self.shard_index = shard_index
+        self.shard_count = max(shard_count, 1)
+        self.leased = leased
+        self.throttles = throttles or {}
+        self._max_concurrency = max_concurrency or settings.sync_max_concurrency
+        self._poll_interval = poll_interval or settings.job_poll_interval_seconds
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+        self._in_flight: Dict[int, asyncio.Task] = {}
+        self._account_locks: Dict[int, asyncio.Lock] = {}
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._running = True
+        self._slots = asyncio.Semaphore(self._max_concurrency)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+        _local_runners.append(self)
+        logger.info(f"Job runner {self.worker_id} started with concurrency {self._max_concurrency}")
+
+    async def stop(self, drain_timeout: float = 0):
+        """停止认领新任务；drain_timeout 内等待执行中的任务完成，其余放回队列"""
+        self._running = False
+        if self in _local_runners:
+            _local_runners.remove(self)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        tasks = list(self._in_flight.values())
+        if tasks and drain_timeout > 0:
+            logger.info(f"Draining {len(tasks)} running jobs (timeout {drain_timeout}s)")
+            _, tasks = await asyncio.wait(tasks, timeout=drain_timeout)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info(f"Job runner {self.worker_id} stopped")
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _loop(self):
+        while self._running:
+            await self._slots.acquire()
+            try:
+                job = await claim_next_job(
+                    self.worker_id, shard_index=self.shard_index, shard_count=self.shard_count, leased=self.leased
+                )
+                if job is not None and await self._defer_if_throttled(job):
+                    self._slots.release()
+                    continue
+            except Exception as e:
+                logger.error(f"Failed to claim job: {e}", exc_info=True)
+                job = None
+
+            if job is None:
+                self._slots.release()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._in_flight[job.id] = asyncio.create_task(self._execute(job))
+
+    async def _defer_if_throttled(self, job: Job) -> bool:
+        """账户在限流冷却中：任务带 not_before 放回队列，执行槽留给其他账户"""
+        check = self.throttles.get(job.kind)
+        if check is None or job.account_id is None:
+            return False
+        try:
+            wait = await check(job)
+        except Exception as e:
+            logger.warning(f"Failed to check rate limit for job {job.id}: {e}")
+            return False
+        if wait <= 0:
+            return False
+        await defer_job(job.id, max(wait, MIN_DEFER_SECONDS))
+        logger.debug(f"Deferred job {job.id} ({job.kind}) for {wait:.1f}s: account {job.account_id} is rate limited")
+        return True
+
+    async def _execute(self, job: Job):
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        lock = nullcontext()
+        if job.account_id is not None:
+            lock = self._account_locks.setdefault(job.account_id, asyncio.Lock())
+        try:
+            handler = self.handlers.get(job.kind)
+            if handler is None:
+                raise RuntimeError(f"未知的任务类型: {job.kind}")
+            async with lock:
+                try:
+                    result = await handler(job)
+                finally:
+                    # 任务可能已修改账户的邮件 / 文件夹 / 状态，使该账户的列表缓存失效
+                    if job.account_id is not None:
+                        await response_cache.invalidate_account(job.account_id, job.user_id)
+            await finish_job(job.id, JobStatus.SUCCEEDED, result=result)
+        except asyncio.CancelledError:
+            await requeue_job(job.id)
+            raise
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}", exc_info=True)
+            await finish_job(job.id, JobStatus.FAILED, error=str(e))
+        finally:
+            heartbeat.cancel()
+            self._in_flight.pop(job.id, None)
+            if job.account_id is not None:
+                account_lock = self._account_locks.get(job.account_id)
+                if account_lock is not None and not account_lock.locked():
+                    self._account_locks.pop(job.account_id, None)
+            self._slots.release()
+
+    async def _heartbeat(self, job_id: int):
+        interval = max(1, settings.job_lock_seconds // 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await extend_job_lock(job_id, self.worker_id)
+            except Exception as e:
+                logger.warning(f"Failed to extend lock for job {job_id}: {e}")
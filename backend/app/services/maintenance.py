@@ -0,0 +1,420 @@
+"""
+维护任务 - 由调度器定期放入任务队列 (对账、保留策略) 或由 API 放入 (清空邮件、删除账户)，在 JobRunner 中执行
+邮件数据的读写都经过账户所属用户的邮件库 (MailStore，按用户分库时为其分库，见 app/core/shards.py)
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, update, delete, func, or_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.shards import MailStore, account_mail_store, central_store, mail_store, mail_store_ids
+from app.models.email import Email
+from app.models.email_account import EmailAccount
+from app.models.folder import Folder
+from app.models.job import Job
+from app.services.counters import CounterDeltas
+from app.services.job_queue import close_account_jobs, update_job_progress
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# 保留策略 (按天数或按数量) 下每个文件夹始终保留的最新邮件数：不少于定时同步每次抓取的最新邮件数 (run_sync_job)，
+# 否则删除的邮件会被下一次同步当作新邮件重新写入 (received_at 为重新入库的时间，旧验证码会被当作最新的返回)
+RETENTION_MIN_KEEP = 100
+# 每次 incremental_vacuum 释放的页数 (默认 4KB 页约 16MB)
+VACUUM_PAGES_PER_STEP = 4096
+# ANALYZE 时每个索引最多采样的行数 (PRAGMA analysis_limit)
+ANALYSIS_LIMIT = 1000
+# 随邮件增长且查询依赖二级索引的表；email_bodies 只按主键读取，统计它需要扫描整张表 (百万封邮件约 0.5 秒)
+ANALYZE_TABLES = ("emails", "verification_codes", "email_addresses")
+
+
+def _count_emails(*criteria, unread: bool = False):
+    criteria = criteria + (Email.is_deleted == False,)
+    if unread:
+        criteria += (Email.is_read == False,)
+    return select(func.count()).where(*criteria).scalar_subquery()
+
+
+async def reconcile_account_counters(db: AsyncSession, account_id: int) -> int:
+    """
+    按 emails 表重新统计一个账户及其文件夹的计数，只更新有偏差的行 (调用方负责提交)
+    每条 UPDATE 在语句内统计并写入，不会覆盖与之并发的增量更新
+    返回: 修正的行数
+    """
+    in_folder = (Email.account_id == Folder.account_id, Email.folder_id == Folder.id)
+    folder_total = _count_emails(*in_folder)
+    folder_unread = _count_emails(*in_folder, unread=True)
+    folders = await db.execute(
+        update(Folder)
+        .where(
+            Folder.account_id == account_id,
+            or_(Folder.total_count != folder_total, Folder.unread_count != folder_unread),
+        )
+        .values(total_count=folder_total, unread_count=folder_unread)
+        .execution_options(synchronize_session=False)
+    )
+
+    in_account = (Email.account_id == EmailAccount.id,)
+    account_total = _count_emails(*in_account)
+    account_unread = _count_emails(*in_account, unread=True)
+    account_storage = (
+        select(func.coalesce(func.sum(Email.size_bytes), 0)).where(*in_account).scalar_subquery()
+    )
+    accounts = await db.execute(
+        update(EmailAccount)
+        .where(
+            EmailAccount.id == account_id,
+            or_(
+                EmailAccount.total_emails != account_total,
+                EmailAccount.unread_count != account_unread,
+                EmailAccount.storage_used != account_storage,
+            ),
+        )
+        .values(total_emails=account_total, unread_count=account_unread, storage_used=account_storage)
+        .execution_options(synchronize_session=False)
+    )
+    return folders.rowcount + accounts.rowcount
+
+
+async def run_reconcile_counters_job(job: Job) -> dict:
+    """
+    计数器对账：逐个账户重新统计 (每个账户一个短事务，避免长时间占用写锁)
+    job.account_id 为空时处理全部账户；按用户分库时统计并修正分库中的文件夹与账户影子行
+    """
+    async with AsyncSessionLocal() as db:
+        stmt = select(EmailAccount.id, EmailAccount.user_id).order_by(EmailAccount.user_id, EmailAccount.id)
+        if job.account_id is not None:
+            stmt = stmt.where(EmailAccount.id == job.account_id)
+        accounts = (await db.execute(stmt)).all()
+
+    fixed = 0
+    by_user = {}
+    for account_id, user_id in accounts:
+        by_user.setdefault(user_id, []).append(account_id)
+    for user_id, account_ids in by_user.items():
+        async with mail_store(user_id) as store:
+            for account_id in account_ids:
+                async with store.session() as db:
+                    changed = await reconcile_account_counters(db, account_id)
+                    await db.commit()
+                if changed:
+                    fixed += changed
+                    await response_cache.invalidate(user_id, account_id)
+
+    if fixed:
+        logger.info(f"Counter reconciliation fixed {fixed} rows across {len(accounts)} accounts")
+    return {"accounts": len(accounts), "fixed": fixed}
+
+
+class Throttle:
+    """
+    维护任务的节流：每批之后按 MAINTENANCE_DUTY_CYCLE 休眠，
+    任务占用写事务的时间不超过总时间的该比例，同步与 API 的写入不会长时间排队
+    """
+
+    def __init__(self, duty_cycle: Optional[float] = None):
+        self.duty_cycle = settings.maintenance_duty_cycle if duty_cycle is None else duty_cycle
+        self.busy_seconds = 0.0
+
+    async def pause(self, started: float):
+        """一批工作结束后调用 (started 为该批开始时的 time.monotonic())"""
+        elapsed = time.monotonic() - started
+        self.busy_seconds += elapsed
+        if 0 < self.duty_cycle < 1:
+            await asyncio.sleep(elapsed * (1 - self.duty_cycle) / self.duty_cycle)
+
+
+def _expired_emails(account_id: int, folder_id: int, before: datetime, limit: int):
+    """
+    文件夹中早于 before 收到的邮件 (走 account_id, folder_id, received_at 索引)
+    最新的 RETENTION_MIN_KEEP 封即使已过期也保留 (同步仍会抓取到它们)
+    """
+    newest = (
+        select(Email.id)
+        .where(Email.account_id == account_id, Email.folder_id == folder_id)
+        .order_by(Email.received_at.desc(), Email.id.desc())
+        .limit(RETENTION_MIN_KEEP)
+    )
+    return (
+        select(Email.id)
+        .where(
+            Email.account_id == account_id,
+            Email.folder_id == folder_id,
+            Email.received_at < before,
+            Email.id.not_in(newest),
+        )
+        .limit(limit)
+    )
+
+
+def _overflow_emails(account_id: int, folder_id: int, keep: int, limit: int):
+    """文件夹中最新 keep 封之外的邮件"""
+    return (
+        select(Email.id)
+        .where(Email.account_id == account_id, Email.folder_id == folder_id)
+        .order_by(Email.received_at.desc(), Email.id.desc())
+        .offset(keep)
+        .limit(limit)
+    )
+
+
+async def delete_email_batch(store: MailStore, stmt) -> int:
+    """
+    在 store 的一个短事务中删除 stmt 选出的邮件并扣减计数器，返回删除数
+    正文、验证码、全文索引由外键级联 / 触发器删除；原始邮件文件由原文清理任务删除
+    """
+    async with store.write():
+        async with store.session() as db:
+            ids = (await db.execute(stmt)).scalars().all()
+            if not ids:
+                return 0
+            deltas = CounterDeltas()
+            await deltas.add_query(db, Email.id.in_(ids))
+            result = await db.execute(
+                delete(Email).where(Email.id.in_(ids)).execution_options(synchronize_session=False)
+            )
+            await deltas.apply(db)
+            await db.commit()
+    return result.rowcount
+
+
+async def trash_email_batch(store: MailStore, stmt) -> int:
+    """在 store 的一个短事务中把 stmt 选出的邮件移入垃圾箱并更新计数器 (占用空间不变)，返回修改数"""
+    async with store.write():
+        async with store.session() as db:
+            ids = (await db.execute(stmt)).scalars().all()
+            if not ids:
+                return 0
+            deltas = CounterDeltas()
+            await deltas.add_query(db, Email.id.in_(ids), storage=False)
+            result = await db.execute(
+                update(Email).where(Email.id.in_(ids)).values(is_deleted=True)
+                .execution_options(synchronize_session=False)
+            )
+            await deltas.apply(db)
+            await db.commit()
+    return result.rowcount
+
+
+async def apply_retention(store: MailStore, account_id: int, days: int, keep: int, throttle: Throttle) -> int:
+    """按保留策略分批删除一个账户的旧邮件 (days / keep 为 0 表示该项不限制)，返回删除数"""
+    batch_size = settings.retention_batch_size
+    before = datetime.utcnow() - timedelta(days=days) if days else None
+    if keep:
+        keep = max(keep, RETENTION_MIN_KEEP)
+
+    async with store.session() as db:
+        folder_ids = (await db.execute(
+            select(Folder.id).where(Folder.account_id == account_id).order_by(Folder.id)
+        )).scalars().all()
+
+    deleted = 0
+    for folder_id in folder_ids:
+        selectors = []
+        if before is not None:
+            selectors.append(lambda: _expired_emails(account_id, folder_id, before, batch_size))
+        if keep:
+            selectors.append(lambda: _overflow_emails(account_id, folder_id, keep, batch_size))
+        for selector in selectors:
+            while True:
+                started = time.monotonic()
+                count = await delete_email_batch(store, selector())
+                await throttle.pause(started)
+                deleted += count
+                if count < batch_size:
+                    break
+    return deleted
+
+
+async def _sqlite_pragma(db: AsyncSession, name: str) -> int:
+    return (await db.execute(text(f"PRAGMA {name}"))).scalar() or 0
+
+
+async def compact_database(throttle: Throttle, analyze: bool = True, store: MailStore = central_store) -> dict:
+    """
+    回收删除后的空间并更新查询计划统计 (store 默认为主库)
+    SQLite:
+    - auto_vacuum=INCREMENTAL 时分批执行 incremental_vacuum，把空闲页归还给文件系统；
+      旧数据库 (auto_vacuum=NONE) 的空闲页只会被后续写入复用，缩小文件需停机 VACUUM (见 DEPLOY.md)
+    - ANALYZE ANALYZE_TABLES (analysis_limit 限制采样行数，百万封邮件也只需毫秒级)
+    PostgreSQL 由 autovacuum 回收空间，只执行 ANALYZE
+    """
+    if store.engine.dialect.name != "sqlite":
+        if analyze:
+            async with store.session() as db:
+                for table in ANALYZE_TABLES:
+                    await db.execute(text(f"ANALYZE {table}"))
+                await db.commit()
+        return {"analyzed": analyze}
+
+    async with store.session() as db:
+        page_size = await _sqlite_pragma(db, "page_size")
+        pages_before = await _sqlite_pragma(db, "page_count")
+        free_before = await _sqlite_pragma(db, "freelist_count")
+        auto_vacuum = await _sqlite_pragma(db, "auto_vacuum")  # 0 NONE / 1 FULL / 2 INCREMENTAL
+
+    if auto_vacuum == 2:
+        while True:
+            started = time.monotonic()
+            async with store.write():
+                async with store.engine.connect() as conn:
+                    # incremental_vacuum 每执行一步释放一页，sqlite3 的 execute 只执行一步，需用 executescript 执行到底
+                    raw = await conn.get_raw_connection()
+                    await raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP})")
+                    free = (await conn.execute(text("PRAGMA freelist_count"))).scalar() or 0
+            await throttle.pause(started)
+            if free == 0:
+                break
+
+    if analyze:
+        started = time.monotonic()
+        async with store.write():
+            async with store.session() as db:
+                await db.execute(text(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}"))
+                for table in ANALYZE_TABLES:
+                    await db.execute(text(f"ANALYZE {table}"))
+                await db.commit()
+        await throttle.pause(started)
+
+    async with store.session() as db:
+        pages_after = await _sqlite_pragma(db, "page_count")
+        free_after = await _sqlite_pragma(db, "freelist_count")
+
+    return {
+        "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(auto_vacuum, str(auto_vacuum)),
+        "db_size_bytes": pages_after * page_size,
+        "reclaimed_bytes": (pages_before - pages_after) * page_size,
+        "free_bytes": free_after * page_size,
+        "free_bytes_before": free_before * page_size,
+        "analyzed": analyze,
+    }
+
+
+async def run_retention_job(job: Job) -> dict:
+    """
+    保留策略与空间回收 (由调度器定期放入队列)
+    1. 逐个账户按保留策略 (账户设置，未设置时使用全局 RETENTION_*) 逐个文件夹分批删除旧邮件
+    2. 回收空间并 ANALYZE (compact_database，按用户分库时主库与各分库逐个处理，空间统计为合计)
+    每批一个短事务，批与批之间按 MAINTENANCE_DUTY_CYCLE 休眠；job.account_id 不为空时只处理该账户
+    """
+    throttle = Throttle()
+    async with AsyncSessionLocal() as db:
+        stmt = select(
+            EmailAccount.id, EmailAccount.user_id, EmailAccount.retention_days, EmailAccount.retention_max_per_folder
+        ).order_by(EmailAccount.id)
+        if job.account_id is not None:
+            stmt = stmt.where(EmailAccount.id == job.account_id)
+        accounts = (await db.execute(stmt)).all()
+
+    deleted = 0
+    for account_id, user_id, days, keep in accounts:
+        days = settings.retention_days if days is None else days
+        keep = settings.retention_max_per_folder if keep is None else keep
+        if not days and not keep:
+            continue
+        async with mail_store(user_id) as store:
+            count = await apply_retention(store, account_id, days, keep, throttle)
+        if count:
+            deleted += count
+            await response_cache.invalidate(user_id, account_id)
+            await update_job_progress(job.id, message=f"已删除 {deleted} 封过期邮件")
+
+    result = {"accounts": len(accounts), "deleted": deleted}
+    result.update(await compact_database(throttle))
+    shard_ids = [user_id for user_id in mail_store_ids() if user_id is not None]
+    for user_id in shard_ids:
+        async with mail_store(user_id) as store:
+            stats = await compact_database(throttle, store=store)
+        for name in ("db_size_bytes", "reclaimed_bytes", "free_bytes", "free_bytes_before"):
+            result[name] = result.get(name, 0) + stats.get(name, 0)
+    if shard_ids:
+        result["shards"] = len(shard_ids)
+    result["busy_seconds"] = round(throttle.busy_seconds, 3)
+    if deleted or result.get("reclaimed_bytes"):
+        logger.info(
+            f"Retention deleted {deleted} emails, reclaimed {result.get('reclaimed_bytes', 0) // (1024 * 1024)}MB "
+            f"({result.get('free_bytes', 0) // (1024 * 1024)}MB still free in database file)"
+        )
+    return result
+
+
+async def _run_in_batches(job: Job, store: MailStore, criteria, apply_batch, key: str, verb: str) -> dict:
+    """
+    分批处理 store 中符合 criteria 的邮件，直到没有剩余 (每批之后按 MAINTENANCE_DUTY_CYCLE 休眠)
+    进度写入任务的 message / result，任务中断后重新认领时累计数从 result 继续
+    """
+    progress = json.loads(job.result) if job.result else {}
+    done = progress.get(key, 0)
+    async with store.session() as db:
+        remaining = (await db.execute(select(func.count()).select_from(Email).where(*criteria))).scalar()
+    total = done + remaining
+
+    batch_size = settings.retention_batch_size
+    throttle = Throttle()
+    while True:
+        started = time.monotonic()
+        count = await apply_batch(store, select(Email.id).where(*criteria).limit(batch_size))
+        await throttle.pause(started)
+        if count:
+            done += count
+            await update_job_progress(
+                job.id, message=f"已{verb} {done} / {total} 封邮件", result={key: done, "total": total}
+            )
+        if count < batch_size:
+            break
+    return {key: done, "total": max(total, done)}
+
+
+async def run_clear_inbox_job(job: Job) -> dict:
+    """清空收件箱：把账户中未删除的邮件分批移入垃圾箱"""
+    criteria = (Email.account_id == job.account_id, Email.is_deleted == False)
+    async with account_mail_store(job.account_id) as store:
+        if store is None:
+            return {"trashed": 0, "total": 0}
+        return await _run_in_batches(job, store, criteria, trash_email_batch, "trashed", "移入垃圾箱")
+
+
+async def run_clear_trash_job(job: Job) -> dict:
+    """清空垃圾箱：分批彻底删除账户中已删除的邮件"""
+    criteria = (Email.account_id == job.account_id, Email.is_deleted == True)
+    async with account_mail_store(job.account_id) as store:
+        if store is None:
+            return {"deleted": 0, "total": 0}
+        return await _run_in_batches(job, store, criteria, delete_email_batch, "deleted", "删除")
+
+
+async def run_delete_account_job(job: Job) -> dict:
+    """
+    删除账户：先分批删除邮件，最后删除账户 (文件夹、租约等由外键级联删除，删除账户的事务很小)
+    账户已被删除时 (任务的 account_id 已被置空) 直接结束；按用户分库时先删除分库中的影子行 (级联删除文件夹)
+    """
+    if job.account_id is None:
+        return {"deleted": 0, "total": 0}
+    async with account_mail_store(job.account_id) as store:
+        if store is None:
+            return {"deleted": 0, "total": 0}
+        result = await _run_in_batches(
+            job, store, (Email.account_id == job.account_id,), delete_email_batch, "deleted", "删除"
+        )
+        if store.sharded:
+            async with store.write():
+                async with store.session() as db:
+                    await db.execute(delete(EmailAccount).where(EmailAccount.id == job.account_id))
+                    await db.commit()
+            store.shadow_accounts.discard(job.account_id)
+    async with central_store.write():
+        async with AsyncSessionLocal() as db:
+            # 账户的其他活动任务 (及本任务) 与账户一起结束，置空 account_id 后不与全局任务冲突
+            await close_account_jobs(db, [job.account_id], current_job_id=job.id)
+            await db.execute(delete(EmailAccount).where(EmailAccount.id == job.account_id))
+            await db.commit()
+    logger.info(f"Deleted account {job.account_id} ({result['deleted']} emails)")
+    return result
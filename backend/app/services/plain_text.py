@@ -0,0 +1,69 @@
+"""
+邮件纯文本 - 同步入库时把正文渲染为规范化的纯文本并生成摘要
+
+- 有 HTML 正文时以 HTML 渲染结果为准 (与邮件客户端显示的内容一致)，否则使用纯文本正文
+- 去掉 style / script / head 与注释，块级标签转为换行，其余标签去掉，解码实体 (&nbsp; &amp; ...)
+- 去掉零宽字符 (营销邮件的预览占位)，合并空白，去掉空行
+纯文本压缩存入 email_bodies.plain_data，摘要存入 emails.snippet (列表直接返回)；
+全文索引与验证码提取使用同一份纯文本，不再各自去除 HTML
+"""
+import html
+import re
+from typing import Iterable, Optional
+
+from app.core.constants import SNIPPET_LENGTH
+
+# 先去掉 style / script / 注释 (CSS 颜色 #123456 之类会被误认为验证码)，再去标签
+HTML_BLOCK_PATTERN = re.compile(r'<(style|script|head)\b.*?</\1\s*>|<!--.*?-->', re.IGNORECASE | re.DOTALL)
+HTML_BREAK_PATTERN = re.compile(r'<(?:br|/?(?:p|div|li|tr|h[1-6]|table|ul|ol|blockquote))\b[^>]*>', re.IGNORECASE)
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+INVISIBLE_PATTERN = re.compile('[\u00ad\u034f\u200b-\u200d\u2060\ufeff]')
+SPACES_PATTERN = re.compile(r'[^\S\n]+')
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """去掉零宽字符，每行合并空白，去掉空行"""
+    if not value:
+        return ""
+    value = SPACES_PATTERN.sub(' ', INVISIBLE_PATTERN.sub('', value))
+    return "\n".join(line for line in (line.strip() for line in value.splitlines()) if line)
+
+
+def html_to_text(html_str: Optional[str]) -> str:
+    if not html_str:
+        return ""
+    text = HTML_BLOCK_PATTERN.sub(' ', html_str)
+    text = HTML_BREAK_PATTERN.sub('\n', text)
+    text = HTML_TAG_PATTERN.sub(' ', text)
+    return normalize_text(html.unescape(text))
+
+
+def render_plain_text(body_text: Optional[str], body_html: Optional[str]) -> str:
+    """邮件的纯文本 (有 HTML 时为 HTML 的渲染结果)"""
+    if body_html:
+        return html_to_text(body_html)
+    return normalize_text(body_text)
+
+
+def make_snippet(plain_text: str) -> Optional[str]:
+    """列表预览：纯文本合并为一行后取前 SNIPPET_LENGTH 个字符 (没有正文时为 None)"""
+    if not plain_text:
+        return None
+    snippet = plain_text.replace("\n", " ")
+    if len(snippet) > SNIPPET_LENGTH:
+        snippet = snippet[:SNIPPET_LENGTH - 1].rstrip() + "…"
+    return snippet
+
+
+def plain_text_of(email) -> str:
+    """邮件的纯文本 (已由入库流程或 load_bodies 填充时直接返回，否则按正文渲染)"""
+    if email.plain_text is None:
+        email.plain_text = render_plain_text(email.body_text, email.body_html)
+    return email.plain_text
+
+
+def fill_plain_text(emails: Iterable) -> None:
+    """为待入库的新邮件计算纯文本与摘要 (在写事务之外调用；save_new_emails 对漏掉的邮件兜底)"""
+    for email in emails:
+        if email.snippet is None:
+            email.snippet = make_snippet(plain_text_of(email))
@@ -0,0 +1,326 @@
+"""
+同步限流器 - 按 Provider / IMAP 主机 / 代理 维度的令牌桶与并发上限
+
+Outlook / Gmail 会按来源 IP 和租户限流，所以每次同步前需要同时获取
+该账户涉及的所有维度 (provider:xxx, imap:host, proxy:host) 的令牌和并发名额，
+另有 account:id 维度 (默认不限速) 用于记录单个账户的冷却。
+服务端返回的限流信号 (Graph 429 / Retry-After、IMAP THROTTLED 等) 通过
+throttled() 反馈回来，只暂停触发限流的最小维度 (narrowest_keys)：单个邮箱的限流只暂停该账户，
+来源 IP 的连接数限制暂停代理 / IMAP 主机，服务整体不可用时才暂停整个 provider。
+
+令牌桶与并发名额在进程内：多个进程同步时 (独立 Worker 的各个进程、多个节点、WEB_CONCURRENCY > 1 的内嵌调度器)
+配置的上限按进程数平分 (share_among，进程数由 RATE_LIMIT_PROCESSES 指定，未指定时为本机的同步进程数)，
+各进程合计不超过配置值。冷却状态不在进程之间共享：按账户分片后账户维度的冷却只在负责该账户的进程内有效，
+IMAP 主机 / 代理的冷却由各进程分别从服务端的限流信号得知。
+"""
+import asyncio
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# IMAP 服务器返回的限流特征 (不区分大小写) -> 应暂停的维度 (按顺序取该次同步涉及的第一个)
+IMAP_THROTTLE_MARKERS = {
+    "throttl": ("account",),                 # Outlook "Request is throttled" (按邮箱) / Gmail "[THROTTLED]" (按用户)
+    "too many simultaneous": ("account",),   # Gmail 同一账户并发连接过多
+    "too many login": ("account",),          # 同一账户登录过于频繁
+    "too many connections": ("proxy", "imap"),  # 来源 IP 连接过多
+    "[unavailable]": ("imap",),              # 服务器临时不可用
+    "try again later": ("account",),
+}
+
+
+@dataclass
+class LimitConfig:
+    """单个限流维度的配置 (rate: 每秒令牌数, burst: 桶容量, concurrency: 并发上限; 0 表示不限制)"""
+    rate: float = 0.0
+    burst: float = 1.0
+    concurrency: int = 0
+
+
+def _shared_config(config: LimitConfig, processes: int) -> LimitConfig:
+    """把整体上限平分给 processes 个进程 (每个进程至少 1 个并发名额、1 个令牌的桶容量)"""
+    if processes <= 1:
+        return config
+    return LimitConfig(
+        rate=config.rate / processes,
+        burst=max(config.burst / processes, 1.0),
+        concurrency=math.ceil(config.concurrency / processes) if config.concurrency > 0 else 0,
+    )
+
+
+class TokenBucket:
+    """令牌桶"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """距离可以取出 tokens 个令牌还需等待的秒数"""
+        now = time.monotonic()
+        self._refill(now)
+        blocked = max(0.0, self.blocked_until - now)
+        if self.rate <= 0 or self.tokens >= tokens:
+            return blocked
+        return max(blocked, (tokens - self.tokens) / self.rate)
+
+    def consume(self, tokens: float = 1.0):
+        self._refill(time.monotonic())
+        if self.rate > 0:
+            self.tokens -= tokens
+
+    def block(self, seconds: float):
+        """被服务端限流：清空令牌并暂停 seconds 秒"""
+        now = time.monotonic()
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated_at = now
+
+
+class _KeyState:
+    """单个 key 的运行时状态"""
+
+    def __init__(self, config: LimitConfig):
+        self.config = config
+        self.bucket = TokenBucket(config.rate, config.burst)
+        self.semaphore = asyncio.Semaphore(config.concurrency) if config.concurrency > 0 else None
+        self.in_flight = 0
+        self.strikes = 0             # 连续被限流次数，用于指数退避
+        self.last_throttled_at = 0.0
+        self.throttle_count = 0
+
+
+class RateLimiter:
+    """多维度同步限流器"""
+
+    def __init__(
+        self,
+        scopes: Dict[str, LimitConfig],
+        overrides: Optional[Dict[str, LimitConfig]] = None,
+        enabled: bool = True,
+        backoff_seconds: float = 60,
+        max_backoff_seconds: float = 900,
+    ):
+        self.scopes = scopes
+        self.overrides = overrides or {}
+        self.enabled = enabled
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.processes = 1
+        self._states: Dict[str, _KeyState] = {}
+
+    def share_among(self, processes: int):
+        """配置的上限由 processes 个进程共同使用：每个进程只使用 1/processes (在开始同步前调用)"""
+        self.processes = max(processes, 1)
+        self._states.clear()
+        if self.processes > 1:
+            logger.info(f"Rate limits shared among {self.processes} processes")
+
+    def _state(self, key: str) -> _KeyState:
+        state = self._states.get(key)
+        if state is None:
+            scope = key.split(":", 1)[0]
+            config = self.overrides.get(key) or self.scopes.get(scope) or LimitConfig()
+            state = _KeyState(_shared_config(config, self.processes))
+            self._states[key] = state
+        return state
+
+    @staticmethod
+    def keys_for(
+        provider: str,
+        imap_host: Optional[str] = None,
+        proxy_url: Optional[str] = None,
+        account_id: Optional[int] = None,
+    ) -> List[str]:
+        """生成一次同步涉及的限流 key"""
+        keys = [f"provider:{provider}"]
+        if account_id is not None:
+            keys.append(f"account:{account_id}")
+        if imap_host:
+            keys.append(f"imap:{imap_host.lower()}")
+        if proxy_url:
+            keys.append(f"proxy:{_proxy_identity(proxy_url)}")
+        return keys
+
+    def retry_after(self, keys: Iterable[str]) -> float:
+        """返回这些 key 还需冷却的秒数 (0 表示可以立即调度)"""
+        if not self.enabled:
+            return 0.0
+        wait = 0.0
+        for key in keys:
+            state = self._state(key)
+            wait = max(wait, state.bucket.wait_time())
+            if state.semaphore is not None and state.semaphore.locked():
+                # 并发已满，给一个很短的等待提示，调度器下一轮再尝试
+                wait = max(wait, 0.1)
+        return wait
+
+    @asynccontextmanager
+    async def acquire(self, keys: Iterable[str]):
+        """获取所有 key 的并发名额和一个令牌，退出时释放并发名额"""
+        if not self.enabled:
+            yield
+            return
+
+        # 固定顺序获取信号量，避免多个任务交叉持有造成死锁
+        ordered = sorted(set(keys))
+        states = [self._state(k) for k in ordered]
+        acquired = []
+        try:
+            for state in states:
+                if state.semaphore is not None:
+                    await state.semaphore.acquire()
+                    acquired.append(state)
+
+            while True:
+                wait = max((s.bucket.wait_time() for s in states), default=0.0)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            for state in states:
+                state.bucket.consume()
+                state.in_flight += 1
+
+            entered_at = time.monotonic()
+            try:
+                yield
+            finally:
+                for state in states:
+                    state.in_flight -= 1
+                    # 本次同步期间没有被限流，重置退避计数
+                    if state.last_throttled_at < entered_at:
+                        state.strikes = 0
+        finally:
+            for state in acquired:
+                state.semaphore.release()
+
+    def throttled(self, keys: Iterable[str], retry_after: Optional[float] = None):
+        """服务端限流反馈：按 Retry-After 或指数退避暂停这些 key"""
+        if not self.enabled:
+            return
+        for key in keys:
+            state = self._state(key)
+            state.strikes += 1
+            state.throttle_count += 1
+            state.last_throttled_at = time.monotonic()
+            if retry_after and retry_after > 0:
+                seconds = min(float(retry_after), self.max_backoff_seconds)
+            else:
+                seconds = min(self.backoff_seconds * (2 ** (state.strikes - 1)), self.max_backoff_seconds)
+            state.bucket.block(seconds)
+            logger.warning(f"Rate limit: {key} throttled, pausing for {seconds:.0f}s")
+
+    def stats(self) -> Dict[str, dict]:
+        """各 key 的当前状态 (用于监控)"""
+        now = time.monotonic()
+        return {
+            key: {
+                "in_flight": state.in_flight,
+                "tokens": round(state.bucket.tokens, 2),
+                "blocked_for": round(max(0.0, state.bucket.blocked_until - now), 1),
+                "throttle_count": state.throttle_count,
+            }
+            for key, state in self._states.items()
+        }
+
+
+def _proxy_identity(proxy_url: str) -> str:
+    """代理的限流标识：保留用户名 (轮换代理按用户名分配出口 IP)，去掉密码"""
+    parsed = urlparse(proxy_url)
+    host = parsed.hostname or proxy_url
+    port = f":{parsed.port}" if parsed.port else ""
+    user = f"{parsed.username}@" if parsed.username else ""
+    return f"{user}{host}{port}"
+
+
+def narrowest_keys(keys: Iterable[str], scopes: Iterable[str] = ("account",)) -> List[str]:
+    """
+    限流反馈应暂停的 key：按 scopes 顺序取 keys 中第一个存在的维度
+    (都不存在时退回账户维度，没有账户维度时才暂停全部 key)
+    """
+    keys = list(keys)
+    by_scope = {key.split(":", 1)[0]: key for key in keys}
+    for scope in (*scopes, "account"):
+        if scope in by_scope:
+            return [by_scope[scope]]
+    return keys
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头 (仅支持秒数格式)"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def imap_throttle_scopes(exc: BaseException) -> Optional[tuple]:
+    """IMAP 异常为服务端限流时返回应暂停的维度，否则返回 None"""
+    message = str(exc).lower()
+    for marker, scopes in IMAP_THROTTLE_MARKERS.items():
+        if marker in message:
+            return scopes
+    return None
+
+
+def is_imap_throttle_error(exc: BaseException) -> bool:
+    """判断 IMAP 异常是否为服务端限流"""
+    return imap_throttle_scopes(exc) is not None
+
+
+def _build_rate_limiter() -> RateLimiter:
+    scopes = {
+        "provider": LimitConfig(
+            settings.rate_limit_provider_rate,
+            settings.rate_limit_provider_burst,
+            settings.rate_limit_provider_concurrency,
+        ),
+        "imap": LimitConfig(
+            settings.rate_limit_imap_host_rate,
+            settings.rate_limit_imap_host_burst,
+            settings.rate_limit_imap_host_concurrency,
+        ),
+        "proxy": LimitConfig(
+            settings.rate_limit_proxy_rate,
+            settings.rate_limit_proxy_burst,
+            settings.rate_limit_proxy_concurrency,
+        ),
+    }
+    overrides = {key: LimitConfig(**value) for key, value in settings.rate_limit_overrides.items()}
+    limiter = RateLimiter(
+        scopes,
+        overrides,
+        enabled=settings.rate_limit_enabled,
+        backoff_seconds=settings.rate_limit_throttle_backoff_seconds,
+        max_backoff_seconds=settings.rate_limit_throttle_max_backoff_seconds,
+    )
+    # API 进程内的调度器：WEB_CONCURRENCY 个进程各运行一个 (独立 Worker 启动时按其进程数重新设置)
+    limiter.share_among(settings.rate_limit_processes or settings.web_concurrency)
+    return limiter
+
+
+def share_among_sync_processes(local_processes: int):
+    """独立 Worker 进程启动时调用：按 RATE_LIMIT_PROCESSES (所有节点合计) 或本机的 Worker 进程数平分上限"""
+    rate_limiter.share_among(settings.rate_limit_processes or local_processes)
+
+
+# 全局实例 (进程内共享，上限按进程数平分)
+rate_limiter = _build_rate_limiter()
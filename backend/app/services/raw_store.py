@@ -0,0 +1,222 @@
+"""
+原始邮件存储 - RFC822 原文按内容寻址保存在磁盘
+
+- 文件名为原文的 SHA-256 (emails.raw_digest)，按摘要前两级分目录: <root>/ab/cd/abcd....eml
+  同一封邮件转发到多个账户 / 重复同步时只保存一份
+- 写入先写临时文件再原子改名，并发写入同一摘要互不影响
+- 读取使用 mmap，解析与下载直接使用页缓存中的数据
+- 删除邮件时不删除文件，由定期清理任务 (run_raw_store_gc_job) 删除已无邮件引用的原文
+
+除清理任务外都是阻塞的文件操作，在异步代码中通过 asyncio.to_thread 调用
+"""
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from email.message import Message
+from email.parser import Parser
+from email.policy import compat32
+from typing import Iterator, List, Optional, Sequence
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.shards import mail_store, mail_store_ids
+from app.models.email import Email
+from app.models.job import Job
+from app.services.sync_helpers import decode_mime_header, parse_email_body
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = ".eml"
+STREAM_CHUNK_SIZE = 64 * 1024
+GC_BATCH_SIZE = 500
+# 清理时跳过最近写入的文件：同步时先写原文、后提交邮件，刚写入的文件可能还没有邮件引用
+GC_GRACE_SECONDS = 3600
+
+
+def enabled() -> bool:
+    return settings.raw_store_enabled
+
+
+def digest_path(digest: str) -> str:
+    return os.path.join(settings.raw_store_dir, digest[:2], digest[2:4], digest + SUFFIX)
+
+
+def put(raw: bytes) -> str:
+    """保存原文，返回摘要 (内容相同的文件已存在时直接返回)"""
+    digest = hashlib.sha256(raw).hexdigest()
+    path = digest_path(digest)
+    try:
+        # 已存在：更新修改时间，避免清理任务在新邮件提交前把它当作无引用文件删除
+        os.utime(path)
+        return digest
+    except FileNotFoundError:
+        pass
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return digest
+
+
+def put_many(raws: Sequence[bytes]) -> List[str]:
+    return [put(raw) for raw in raws]
+
+
+@contextmanager
+def open_raw(digest: str) -> Iterator[Optional[mmap.mmap]]:
+    """以 mmap 只读打开原文 (文件不存在时为 None)"""
+    try:
+        f = open(digest_path(digest), "rb")
+    except FileNotFoundError:
+        yield None
+        return
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield None
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+def load_message(digest: str) -> Optional[Message]:
+    """读取并解析原文 (与 email.message_from_bytes 相同，但直接从 mmap 解码，不复制出一份 bytes)"""
+    with open_raw(digest) as mm:
+        if mm is None:
+            return None
+        return Parser(policy=compat32).parsestr(str(mm, "ascii", "surrogateescape"))
+
+
+def iter_raw(digest: str) -> Iterator[bytes]:
+    """分块读取原文，用于下载 (StreamingResponse 在线程池中迭代)"""
+    with open_raw(digest) as mm:
+        if mm is None:
+            return
+        for start in range(0, len(mm), STREAM_CHUNK_SIZE):
+            yield mm[start:start + STREAM_CHUNK_SIZE]
+
+
+def raw_size(digest: str) -> Optional[int]:
+    try:
+        return os.path.getsize(digest_path(digest))
+    except FileNotFoundError:
+        return None
+
+
+def attachment_parts(message: Message) -> List[Message]:
+    """附件 (带文件名或 Content-Disposition: attachment 的非 multipart 部分)，按出现顺序编号"""
+    parts = []
+    for part in message.walk():
+        if part.is_multipart():
+            continue
+        if part.get_filename() or part.get_content_disposition() == "attachment":
+            parts.append(part)
+    return parts
+
+
+def message_details(digest: str) -> Optional[dict]:
+    """按原文解析完整正文与附件列表 (原文不存在时返回 None)"""
+    message = load_message(digest)
+    if message is None:
+        return None
+    body_text, body_html = parse_email_body(message)
+    attachments = [
+        {
+            "index": index,
+            "filename": decode_mime_header(part.get_filename()) or f"attachment-{index}",
+            "content_type": part.get_content_type(),
+            "size": len(part.get_payload(decode=True) or b""),
+        }
+        for index, part in enumerate(attachment_parts(message))
+    ]
+    return {"body_text": body_text or None, "body_html": body_html or None, "attachments": attachments}
+
+
+def read_attachment(digest: str, index: int) -> Optional[tuple]:
+    """第 index 个附件 (文件名, Content-Type, 内容)；原文或附件不存在时返回 None"""
+    message = load_message(digest)
+    if message is None:
+        return None
+    parts = attachment_parts(message)
+    if not 0 <= index < len(parts):
+        return None
+    part = parts[index]
+    filename = decode_mime_header(part.get_filename()) or f"attachment-{index}"
+    return filename, part.get_content_type(), part.get_payload(decode=True) or b""
+
+
+def _shard_dirs() -> List[str]:
+    root = settings.raw_store_dir
+    if not os.path.isdir(root):
+        return []
+    return [entry.path for entry in os.scandir(root) if entry.is_dir()]
+
+
+def _scan_shard(shard: str, cutoff: float) -> List[tuple]:
+    """一个一级目录下早于 cutoff 的原文 [(摘要, 路径)]"""
+    files = []
+    for level2 in os.scandir(shard):
+        if not level2.is_dir():
+            continue
+        for entry in os.scandir(level2.path):
+            if entry.name.endswith(SUFFIX) and entry.stat().st_mtime < cutoff:
+                files.append((entry.name[:-len(SUFFIX)], entry.path))
+    return files
+
+
+def _remove(paths: Sequence[str]) -> int:
+    removed = 0
+    for path in paths:
+        try:
+            os.unlink(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+async def run_raw_store_gc_job(job: Job) -> dict:
+    """
+    清理已没有邮件引用的原文
+    逐个一级目录扫描 (内存只保留一个目录的文件列表)，按批检查摘要是否仍被 emails.raw_digest 引用
+    (按用户分库时检查所有分库)，只删除超过 GC_GRACE_SECONDS 未写入的文件
+    """
+    if not enabled():
+        return {"scanned": 0, "removed": 0}
+    cutoff = time.time() - GC_GRACE_SECONDS
+    scanned = 0
+    removed = 0
+    for shard in await asyncio.to_thread(_shard_dirs):
+        files = dict(await asyncio.to_thread(_scan_shard, shard, cutoff))
+        scanned += len(files)
+        # 逐个邮件库排除仍被引用的摘要，剩下的即为孤儿文件
+        for store_id in mail_store_ids():
+            if not files:
+                break
+            async with mail_store(store_id) as store, store.read_session() as db:
+                digests = list(files)
+                for start in range(0, len(digests), GC_BATCH_SIZE):
+                    batch = digests[start:start + GC_BATCH_SIZE]
+                    result = await db.execute(select(Email.raw_digest).where(Email.raw_digest.in_(batch)).distinct())
+                    for digest in result.scalars().all():
+                        files.pop(digest, None)
+        if files:
+            removed += await asyncio.to_thread(_remove, list(files.values()))
+
+    if removed:
+        logger.info(f"Raw store GC removed {removed} of {scanned} files")
+    return {"scanned": scanned, "removed": removed}
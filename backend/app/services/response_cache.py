@@ -0,0 +1,314 @@
+"""
+列表接口响应缓存 - GET /emails、/folders、/accounts 的响应按用户与规范化的查询参数缓存
+
+失效方式：每个账户与每个用户各有一个版本号，缓存 key 中带上查询时的版本号
+- 带 account_id 的查询使用该账户的版本号，其余查询使用用户的版本号
+- 同步 / 清空 / 删除 / 保留策略等后台任务结束时 (JobRunner) 与 API 修改邮件、账户后调用 invalidate，
+  同时递增账户与用户的版本号，旧版本的缓存不再命中，由 TTL / LRU 自然淘汰
+- 先读版本号再查询：查询期间发生的修改会递增版本号，写入的缓存不会被之后的请求命中
+
+后端：
+- 默认为进程内 TTL LRU，版本号也在进程内，只适用于单个 API 进程：WEB_CONCURRENCY > 1 时不缓存响应
+  (也不带 ETag)，避免各进程的缓存互不失效；使用独立 Worker 时，Worker 的修改不会使 API 进程的缓存失效，
+  最多在 RESPONSE_CACHE_TTL_SECONDS 内返回旧数据
+- REDIS_ENABLED=true 时缓存与版本号都在 Redis 中 (需安装 redis)，所有进程共享，
+  缓存条目按 TTL 过期，内存上限由 Redis 的 maxmemory 策略控制
+Redis 出错时本次请求不使用缓存 (直接查询数据库)，不会返回旧数据
+
+条件请求：响应带弱 ETag (由同一个 key 计算，即用户、版本号与查询参数)，
+请求的 If-None-Match 与之相同时在查询数据库之前直接返回 304。304 必须表示数据未变化，
+所以只在版本号能反映所有修改时才带 ETag：
+- Redis 后端：版本号由所有进程共享
+- 进程内后端：只有一个 API 进程 (WEB_CONCURRENCY=1) 且同步在本进程内执行 (SYNC_EMBEDDED_SCHEDULER=true)，
+  所有修改都经过本进程；版本号以进程启动时间为初始值，重启前的 ETag 不会与重启后的相同
+其余情况 (多个 API 进程或独立 Worker 而未启用 Redis) 不带 ETag，每次都返回完整响应
+
+命中率与 304 次数按接口统计，见 /api/v1/metrics
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.email_account import EmailAccount
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # 可选依赖，未安装时使用进程内缓存
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ("emails", "folders", "accounts")
+REDIS_PREFIX = "mailbox:"
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match (可能为逗号分隔的多个值或 *) 是否包含 etag (弱比较，忽略 W/ 前缀)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tag = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == tag for candidate in if_none_match.split(","))
+
+
+def normalize_params(params: dict) -> str:
+    """查询参数规范化：去掉未传的 (None) 参数，按名称排序 (参数顺序、是否显式传默认值都不影响 key)"""
+    items = sorted((name, value) for name, value in params.items() if value is not None)
+    return json.dumps(items, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+@dataclass
+class CacheLookup:
+    """一次缓存查询的结果 (key 为空表示本次不使用缓存，etag 为空表示本次不带 ETag)"""
+    scope: str
+    key: Optional[str] = None
+    etag: Optional[str] = None
+    not_modified: bool = False
+    value: Optional[dict] = None
+
+    @property
+    def hit(self) -> bool:
+        return self.value is not None
+
+    def headers(self) -> Dict[str, str]:
+        """响应头：ETag，并要求客户端每次使用缓存前重新验证"""
+        if self.etag is None:
+            return {}
+        return {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+
+    async def store(self, value: dict):
+        """写入本次查询的响应 (未命中时由调用方在查询数据库后调用)"""
+        if self.key is not None:
+            await response_cache.set(self.key, value)
+
+
+class LocalBackend:
+    """进程内 TTL LRU：条目超过 max_entries 时淘汰最久未使用的；版本号只在本进程内递增"""
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        # 版本号的初始值：重启后的版本号 (及 ETag) 与重启前的不会重复
+        self._epoch = time.time_ns()
+
+    async def get_version(self, name: str) -> int:
+        return self._versions.get(name, self._epoch)
+
+    async def bump(self, names: List[str]):
+        for name in names:
+            self._versions[name] = self._versions.get(name, self._epoch) + 1
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: dict, ttl: int):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > max(settings.response_cache_max_entries, 1):
+            self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def versions_shared(self) -> bool:
+        # 版本号看不到其他进程的修改：只有单个 API 进程且同步也在本进程内执行时才能反映所有修改
+        return settings.web_concurrency <= 1 and settings.sync_embedded_scheduler
+
+
+class RedisBackend:
+    """Redis：版本号用 INCR 递增 (不存在时先以当前时间初始化)，缓存条目为带过期时间的 JSON"""
+
+    def __init__(self, url: str):
+        self._client = aioredis.from_url(url)
+
+    async def get_version(self, name: str) -> int:
+        key = REDIS_PREFIX + name
+        value = await self._client.get(key)
+        if value is None:
+            await self._client.set(key, time.time_ns(), nx=True)
+            value = await self._client.get(key)
+        return int(value)
+
+    async def bump(self, names: List[str]):
+        async with self._client.pipeline(transaction=False) as pipe:
+            for name in names:
+                pipe.set(REDIS_PREFIX + name, time.time_ns(), nx=True)
+                pipe.incr(REDIS_PREFIX + name)
+            await pipe.execute()
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = await self._client.get(REDIS_PREFIX + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: dict, ttl: int):
+        raw = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+        await self._client.set(REDIS_PREFIX + key, raw, ex=ttl)
+
+    def size(self) -> Optional[int]:
+        return None
+
+    def versions_shared(self) -> bool:
+        return True
+
+
+@dataclass
+class _ScopeStats:
+    hits: int = 0
+    misses: int = 0
+    errors: int = 0
+    not_modified: int = 0
+
+
+class ResponseCache:
+    """列表接口的响应缓存 (后端在首次使用时按配置创建)"""
+
+    def __init__(self):
+        self._backend = None
+        self._owners: Dict[int, int] = {}
+        self._stats: Dict[str, _ScopeStats] = defaultdict(_ScopeStats)
+
+    @property
+    def enabled(self) -> bool:
+        if not settings.response_cache_enabled or settings.response_cache_ttl_seconds <= 0:
+            return False
+        # 进程内缓存在多个 API 进程之间不共享失效版本号
+        return not (isinstance(self.backend, LocalBackend) and settings.web_concurrency > 1)
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            if settings.redis_enabled and aioredis is not None:
+                self._backend = RedisBackend(settings.redis_url)
+            else:
+                if settings.redis_enabled:
+                    logger.warning("REDIS_ENABLED is set but redis is not installed, using in-process response cache")
+                if settings.web_concurrency > 1 and settings.response_cache_enabled:
+                    logger.warning(
+                        f"WEB_CONCURRENCY={settings.web_concurrency} without Redis: "
+                        "in-process response cache and ETags disabled"
+                    )
+                self._backend = LocalBackend()
+        return self._backend
+
+    async def version(self, user_id: int, account_id: Optional[int] = None) -> int:
+        """带 account_id 的查询使用账户的版本号，否则使用用户的版本号"""
+        if account_id:
+            return await self.backend.get_version(f"v:a:{account_id}")
+        return await self.backend.get_version(f"v:u:{user_id}")
+
+    async def lookup(
+        self,
+        scope: str,
+        user_id: int,
+        params: dict,
+        account_id: Optional[int] = None,
+        if_none_match: Optional[str] = None,
+    ) -> CacheLookup:
+        """
+        按用户与查询参数查找缓存 (参数中的 account_id 决定使用哪个版本号)
+        if_none_match 与当前 ETag 相同时返回 not_modified，不读取缓存；关闭缓存时仍计算 ETag
+        版本号不能反映其他进程的修改时 (versions_shared 为假) 不带 ETag
+        """
+        lookup = CacheLookup(scope)
+        stats = self._stats[scope]
+        try:
+            version = await self.version(user_id, account_id)
+            digest = hashlib.sha1(normalize_params(params).encode()).hexdigest()
+            key = f"r:{scope}:{user_id}:{version}:{digest}"
+            if self.backend.versions_shared():
+                lookup.etag = f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+            if lookup.etag is not None and etag_matches(if_none_match, lookup.etag):
+                lookup.not_modified = True
+            elif self.enabled:
+                lookup.key = key
+                lookup.value = await self.backend.get(key)
+        except Exception as e:
+            stats.errors += 1
+            logger.warning(f"Response cache lookup failed: {e}")
+            return CacheLookup(scope)
+        if lookup.not_modified:
+            stats.not_modified += 1
+        elif lookup.hit:
+            stats.hits += 1
+        elif lookup.key is not None:
+            stats.misses += 1
+        return lookup
+
+    async def set(self, key: str, value: dict):
+        try:
+            await self.backend.set(key, value, settings.response_cache_ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {e}")
+
+    async def invalidate(self, user_id: Optional[int], account_id: Optional[int] = None):
+        """用户 (及其账户) 的数据已修改：递增版本号，之前缓存的响应不再命中"""
+        names = []
+        if account_id is not None:
+            names.append(f"v:a:{account_id}")
+        if user_id is not None:
+            names.append(f"v:u:{user_id}")
+        if not names:
+            return
+        try:
+            await self.backend.bump(names)
+        except Exception as e:
+            logger.warning(f"Response cache invalidation failed: {e}")
+
+    async def invalidate_account(self, account_id: int, user_id: Optional[int] = None):
+        """后台任务修改了账户的数据 (任务未记录用户时从主库查询账户所属用户)"""
+        if user_id is None:
+            user_id = await self._account_owner(account_id)
+        await self.invalidate(user_id, account_id)
+
+    async def _account_owner(self, account_id: int) -> Optional[int]:
+        owner = self._owners.get(account_id)
+        if owner is None:
+            try:
+                async with AsyncSessionLocal() as db:
+                    owner = (await db.execute(
+                        select(EmailAccount.user_id).where(EmailAccount.id == account_id)
+                    )).scalar_one_or_none()
+            except Exception as e:
+                logger.warning(f"Failed to look up owner of account {account_id}: {e}")
+                return None
+            if owner is not None:
+                self._owners[account_id] = owner
+        return owner
+
+    def stats(self) -> Dict[str, dict]:
+        """各接口的命中次数、命中率与 304 次数 (用于监控)"""
+        result = {}
+        for scope in SCOPES:
+            stats = self._stats[scope]
+            total = stats.hits + stats.misses
+            result[scope] = {
+                "hits": stats.hits,
+                "misses": stats.misses,
+                "errors": stats.errors,
+                "not_modified": stats.not_modified,
+                "hit_ratio": round(stats.hits / total, 4) if total else 0.0,
+            }
+        return result
+
+    def size(self) -> Optional[int]:
+        """进程内缓存的条目数 (Redis 时为 None)"""
+        return self._backend.size() if self._backend is not None else 0
+
+
+response_cache = ResponseCache()
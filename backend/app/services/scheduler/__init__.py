@@ -1,44 +1,151 @@
 import asyncio
 import logging
-from typing import List
-from datetime import datetime
+from typing import Optional
+from datetime import datetime, timedelta
 
-from app.models.email_account import EmailAccount
-from app.services.sync_helpers import AsyncSessionLocal
-from app.services.imap_sync import sync_emails
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.email_account import EmailAccount, AccountStatus
+from app.models.job import Job, JobKind, JobPriority
+from app.models.setting import SystemSetting
+from app.models.sync_lease import SyncLease
+from app.services.imap_sync import run_sync_job, sync_limit_keys, sync_retry_after
+from app.services.job_queue import JobRunner, enqueue_job, enqueue_jobs, purge_finished_jobs
+from app.services.maintenance import (
+    run_reconcile_counters_job, run_retention_job, run_clear_inbox_job, run_clear_trash_job, run_delete_account_job
+)
+from app.services.email_bodies import ensure_plain_text_backfill, run_plain_text_backfill_job
+from app.services.raw_store import run_raw_store_gc_job
+from app.services.search import ensure_search_backfill, run_search_backfill_job
+from app.services.rate_limiter import rate_limiter
+from app.services.verification_codes import ensure_code_backfill, run_code_backfill_job
+from app.services.write_coalescer import write_coalescer
+from app.services.scheduler.leases import LeaseManager, default_worker_id
 
 logger = logging.getLogger(__name__)
 
 SYNC_INTERVAL_SECONDS = 15  # 每15秒同步一次
+JOB_CLEANUP_INTERVAL_SECONDS = 3600  # 每小时清理一次历史任务
 
 class SyncScheduler:
-    """后台同步调度器"""
-    
-    def __init__(self):
+    """
+    后台同步调度器
+    定时把到期的账户放入任务队列 (与手动同步共用同一队列并去重)，
+    并在本进程内运行 JobRunner 执行队列中的任务
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        use_leases: Optional[bool] = None,
+        shard_index: int = 0,
+        shard_count: int = 1,
+    ):
         self._task = None
+        self._lease_task = None
         self._running = False
-    
+        # 多进程 Worker 按 account_id % shard_count 分片
+        self._shard_index = shard_index
+        self._shard_count = max(shard_count, 1)
+        use_leases = settings.sync_leases_enabled if use_leases is None else use_leases
+        # 启用租约时只调度、认领本 worker 持有租约的账户
+        self._leases: Optional[LeaseManager] = (
+            LeaseManager(shard_index=shard_index, shard_count=self._shard_count) if use_leases else None
+        )
+        worker_id = self._leases.worker_id if self._leases is not None else default_worker_id()
+        self._runner = JobRunner(
+            {
+                JobKind.SYNC.value: run_sync_job,
+                JobKind.BACKFILL_CODES.value: run_code_backfill_job,
+                JobKind.RECONCILE_COUNTERS.value: run_reconcile_counters_job,
+                JobKind.BACKFILL_SEARCH.value: run_search_backfill_job,
+                JobKind.GC_RAW_STORE.value: run_raw_store_gc_job,
+                JobKind.RETENTION.value: run_retention_job,
+                JobKind.CLEAR_INBOX.value: run_clear_inbox_job,
+                JobKind.CLEAR_TRASH.value: run_clear_trash_job,
+                JobKind.DELETE_ACCOUNT.value: run_delete_account_job,
+                JobKind.BACKFILL_TEXT.value: run_plain_text_backfill_job,
+            },
+            worker_id,
+            max_concurrency,
+            # 认领与派发使用相同的分片 / 租约条件，冷却中的账户的同步任务延后放回队列
+            shard_index=self._shard_index,
+            shard_count=self._shard_count,
+            leased=self._leases is not None,
+            throttles={JobKind.SYNC.value: sync_retry_after},
+        )
+        self._last_cleanup_at: Optional[datetime] = None
+        self._last_reconcile_at: Optional[datetime] = None
+        self._last_raw_gc_at: Optional[datetime] = None
+        self._last_retention_at: Optional[datetime] = None
+
     async def start(self):
         """启动调度器"""
         if self._task is not None:
             return
-        
+
         self._running = True
+        if self._leases is not None:
+            await self._renew_leases()
+            self._lease_task = asyncio.create_task(self._lease_loop())
+        try:
+            async with AsyncSessionLocal() as db:
+                await ensure_code_backfill(db)
+                await ensure_search_backfill(db)
+                await ensure_plain_text_backfill(db)
+        except Exception as e:
+            logger.error(f"Failed to queue backfill jobs: {e}")
+        await self._runner.start()
         self._task = asyncio.create_task(self._run_loop())
-        logger.info(f"Sync scheduler started with interval {SYNC_INTERVAL_SECONDS}s")
-    
-    async def stop(self):
-        """停止调度器"""
+        logger.info(
+            f"Sync scheduler started with interval {SYNC_INTERVAL_SECONDS}s, "
+            f"shard {self._shard_index}/{self._shard_count}"
+        )
+
+    async def stop(self, drain_timeout: float = 0):
+        """
+        停止调度器
+        drain_timeout > 0 时先停止认领新任务，等待进行中的同步完成提交后再退出；
+        超时仍未结束的任务会被取消并放回队列 (未提交的部分回滚，下次同步按 message_id 去重后补齐)
+        """
         self._running = False
-        if self._task is not None:
-            self._task.cancel()
+        for attr in ("_task", "_lease_task"):
+            task = getattr(self, attr)
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                setattr(self, attr, None)
+
+        await self._runner.stop(drain_timeout=drain_timeout)
+        # 写完已排队的同步结果 (进行中的同步已在上一步结束或取消)
+        await write_coalescer.stop()
+
+        if self._leases is not None:
             try:
-                await self._task
-            except asyncio.CancelledError:
-                pass
-            self._task = None
+                await self._leases.release_all()
+            except Exception as e:
+                logger.error(f"Failed to release sync leases: {e}")
         logger.info("Sync scheduler stopped")
-    
+
+    async def _lease_loop(self):
+        """租约心跳循环 (独立于同步循环，避免同步耗时导致租约过期)"""
+        interval = max(1, settings.sync_lease_ttl_seconds // 3)
+        while self._running:
+            await asyncio.sleep(interval)
+            await self._renew_leases()
+
+    async def _renew_leases(self):
+        try:
+            await self._leases.heartbeat()
+        except Exception as e:
+            logger.error(f"Lease heartbeat failed: {e}", exc_info=True)
+
     async def _run_loop(self):
         """主循环"""
         while self._running:
@@ -46,50 +153,149 @@ class SyncScheduler:
                 await self._sync_all_accounts()
             except Exception as e:
                 logger.error(f"Error in sync loop: {e}", exc_info=True)
-            
+
+            try:
+                await self._cleanup_jobs()
+            except Exception as e:
+                logger.error(f"Error cleaning up jobs: {e}", exc_info=True)
+
+            try:
+                await self._queue_reconcile()
+            except Exception as e:
+                logger.error(f"Error queueing counter reconciliation: {e}", exc_info=True)
+
+            try:
+                await self._queue_raw_store_gc()
+            except Exception as e:
+                logger.error(f"Error queueing raw store GC: {e}", exc_info=True)
+
+            try:
+                await self._queue_retention()
+            except Exception as e:
+                logger.error(f"Error queueing retention: {e}", exc_info=True)
+
             # 等待下一个周期
             await asyncio.sleep(SYNC_INTERVAL_SECONDS)
-    
+
     async def _sync_all_accounts(self):
-        """同步所有启用同步的账号"""
-        from sqlalchemy import select
-        
+        """把到期的账号放入同步队列（先询问限流器，冷却中的账号本轮跳过）"""
+        now = datetime.utcnow()
         async with AsyncSessionLocal() as db:
-            try:
-                # 获取所有启用同步的账号
-                result = await db.execute(
-                    select(EmailAccount).where(
-                        EmailAccount.sync_enabled == True,
-                        EmailAccount.is_active == True
+            # 分片、租约与同步间隔都在 SQL 中过滤，只取计算限流 key 需要的列 (不随账户总数加载整行)
+            stmt = select(
+                EmailAccount.id, EmailAccount.provider, EmailAccount.auth_type,
+                EmailAccount.imap_server, EmailAccount.proxy_url,
+            ).where(
+                EmailAccount.sync_enabled == True,
+                EmailAccount.status.not_in((AccountStatus.DISABLED, AccountStatus.DELETING)),
+                or_(
+                    EmailAccount.last_sync_at.is_(None),
+                    EmailAccount.last_sync_at <= now - timedelta(seconds=SYNC_INTERVAL_SECONDS),
+                ),
+            )
+            if self._shard_count > 1:
+                stmt = stmt.where(EmailAccount.id % self._shard_count == self._shard_index)
+            if self._leases is not None:
+                # 其他 worker 持有租约的账户由其负责 (与 owned_jobs_condition 相同的条件)
+                stmt = stmt.where(EmailAccount.id.in_(
+                    select(SyncLease.account_id).where(
+                        SyncLease.worker_id == self._leases.worker_id,
+                        SyncLease.expires_at >= now,
                     )
-                )
-                accounts = result.scalars().all()
-                
-                if not accounts:
-                    return
-                
-                logger.debug(f"Found {len(accounts)} accounts to sync")
-                
-                # 逐个同步
-                for account in accounts:
-                    try:
-                        # 检查距离上次同步是否已经过了足够时间
-                        if account.last_sync_at:
-                            time_since_sync = (datetime.utcnow() - account.last_sync_at).total_seconds()
-                            if time_since_sync < SYNC_INTERVAL_SECONDS:
-                                continue  # 跳过，还没到时间
-                        
-                        logger.info(f"Syncing account {account.email_address}")
-                        await sync_emails(account.id, db, limit=100)
-                        
-                    except Exception as e:
-                        logger.error(f"Error syncing account {account.id}: {e}", exc_info=True)
-                
-                await db.commit()
-                
-            except Exception as e:
-                await db.rollback()
-                logger.error(f"Error in sync_all_accounts: {e}", exc_info=True)
+                ))
+            accounts = (await db.execute(stmt)).all()
+
+            if not accounts:
+                return
+
+            # 全局代理只查一次，用于计算各账户的限流 key
+            result = await db.execute(select(SystemSetting).where(SystemSetting.key == "global_proxy"))
+            setting = result.scalars().first()
+            global_proxy = setting.value if setting and setting.value else None
+
+            logger.debug(f"Found {len(accounts)} accounts due for sync")
+
+            due_ids = []
+            for account in accounts:
+                # 对应的 provider / IMAP 主机 / 代理正在冷却，本轮不派发
+                keys = sync_limit_keys(account, account.proxy_url or global_proxy)
+                wait = rate_limiter.retry_after(keys)
+                if wait > 0:
+                    logger.debug(f"Skip account {account.id}: rate limited for {wait:.1f}s ({keys})")
+                    continue
+
+                due_ids.append(account.id)
+
+            # 已有排队 / 执行中同步的账户会被跳过
+            created = await enqueue_jobs(
+                db, JobKind.SYNC.value, due_ids, priority=JobPriority.SCHEDULED, source="scheduled"
+            )
+            if created:
+                logger.info(f"Queued {created} scheduled syncs")
+
+    async def _cleanup_jobs(self):
+        """定期清理已结束的历史任务"""
+        now = datetime.utcnow()
+        if self._last_cleanup_at and (now - self._last_cleanup_at).total_seconds() < JOB_CLEANUP_INTERVAL_SECONDS:
+            return
+        self._last_cleanup_at = now
+        async with AsyncSessionLocal() as db:
+            removed = await purge_finished_jobs(db, timedelta(hours=settings.job_retention_hours))
+        if removed:
+            logger.info(f"Removed {removed} finished jobs")
+
+    async def _queue_reconcile(self):
+        """定期放入计数器对账任务 (多个 worker 同时入队时合并为一个)"""
+        interval = settings.counter_reconcile_interval_seconds
+        if interval <= 0:
+            return
+        now = datetime.utcnow()
+        if self._last_reconcile_at and (now - self._last_reconcile_at).total_seconds() < interval:
+            return
+        self._last_reconcile_at = now
+        async with AsyncSessionLocal() as db:
+            await enqueue_job(db, JobKind.RECONCILE_COUNTERS.value, None, source="scheduled")
+
+    async def _queue_raw_store_gc(self):
+        """定期放入原始邮件清理任务 (只在开启原文存储时)"""
+        interval = settings.raw_store_gc_interval_seconds
+        if not settings.raw_store_enabled or interval <= 0:
+            return
+        now = datetime.utcnow()
+        if self._last_raw_gc_at and (now - self._last_raw_gc_at).total_seconds() < interval:
+            return
+        self._last_raw_gc_at = now
+        async with AsyncSessionLocal() as db:
+            await enqueue_job(db, JobKind.GC_RAW_STORE.value, None, source="scheduled")
+
+    async def _queue_retention(self):
+        """定期放入保留策略 / 空间回收任务 (未配置保留策略时也会执行空间回收与 ANALYZE)"""
+        interval = settings.retention_interval_seconds
+        if interval <= 0:
+            return
+        now = datetime.utcnow()
+        if self._last_retention_at and (now - self._last_retention_at).total_seconds() < interval:
+            return
+        self._last_retention_at = now
+        async with AsyncSessionLocal() as db:
+            await enqueue_job(db, JobKind.RETENTION.value, None, source="scheduled")
+
+
+async def request_sync(
+    db: AsyncSession,
+    account: EmailAccount,
+    user_id: Optional[int] = None,
+    source: str = "manual",
+    priority: int = JobPriority.MANUAL,
+) -> Job:
+    """
+    请求尽快同步账户：放入任务队列 (会提交会话)
+    已有排队 / 执行中的同步时直接返回该任务；由 API 进程内的调度器或独立 Worker 执行
+    """
+    job, _ = await enqueue_job(
+        db, JobKind.SYNC.value, account.id, user_id=user_id, priority=priority, source=source
+    )
+    return job
 
 
 # 全局实例
@@ -0,0 +1,191 @@
+"""
+账户租约管理 - 让多个进程 / 节点分摊同步工作且不重复
+
+每个 worker 周期性地心跳：续约自己持有的租约，按存活 worker 数计算公平份额，
+多了就释放、少了就认领空闲或已过期的租约。worker 退出或宕机后，
+它的租约在 TTL 之后过期，由其他 worker 接手。
+
+租约同时约束派发与执行：调度器只为持有租约的账户放入定时同步，
+JobRunner 认领任务时也只认领这些账户的任务 (job_queue.owned_jobs_condition)，
+API 直接入队的手动同步、清空、删除等任务同样由租约持有者执行。
+"""
+import logging
+import math
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Set
+
+from sqlalchemy import select, update, delete, func, or_, true
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, dialect_insert
+from app.models.email_account import EmailAccount
+from app.models.sync_lease import SyncLease, SyncWorker
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_id() -> str:
+    """生成 worker 标识：主机名 + 进程号 + 随机后缀"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class LeaseManager:
+    """账户租约管理器"""
+
+    def __init__(
+        self,
+        worker_id: Optional[str] = None,
+        ttl_seconds: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        shard_index: int = 0,
+        shard_count: int = 1,
+    ):
+        self.worker_id = worker_id or default_worker_id()
+        self.shard_index = shard_index
+        self.shard_count = max(shard_count, 1)
+        self.ttl = timedelta(seconds=ttl_seconds or settings.sync_lease_ttl_seconds)
+        self.batch_size = batch_size or settings.sync_lease_batch_size
+        self.owned: Set[int] = set()
+
+    def _in_shard(self, column):
+        """只处理本分片的账户"""
+        if self.shard_count <= 1:
+            return true()
+        return column % self.shard_count == self.shard_index
+
+    def _free_condition(self, now: datetime):
+        """空闲或已过期的租约"""
+        return or_(
+            SyncLease.worker_id.is_(None),
+            SyncLease.expires_at.is_(None),
+            SyncLease.expires_at < now,
+        )
+
+    async def heartbeat(self) -> Set[int]:
+        """心跳 + 续约 + 重新平衡，返回当前持有的账户 ID"""
+        now = datetime.utcnow()
+        expires_at = now + self.ttl
+
+        async with AsyncSessionLocal() as db:
+            try:
+                # 1. 登记心跳
+                worker = await db.get(SyncWorker, self.worker_id)
+                if worker is None:
+                    db.add(SyncWorker(
+                        worker_id=self.worker_id,
+                        hostname=socket.gethostname(),
+                        pid=os.getpid(),
+                        shard_index=self.shard_index,
+                        shard_count=self.shard_count,
+                        started_at=now,
+                        heartbeat_at=now,
+                    ))
+                else:
+                    worker.heartbeat_at = now
+                await db.flush()
+
+                # 2. 清理失联 worker 和已删除账户的租约
+                await db.execute(delete(SyncWorker).where(SyncWorker.heartbeat_at < now - self.ttl))
+                await db.execute(
+                    delete(SyncLease)
+                    .where(SyncLease.account_id.not_in(select(EmailAccount.id)))
+                    .execution_options(synchronize_session=False)
+                )
+
+                # 3. 为新账户补齐租约行
+                await db.execute(
+                    dialect_insert(SyncLease).from_select(
+                        ["account_id"],
+                        select(EmailAccount.id).where(EmailAccount.id.not_in(select(SyncLease.account_id)))
+                    ).on_conflict_do_nothing(index_elements=[SyncLease.account_id])
+                )
+
+                # 4. 续约自己持有的租约
+                await db.execute(
+                    update(SyncLease)
+                    .where(SyncLease.worker_id == self.worker_id)
+                    .values(expires_at=expires_at)
+                    .execution_options(synchronize_session=False)
+                )
+
+                # 5. 计算本分片内的公平份额并重新平衡
+                total = (await db.execute(
+                    select(func.count()).select_from(SyncLease).where(self._in_shard(SyncLease.account_id))
+                )).scalar() or 0
+                live_workers = (await db.execute(
+                    select(func.count()).select_from(SyncWorker).where(
+                        SyncWorker.shard_index == self.shard_index,
+                        SyncWorker.shard_count == self.shard_count,
+                    )
+                )).scalar() or 1
+                share = math.ceil(total / max(live_workers, 1))
+
+                held = (await db.execute(
+                    select(func.count()).select_from(SyncLease).where(SyncLease.worker_id == self.worker_id)
+                )).scalar() or 0
+
+                if held > share:
+                    surplus = (
+                        select(SyncLease.account_id)
+                        .where(SyncLease.worker_id == self.worker_id)
+                        .order_by(SyncLease.account_id.desc())
+                        .limit(held - share)
+                    )
+                    await db.execute(
+                        update(SyncLease)
+                        .where(SyncLease.account_id.in_(surplus))
+                        .values(worker_id=None, expires_at=None)
+                        .execution_options(synchronize_session=False)
+                    )
+                elif held < share:
+                    # 外层 WHERE 再次检查空闲条件，保证并发认领时同一行只会被一个 worker 拿到
+                    free = self._free_condition(now)
+                    candidates = (
+                        select(SyncLease.account_id)
+                        .where(free, self._in_shard(SyncLease.account_id))
+                        .order_by(SyncLease.account_id)
+                        .limit(min(self.batch_size, share - held))
+                    )
+                    await db.execute(
+                        update(SyncLease)
+                        .where(SyncLease.account_id.in_(candidates), free)
+                        .values(worker_id=self.worker_id, expires_at=expires_at, acquired_at=now)
+                        .execution_options(synchronize_session=False)
+                    )
+
+                await db.commit()
+            except IntegrityError:
+                # 其他 worker 同时补齐了租约行，下一次心跳再处理
+                await db.rollback()
+                logger.debug("Lease heartbeat conflicted with another worker, will retry")
+
+            result = await db.execute(
+                select(SyncLease.account_id).where(
+                    SyncLease.worker_id == self.worker_id,
+                    SyncLease.expires_at >= now,
+                )
+            )
+            owned = set(result.scalars().all())
+
+        if owned != self.owned:
+            logger.info(f"Worker {self.worker_id} now holds {len(owned)} account leases")
+        self.owned = owned
+        return owned
+
+    async def release_all(self):
+        """释放所有租约并注销 worker，其他 worker 可以立即接手"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(SyncLease)
+                .where(SyncLease.worker_id == self.worker_id)
+                .values(worker_id=None, expires_at=None)
+                .execution_options(synchronize_session=False)
+            )
+            await db.execute(delete(SyncWorker).where(SyncWorker.worker_id == self.worker_id))
+            await db.commit()
+        self.owned = set()
+        logger.info(f"Worker {self.worker_id} released its leases")
@@ -0,0 +1,218 @@
+"""
+邮件全文搜索
+
+SQLite 使用 FTS5 表 emails_fts (rowid = emails.id)，PostgreSQL 使用 email_search 表 (tsvector + GIN)，均由迁移创建：
+- 写入：同步入库时由 save_new_emails 调用 index_emails；历史邮件由回填任务补齐
+- 删除：SQLite 由 emails 上的 AFTER DELETE 触发器同步删除，PostgreSQL 由外键级联删除
+- 中日韩文字：分词器会把连续的汉字当成一个词，入库和查询时都在每个汉字两侧加空格，
+  查询时连续汉字组成短语 ("验 证 码")，实现按字的子串匹配
+- 英文 / 数字：按词前缀匹配 (invoi → invoice)；标点一律视为分隔符 (billing@shop.example 可按 shop 搜到)
+
+其他数据库、SQLite 未编译 FTS5 或历史邮件尚未回填完成时，调用方回退到 LIKE 搜索
+"""
+import json
+import logging
+import re
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import select, exists, text, literal_column, column, func, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import AsyncSessionLocal, ReadSessionLocal
+from app.core.shards import mail_store, mail_store_ids, sharding_enabled
+from app.models.email import Email
+from app.models.job import Job, JobKind
+from app.models.setting import SystemSetting
+from app.services.email_bodies import load_bodies
+from app.services.job_queue import enqueue_job, update_job_progress
+from app.services.plain_text import plain_text_of
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "emails_fts"        # SQLite FTS5
+PG_SEARCH_TABLE = "email_search"  # PostgreSQL tsvector
+BACKFILL_BATCH_SIZE = 500
+# 历史邮件全部写入索引后写入 system_settings，之后才启用全文搜索
+BACKFILL_DONE_KEY = "search_index_backfilled"
+# 正文只索引前 N 个字符
+MAX_INDEXED_BODY = 20000
+# bm25 列权重：主题 > 发件人 > 正文 (PostgreSQL 对应 setweight A / B / D)
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+
+# 假名、汉字 (含扩展 A 与兼容汉字)、韩文音节
+CJK_CHARS = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+CJK_PATTERN = re.compile(f'([{CJK_CHARS}])')
+PUNCT_PATTERN = re.compile(r'[^\w\s]')
+QUERY_TOKEN_PATTERN = re.compile(f'[{CJK_CHARS}]+|[^\\W_{CJK_CHARS}]+')
+
+emails_fts = table(FTS_TABLE, column("rowid"), column("subject"), column("sender"), column("body"))
+email_search = table(PG_SEARCH_TABLE, column("email_id"), column("document"))
+
+# 只缓存 "可用" 的结果：迁移 / 回填完成后无需重启即可生效
+_fts_ready = False
+
+
+def segment(value: Optional[str]) -> str:
+    """标点替换为空格，并在每个中日韩文字两侧加空格，使分词器按字切分"""
+    if not value:
+        return ""
+    return CJK_PATTERN.sub(r' \1 ', PUNCT_PATTERN.sub(' ', value))
+
+
+def build_match_query(q: str, dialect: str = "sqlite") -> Optional[str]:
+    """
+    把用户输入转换为全文查询 (SQLite: FTS5 MATCH 语法，PostgreSQL: to_tsquery 语法)
+    连续汉字为短语，其他词按前缀匹配，各部分之间为 AND；没有可搜索的词时返回 None
+    """
+    parts = []
+    for token in QUERY_TOKEN_PATTERN.findall(q.lower()):
+        cjk = CJK_PATTERN.match(token) is not None
+        if dialect == "postgresql":
+            parts.append(" <-> ".join(token) if cjk else f"{token}:*")
+        else:
+            parts.append('"' + " ".join(token) + '"' if cjk else f'"{token}"*')
+    if not parts:
+        return None
+    return (" & " if dialect == "postgresql" else " ").join(parts)
+
+
+async def fts_table_exists(db: AsyncSession) -> bool:
+    if _fts_ready:
+        return True
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        result = await db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        )
+        return result.first() is not None
+    if dialect == "postgresql":
+        result = await db.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": PG_SEARCH_TABLE})
+        return bool(result.scalar())
+    return False
+
+
+async def fts_ready(db: AsyncSession) -> bool:
+    """全文索引表存在 (db 为邮件所在的库) 且历史邮件已回填完成 (完成标记在主库)"""
+    global _fts_ready
+    if _fts_ready:
+        return True
+    if not await fts_table_exists(db):
+        return False
+    async with ReadSessionLocal() as catalog:
+        result = await catalog.execute(select(SystemSetting.key).where(SystemSetting.key == BACKFILL_DONE_KEY))
+        _fts_ready = result.first() is not None
+    return _fts_ready
+
+
+async def index_emails(db: AsyncSession, emails: Iterable[Email]):
+    """把已分配 ID 的邮件写入全文索引 (调用方负责提交；没有索引表时跳过)"""
+    rows = [
+        {
+            "rowid": email.id,
+            "subject": segment(email.subject),
+            "sender": segment(f"{email.from_name or ''} {email.from_address or ''}"),
+            "body": segment(plain_text_of(email)[:MAX_INDEXED_BODY]),
+        }
+        for email in emails
+    ]
+    if not rows or not await fts_table_exists(db):
+        return
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(
+            text(
+                f"INSERT INTO {PG_SEARCH_TABLE} (email_id, document) VALUES (:rowid, "
+                "setweight(to_tsvector('simple', :subject), 'A') || "
+                "setweight(to_tsvector('simple', :sender), 'B') || "
+                "setweight(to_tsvector('simple', :body), 'D')) "
+                "ON CONFLICT (email_id) DO UPDATE SET document = EXCLUDED.document"
+            ),
+            rows,
+        )
+    else:
+        await db.execute(
+            text(f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, subject, sender, body) "
+                 "VALUES (:rowid, :subject, :sender, :body)"),
+            rows,
+        )
+
+
+def match_subquery(match: str, dialect: str = "sqlite", ranked: bool = False):
+    """匹配邮件的 ID (ranked=True 时附带相关度 rank，越小越相关)"""
+    if dialect == "postgresql":
+        query = func.to_tsquery(literal_column("'simple'::regconfig"), match)
+        columns = [email_search.c.email_id.label("email_id")]
+        if ranked:
+            columns.append((-func.ts_rank_cd(email_search.c.document, query)).label("rank"))
+        return select(*columns).where(email_search.c.document.op("@@")(query))
+
+    columns = [emails_fts.c.rowid.label("email_id")]
+    if ranked:
+        columns.append(func.bm25(literal_column(FTS_TABLE), *RANK_WEIGHTS).label("rank"))
+    return select(*columns).where(literal_column(FTS_TABLE).match(match))
+
+
+async def ensure_search_backfill(db: AsyncSession) -> Optional[Job]:
+    """索引表已创建但历史邮件还没写入时入队回填任务"""
+    if not await fts_table_exists(db):
+        return None
+    result = await db.execute(select(SystemSetting).where(SystemSetting.key == BACKFILL_DONE_KEY))
+    if result.scalars().first():
+        return None
+    job, created = await enqueue_job(db, JobKind.BACKFILL_SEARCH.value, None, source="startup")
+    if created:
+        logger.info("Queued search index backfill")
+    return job
+
+
+async def run_search_backfill_job(job: Job) -> dict:
+    """
+    把历史邮件写入全文索引
+    逐个邮件库 (按用户分库时逐个分库) 按 email.id 递增分批处理，进度 (分库与游标) 写入任务结果，
+    任务中断后重新认领时从游标继续
+    """
+    progress = json.loads(job.result) if job.result else {}
+    store_id = progress.get("store")
+    cursor = progress.get("last_email_id", 0)
+    indexed = progress.get("indexed", 0)
+
+    store_ids = mail_store_ids()
+    if store_id is not None and sharding_enabled():
+        # 从中断时的分库继续
+        store_ids = [i for i in store_ids if i >= store_id]
+
+    for store_id in store_ids:
+        if progress.get("store") != store_id:
+            cursor = 0
+        async with mail_store(store_id) as store:
+            while True:
+                async with store.session() as db:
+                    if db.bind.dialect.name == "postgresql":
+                        indexed_ids = select(email_search.c.email_id).where(email_search.c.email_id == Email.id)
+                    else:
+                        indexed_ids = select(emails_fts.c.rowid).where(emails_fts.c.rowid == Email.id)
+                    stmt = (
+                        select(Email)
+                        .where(Email.id > cursor, ~exists(indexed_ids))
+                        .order_by(Email.id)
+                        .limit(BACKFILL_BATCH_SIZE)
+                    )
+                    emails = (await db.execute(stmt)).scalars().all()
+                    if not emails:
+                        break
+
+                    await load_bodies(db, emails)
+                    await index_emails(db, emails)
+                    await db.commit()
+
+                cursor = emails[-1].id
+                indexed += len(emails)
+                progress = {"store": store_id, "last_email_id": cursor, "indexed": indexed}
+                await update_job_progress(job.id, message=f"已索引 {indexed} 封邮件", result=progress)
+
+    async with AsyncSessionLocal() as db:
+        await db.merge(SystemSetting(key=BACKFILL_DONE_KEY, value=datetime.utcnow().isoformat()))
+        await db.commit()
+
+    logger.info(f"Search index backfill finished: {indexed} emails")
+    return progress
@@ -5,10 +5,17 @@ import email
 from typing import Optional, Tuple, List, Dict
 from email.header import decode_header
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, inspect
 
+from app.core.database import dialect_insert
 from app.models.folder import Folder
 from app.models.email import Email
+from app.services.counters import CounterDeltas
+from app.services.email_addresses import save_addresses
+from app.services.email_bodies import save_bodies
+from app.services.plain_text import fill_plain_text
+from app.services.search import index_emails
+from app.services.verification_codes import codes_for_emails, load_code_extractor, save_codes
 from app.core.constants import (
     MAX_SUBJECT_LENGTH,
     MAX_FROM_ADDRESS_LENGTH,
@@ -142,6 +149,50 @@ async def batch_check_existing_emails(
     return set(existing)
 
 
+async def save_new_emails(db: AsyncSession, emails: List[Email]) -> int:
+    """
+    写入一批新邮件 (含摘要)，并在同一事务中写入压缩正文与纯文本、地址索引、提取验证码、写入全文索引、
+    更新文件夹 / 账户计数器 (调用方负责提交)
+    使用 INSERT ... ON CONFLICT (account_id, message_id) DO NOTHING：
+    并发同步同一账户时已被其他事务写入的邮件直接跳过，不会让整批写入失败
+    返回: 实际写入的邮件数
+    """
+    if not emails:
+        return 0
+    # 同步流程已在写事务之外计算过纯文本与摘要，这里只补漏
+    fill_plain_text(emails)
+    columns = [attr.key for attr in inspect(Email).column_attrs if attr.key != "id"]
+    rows = [
+        {key: getattr(email_obj, key) for key in columns if getattr(email_obj, key) is not None}
+        for email_obj in emails
+    ]
+    stmt = (
+        dialect_insert(Email)
+        .on_conflict_do_nothing(index_elements=[Email.account_id, Email.message_id])
+        .returning(Email.id, Email.message_id)
+    )
+    inserted = {message_id: email_id for email_id, message_id in (await db.execute(stmt, rows)).all()}
+
+    saved = []
+    for email_obj in emails:
+        email_id = inserted.get(email_obj.message_id)
+        if email_id is not None:
+            email_obj.id = email_id
+            saved.append(email_obj)
+    if not saved:
+        return 0
+
+    await save_bodies(db, saved)
+    await save_addresses(db, saved)
+    await save_codes(db, codes_for_emails(saved, await load_code_extractor()))
+    await index_emails(db, saved)
+    deltas = CounterDeltas()
+    for email_obj in saved:
+        deltas.add_email(email_obj)
+    await deltas.apply(db)
+    return len(saved)
+
+
 def truncate_email_fields(
     subject: str,
     from_name: str,
@@ -0,0 +1,165 @@
+"""
+验证码服务 - 写入时提取、最新验证码查询、历史邮件回填
+"""
+import json
+import logging
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import select, exists, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import AsyncSessionLocal, ReadSessionLocal
+from app.core.shards import mail_store, mail_store_ids, sharding_enabled
+from app.models.email import Email
+from app.models.email_account import EmailAccount
+from app.models.job import Job, JobKind
+from app.models.setting import SystemSetting
+from app.models.verification_code import VerificationCode
+from app.services.email_bodies import load_bodies
+from app.services.code_extractor import CodeExtractor, default_extractor, extract_code, parse_code_rules
+from app.services.job_queue import enqueue_job, update_job_progress
+from app.services.plain_text import plain_text_of
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 500
+# 全量回填完成后写入 system_settings，避免每次启动重复入队
+BACKFILL_DONE_KEY = "verification_codes_backfilled"
+# 自定义验证码规则 (JSON，见 code_extractor.parse_code_rules)
+CODE_RULES_KEY = "code_rules"
+
+# (规则原文, 引擎)：规则没变时复用已编译的引擎
+_extractor_cache = ("", default_extractor)
+
+
+async def load_code_extractor() -> CodeExtractor:
+    """按 system_settings 中的自定义规则获取验证码提取引擎 (规则在主库，按用户分库时写入分库的事务也从主库读取)"""
+    global _extractor_cache
+    async with ReadSessionLocal() as db:
+        result = await db.execute(select(SystemSetting.value).where(SystemSetting.key == CODE_RULES_KEY))
+        raw = result.scalar() or ""
+    if raw != _extractor_cache[0]:
+        try:
+            extractor = CodeExtractor(parse_code_rules(raw))
+        except ValueError as e:
+            logger.error(f"Invalid custom code rules, using defaults: {e}")
+            extractor = default_extractor
+        _extractor_cache = (raw, extractor)
+    return _extractor_cache[1]
+
+
+def codes_for_emails(emails: Iterable[Email], extractor: Optional[CodeExtractor] = None) -> List[VerificationCode]:
+    """为已分配 ID 的邮件提取验证码 (已有邮件需先 load_bodies 读取正文)"""
+    codes = []
+    for email in emails:
+        code = extract_code(
+            email.subject, email.body_text, email.body_html, email.from_address, extractor, plain_text_of(email)
+        )
+        if code:
+            codes.append(VerificationCode(
+                account_id=email.account_id,
+                email_id=email.id,
+                code=code,
+                sender=email.from_address,
+                subject=email.subject,
+                received_at=email.received_at,
+            ))
+    return codes
+
+
+async def save_codes(db: AsyncSession, codes: List[VerificationCode]):
+    """
+    一条 INSERT (executemany) 写入一批验证码 (调用方负责提交)
+    ORM 的 add_all 需要取回每行的主键，在 SQLite 上会逐行 INSERT
+    """
+    if not codes:
+        return
+    columns = ("account_id", "email_id", "code", "sender", "subject", "received_at")
+    await db.execute(insert(VerificationCode), [{name: getattr(code, name) for name in columns} for code in codes])
+
+
+async def latest_code(
+    db: AsyncSession, account_id: int, since: Optional[datetime] = None
+) -> Optional[VerificationCode]:
+    """账户最新的验证码 (走 account_id, received_at DESC 索引)"""
+    stmt = select(VerificationCode).where(VerificationCode.account_id == account_id)
+    if since is not None:
+        stmt = stmt.where(VerificationCode.received_at > since)
+    stmt = stmt.order_by(VerificationCode.received_at.desc(), VerificationCode.id.desc()).limit(1)
+    return (await db.execute(stmt)).scalars().first()
+
+
+async def ensure_code_backfill(db: AsyncSession) -> Optional[Job]:
+    """历史邮件还没回填过验证码时入队全量回填任务 (已有活动任务时合并)"""
+    result = await db.execute(select(SystemSetting).where(SystemSetting.key == BACKFILL_DONE_KEY))
+    if result.scalars().first():
+        return None
+    job, created = await enqueue_job(db, JobKind.BACKFILL_CODES.value, None, source="startup")
+    if created:
+        logger.info("Queued verification code backfill")
+    return job
+
+
+async def run_code_backfill_job(job: Job) -> dict:
+    """
+    回填历史邮件的验证码
+    逐个邮件库 (按用户分库时逐个分库) 按 email.id 递增分批处理，进度 (分库与游标) 写入任务结果，
+    任务中断后重新认领时从游标继续
+    """
+    progress = json.loads(job.result) if job.result else {}
+    store_id = progress.get("store")
+    cursor = progress.get("last_email_id", 0)
+    scanned = progress.get("scanned", 0)
+    found = progress.get("found", 0)
+
+    store_ids = mail_store_ids()
+    if job.account_id is not None and sharding_enabled():
+        async with AsyncSessionLocal() as db:
+            user_id = (await db.execute(
+                select(EmailAccount.user_id).where(EmailAccount.id == job.account_id)
+            )).scalar()
+        store_ids = [user_id] if user_id is not None else []
+    if store_id is not None and sharding_enabled():
+        # 从中断时的分库继续
+        store_ids = [i for i in store_ids if i >= store_id]
+
+    for store_id in store_ids:
+        if progress.get("store") != store_id:
+            cursor = 0
+        async with mail_store(store_id) as store:
+            while True:
+                async with store.session() as db:
+                    stmt = (
+                        select(Email)
+                        .where(
+                            Email.id > cursor,
+                            ~exists().where(VerificationCode.email_id == Email.id),
+                        )
+                        .order_by(Email.id)
+                        .limit(BACKFILL_BATCH_SIZE)
+                    )
+                    if job.account_id is not None:
+                        stmt = stmt.where(Email.account_id == job.account_id)
+                    emails = (await db.execute(stmt)).scalars().all()
+                    if not emails:
+                        break
+
+                    await load_bodies(db, emails)
+                    codes = codes_for_emails(emails, await load_code_extractor())
+                    await save_codes(db, codes)
+                    await db.commit()
+
+                cursor = emails[-1].id
+                scanned += len(emails)
+                found += len(codes)
+                progress = {"store": store_id, "last_email_id": cursor, "scanned": scanned, "found": found}
+                await update_job_progress(job.id, message=f"已扫描 {scanned} 封邮件", result=progress)
+
+    if job.account_id is None:
+        async with AsyncSessionLocal() as db:
+            await db.merge(SystemSetting(key=BACKFILL_DONE_KEY, value=datetime.utcnow().isoformat()))
+            await db.commit()
+
+    logger.info(f"Verification code backfill finished: {found} codes from {scanned} emails")
+    return {"last_email_id": cursor, "scanned": scanned, "found": found}
@@ -0,0 +1,185 @@
+"""
+同步结果合并写入 (group commit)
+
+多个账户同时同步时，每次同步各自提交一个小事务，SQLite 的写锁与提交开销按事务串行。
+开启合并写入后，同步把待写入的邮件交给本进程内唯一的写入任务：写入任务收集
+WRITE_COALESCE_WINDOW_MS 毫秒内 (或累计 WRITE_COALESCE_MAX_ROWS 封邮件) 的所有请求，
+在一个事务中写入并提交，然后逐个确认各同步 (submit 返回实际写入数)。
+
+持久性：
+- submit 返回时数据已经提交；同一批次的所有同步共享这一次提交
+- 提交前进程退出 (或批次失败) 时未确认的邮件没有写入，同步不会更新 last_sync_at，
+  下次同步重新抓取并按 message_id 去重后补齐，不会丢邮件也不会重复
+- SQLite 为 WAL + synchronous=NORMAL：已提交的事务在进程崩溃后保留，
+  操作系统崩溃或断电时可能丢失最后一次检查点之后的事务 (与不合并写入时相同)
+- 批次事务出错时整批回滚，再逐个请求单独重试，只有出错的同步收到异常
+
+按用户分库 (app/core/shards.py) 时批次按分库拆分，各分库的事务并发提交；
+账户的 last_sync_at 在主库中，于分库提交之后单独更新 (先写邮件后推进同步时间，中途退出只会重新抓取)
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.shards import MailStore
+from app.models.email import Email
+from app.models.email_account import EmailAccount
+from app.services.sync_helpers import save_new_emails
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _WriteRequest:
+    store: MailStore
+    account_id: int
+    emails: List[Email]
+    last_sync_at: Optional[datetime]
+    future: asyncio.Future
+
+
+async def _mark_synced(db: AsyncSession, synced: Dict[int, datetime]):
+    """更新账户的 last_sync_at (主库，调用方负责提交)"""
+    for account_id, last_sync_at in synced.items():
+        await db.execute(
+            update(EmailAccount)
+            .where(EmailAccount.id == account_id)
+            .values(last_sync_at=last_sync_at)
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def _write(store: MailStore, db: AsyncSession, requests: List[_WriteRequest]) -> List[int]:
+    """在 db (store 的会话) 中写入并提交，返回各请求实际写入的邮件数"""
+    counts = [await save_new_emails(db, r.emails) for r in requests]
+    synced = {r.account_id: r.last_sync_at for r in requests if r.last_sync_at is not None}
+    if not store.sharded:
+        await _mark_synced(db, synced)
+    await db.commit()
+    if store.sharded and synced:
+        async with AsyncSessionLocal() as catalog:
+            await _mark_synced(catalog, synced)
+            await catalog.commit()
+    return counts
+
+
+class WriteCoalescer:
+    """进程内的合并写入任务 (首次 submit 时启动，stop 时写完已排队的请求后退出)"""
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.requests = 0
+
+    async def submit(
+        self, store: MailStore, account_id: int, emails: List[Email], last_sync_at: Optional[datetime] = None
+    ) -> int:
+        """提交一次同步的写入 (store 在返回前需保持打开)，提交成功后返回实际写入的邮件数"""
+        if self._task is None or self._task.done() or self._task.get_loop() is not asyncio.get_running_loop():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_WriteRequest(store, account_id, emails, last_sync_at, future))
+        return await future
+
+    async def stop(self):
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        try:
+            await self._task
+        finally:
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        window = settings.write_coalesce_window_ms / 1000
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            rows = len(item.emails)
+            stopping = False
+            deadline = loop.time() + window
+            while rows < settings.write_coalesce_max_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                rows += len(item.emails)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[_WriteRequest]):
+        groups = defaultdict(list)
+        for request in batch:
+            groups[request.store.user_id].append(request)
+        if len(groups) == 1:
+            await self._flush_store(batch)
+        else:
+            await asyncio.gather(*(self._flush_store(requests) for requests in groups.values()))
+
+    async def _flush_store(self, batch: List[_WriteRequest]):
+        """同一个邮件库的请求在一个事务中写入"""
+        store = batch[0].store
+        try:
+            async with store.session() as db:
+                counts = await _write(store, db, batch)
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0].future.done():
+                    batch[0].future.set_exception(e)
+                return
+            logger.warning(f"Coalesced write of {len(batch)} syncs failed, retrying one by one: {e}")
+            for request in batch:
+                await self._flush_store([request])
+            return
+
+        self.flushes += 1
+        self.requests += len(batch)
+        for request, count in zip(batch, counts):
+            if not request.future.done():
+                request.future.set_result(count)
+
+
+write_coalescer = WriteCoalescer()
+
+
+async def persist_sync_results(
+    store: MailStore,
+    db: AsyncSession,
+    account_id: int,
+    emails: List[Email],
+    last_sync_at: Optional[datetime] = None,
+) -> int:
+    """
+    写入一次同步得到的新邮件，并按需更新账户的 last_sync_at；返回实际写入数
+    db 为 store (账户所属用户的邮件库) 的会话；开启合并写入时交给写入任务 (db 中的其他修改仍由调用方提交)，
+    否则在 db 中写入并提交
+    """
+    if not emails and last_sync_at is None:
+        return 0
+    if settings.write_coalesce_enabled:
+        return await write_coalescer.submit(store, account_id, emails, last_sync_at)
+    request = _WriteRequest(store, account_id, emails, last_sync_at, None)
+    async with store.write():
+        counts = await _write(store, db, [request])
+    return counts[0]
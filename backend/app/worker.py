@@ -0,0 +1,139 @@
+"""
+独立同步 Worker 入口
+
+    python -m app.worker --processes 4
+
+在 N 个子进程中各自运行独立的事件循环和同步调度器，按 account_id % N 分片，
+与 API 进程完全隔离 (API 侧设置 SYNC_EMBEDDED_SCHEDULER=false，只处理请求)。
+多节点部署时各节点之间再通过租约表分配账户。
+分片与租约既决定调度器为哪些账户放入定时同步，也决定认领哪些账户的任务 (API 放入的手动同步等)；
+不属于任何账户的全局维护任务由任意进程认领。
+
+收到 SIGTERM / SIGINT 后停止派发新的同步，等待进行中的同步提交完成
+(最多 SYNC_DRAIN_TIMEOUT_SECONDS 秒) 并释放租约后退出。
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+import sys
+import time
+from typing import List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.worker")
+
+RESTART_DELAY_SECONDS = 5
+
+
+def _setup_logging(name: str):
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s - {name} - %(name)s - %(levelname)s - %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+
+
+async def _serve(shard_index: int, shard_count: int, drain_timeout: float):
+    """单个 Worker 进程：运行调度器直到收到退出信号"""
+    from app.core.database import close_db
+    from app.services.rate_limiter import share_among_sync_processes
+    from app.services.scheduler import SyncScheduler
+
+    # 各进程的限流器互不通信：按进程数平分配置的上限
+    share_among_sync_processes(shard_count)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    scheduler = SyncScheduler(shard_index=shard_index, shard_count=shard_count)
+    await scheduler.start()
+    try:
+        await stop_event.wait()
+        logger.info(f"Shard {shard_index}/{shard_count} shutting down")
+    finally:
+        await scheduler.stop(drain_timeout=drain_timeout)
+        await close_db()
+
+
+def run_shard(shard_index: int, shard_count: int, drain_timeout: float):
+    """子进程入口"""
+    _setup_logging(f"sync-worker-{shard_index}")
+    asyncio.run(_serve(shard_index, shard_count, drain_timeout))
+
+
+def _start_process(ctx, shard_index: int, shard_count: int, drain_timeout: float):
+    process = ctx.Process(
+        target=run_shard,
+        args=(shard_index, shard_count, drain_timeout),
+        name=f"sync-worker-{shard_index}",
+    )
+    process.start()
+    logger.info(f"Started sync worker {shard_index}/{shard_count} (pid {process.pid})")
+    return process
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Mailbox Manager 同步 Worker")
+    parser.add_argument(
+        "--processes", "-n", type=int, default=settings.sync_worker_processes,
+        help="Worker 进程数 (按 account_id 分片)"
+    )
+    parser.add_argument(
+        "--drain-timeout", type=float, default=settings.sync_drain_timeout_seconds,
+        help="退出时等待进行中同步完成的最长秒数"
+    )
+    args = parser.parse_args(argv)
+    shard_count = max(args.processes, 1)
+
+    _setup_logging("sync-supervisor")
+
+    # 建表 / 迁移只在父进程执行一次
+    from app.core.database import init_db, close_db
+
+    async def _prepare():
+        await init_db()
+        await close_db()
+
+    asyncio.run(_prepare())
+
+    # spawn: 子进程不继承父进程的数据库连接和事件循环
+    ctx = multiprocessing.get_context("spawn")
+    processes = [_start_process(ctx, i, shard_count, args.drain_timeout) for i in range(shard_count)]
+
+    stopping = False
+
+    def _shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes:
+            if process.is_alive():
+                process.terminate()  # SIGTERM，子进程会先排空进行中的同步
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    # 监督子进程：异常退出时重新拉起
+    while not stopping:
+        for i, process in enumerate(processes):
+            if not process.is_alive() and not stopping:
+                logger.warning(f"Sync worker {i} exited with code {process.exitcode}, restarting")
+                time.sleep(RESTART_DELAY_SECONDS)
+                if not stopping:
+                    processes[i] = _start_process(ctx, i, shard_count, args.drain_timeout)
+        time.sleep(1)
+
+    for process in processes:
+        process.join(timeout=args.drain_timeout + 10)
+        if process.is_alive():
+            logger.warning(f"Sync worker {process.name} did not exit in time, killing")
+            process.kill()
+    logger.info("All sync workers stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,7 @@ from datetime import datetime
 import uvicorn
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
 # 配置日志
@@ -58,6 +58,19 @@ async def lifespan(app: FastAPI):
         logger.error(f"❌ 数据库初始化失败: {e}")
         raise
     
+    # 内嵌同步调度器 (使用独立 Worker `python -m app.worker` 时设置 SYNC_EMBEDDED_SCHEDULER=false)
+    if settings.sync_embedded_scheduler:
+        from app.services.scheduler import start_scheduler
+        await start_scheduler()
+        logger.info("🔄 同步调度器已在 API 进程内启动 (定时同步所有启用同步的账户)")
+        if settings.web_concurrency > 1:
+            logger.warning(
+                f"⚠️ WEB_CONCURRENCY={settings.web_concurrency}: 每个 API 进程都会运行同步调度器与限流器，"
+                "建议设置 SYNC_EMBEDDED_SCHEDULER=false 并使用独立 Worker (python -m app.worker)"
+            )
+    else:
+        logger.info("🔄 同步由独立 Worker 负责，API 进程只处理请求")
+    
     logger.info(f"✨ {settings.app_name} v{settings.app_version} 启动成功!")
     logger.info(f"📍 环境: {'开发' if settings.debug else '生产'}")
     
@@ -65,6 +78,9 @@ async def lifespan(app: FastAPI):
     
     # 关闭时清理
     logger.info("🛑 正在关闭服务...")
+    if settings.sync_embedded_scheduler:
+        from app.services.scheduler import stop_scheduler
+        await stop_scheduler()
     await close_db()
     logger.info("👋 服务已关闭")
 
@@ -147,6 +163,33 @@ async def health_check():
         }
     }
 
+@app.get("/api/v1/metrics", tags=["系统"], summary="运行指标", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 文本格式的运行指标 (本进程)：列表接口响应缓存的命中 / 未命中 / 304 次数与命中率"""
+    from app.services.response_cache import response_cache
+
+    stats = response_cache.stats()
+    lines = [
+        "# HELP mailbox_response_cache_requests_total List endpoint cache lookups by result",
+        "# TYPE mailbox_response_cache_requests_total counter",
+    ]
+    for scope, values in stats.items():
+        for result, name in (("hit", "hits"), ("miss", "misses"), ("error", "errors"), ("not_modified", "not_modified")):
+            lines.append(f'mailbox_response_cache_requests_total{{scope="{scope}",result="{result}"}} {values[name]}')
+    lines += [
+        "# HELP mailbox_response_cache_hit_ratio Share of list endpoint lookups served from cache",
+        "# TYPE mailbox_response_cache_hit_ratio gauge",
+    ]
+    lines += [f'mailbox_response_cache_hit_ratio{{scope="{scope}"}} {values["hit_ratio"]}' for scope, values in stats.items()]
+    size = response_cache.size()
+    if size is not None:
+        lines += [
+            "# HELP mailbox_response_cache_entries Entries in the in-process response cache",
+            "# TYPE mailbox_response_cache_entries gauge",
+            f"mailbox_response_cache_entries {size}",
+        ]
+    return "\n".join(lines) + "\n"
+
 @app.get("/api-info", tags=["系统"], summary="服务信息")
 async def root():
     return {
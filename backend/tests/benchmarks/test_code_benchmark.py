@@ -0,0 +1,75 @@
+"""
+验证码提取的准确率与速度基准
+
+标注语料: data/code_corpus.jsonl，每行一封邮件 (from / subject / text / html)，code 为期望的验证码 (没有时为 null)
+- precision: 提取出的验证码中正确的比例 (没有验证码却提取出、或提取错都算误报)
+- recall: 有验证码的邮件中正确提取的比例
+- 速度: 语料重复多轮，按入库时的调用方式 (先渲染纯文本再提取) 统计每秒处理的邮件数
+调整规则或打分后运行 `pytest tests/benchmarks -s` 查看报告；阈值低于当前结果，防止明显退化
+"""
+import json
+import os
+import time
+
+import pytest
+
+from app.services.code_extractor import CodeExtractor
+from app.services.plain_text import render_plain_text
+
+pytestmark = pytest.mark.benchmark
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "code_corpus.jsonl")
+MIN_PRECISION = 0.9
+MIN_RECALL = 0.9
+# 单核上入库时提取验证码的最低速度 (邮件 / 秒)，远低于实测值，只用于发现数量级的退化
+MIN_MESSAGES_PER_SECOND = 500
+SPEED_ROUNDS = 50
+
+
+def load_corpus():
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(extractor: CodeExtractor, corpus):
+    tp = fp = fn = 0
+    errors = []
+    for item in corpus:
+        match = extractor.extract(item["subject"], item.get("text"), item.get("html"), item["from"])
+        got = match.code if match else None
+        expected = item["code"]
+        if got == expected:
+            tp += got is not None
+            continue
+        if got is not None:
+            fp += 1
+        if expected is not None:
+            fn += 1
+        errors.append((item["id"], expected, got))
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return precision, recall, errors
+
+
+def test_accuracy():
+    corpus = load_corpus()
+    precision, recall, errors = evaluate(CodeExtractor(), corpus)
+    print(f"\ncode extraction: {len(corpus)} messages, precision {precision:.3f}, recall {recall:.3f}")
+    for item_id, expected, got in errors:
+        print(f"  {item_id}: expected {expected!r}, got {got!r}")
+    assert precision >= MIN_PRECISION
+    assert recall >= MIN_RECALL
+
+
+def test_throughput():
+    corpus = load_corpus()
+    extractor = CodeExtractor()
+    started = time.perf_counter()
+    for _ in range(SPEED_ROUNDS):
+        for item in corpus:
+            plain_text = render_plain_text(item.get("text"), item.get("html"))
+            extractor.extract(item["subject"], item.get("text"), item.get("html"), item["from"], plain_text)
+    elapsed = time.perf_counter() - started
+    rate = SPEED_ROUNDS * len(corpus) / elapsed
+    print(f"\ncode extraction: {rate:,.0f} messages/s ({SPEED_ROUNDS * len(corpus)} messages in {elapsed:.2f}s)")
+    assert rate >= MIN_MESSAGES_PER_SECOND
@@ -0,0 +1,159 @@
+"""
+邮件搜索的延迟基准：全文索引 (SQLite FTS5 / PostgreSQL tsvector) 与 ILIKE
+
+向一个账户写入 SEARCH_BENCHMARK_EMAILS 封随机生成的邮件 (固定随机种子，默认 20000 封，测几百万封时设置该环境变量)，
+按几类典型查询请求邮件列表接口 (游标分页首页，不统计总数)，分别统计使用全文索引与退回 ILIKE 时的 p50：
+- 罕见的发件人 (约 0.1% 的邮件)、常见的主题词 (约一半的邮件)、中文短语、只出现在正文中的词
+- ILIKE 只搜索主题与发件人，正文中的词搜不到；全文索引按前缀匹配，命中数可能多于 ILIKE
+运行 `pytest tests/benchmarks -s` 查看报告；阈值远低于实测值，只用于发现数量级的退化
+"""
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, inspect, insert, text
+
+from app.api.v1 import emails as emails_api
+from app.core.config import settings
+from app.core.database import engine
+from app.core.shards import central_store
+from app.models.email import Email
+from app.models.email_account import EmailAccount, ProviderType
+from app.services import search
+from app.services.plain_text import fill_plain_text
+from app.services.search import FTS_TABLE, PG_SEARCH_TABLE, index_emails
+from app.services.sync_helpers import ensure_folder_exists
+
+pytestmark = pytest.mark.benchmark
+
+SEED_EMAILS = int(os.environ.get("SEARCH_BENCHMARK_EMAILS", "20000"))
+SEED_BATCH = 2000
+REPEATS = 15
+WORDS = (
+    "account order invoice receipt shipping delivery update security alert login password reset welcome "
+    "newsletter offer discount report weekly monthly summary meeting reminder payment subscription renewal"
+).split()
+PHRASES = ("您的验证码", "订单已发货", "账户安全提醒", "会员到期", "本周精选")
+QUERIES = {
+    "rare sender": "vendor0042",
+    "common subject word": "order",
+    "cjk phrase": "订单已发货",
+    "body only": "trackingnumber",
+}
+# 全文索引的 p50 上限 (毫秒，含接口本身的开销)；远高于实测值
+MAX_FTS_P50_MS = 500
+
+
+def _seed_rows(account_id: int, folder_id: int, count: int, rng: random.Random):
+    """随机邮件 (Email 对象，尚未写入)；received_at 从现在往前每封 1 分钟"""
+    now = datetime.utcnow()
+    emails = []
+    for i in range(count):
+        words = rng.sample(WORDS, 3)
+        if rng.random() < 0.5:
+            words.append("order")
+        subject = " ".join(words)
+        if rng.random() < 0.2:
+            subject = f"{rng.choice(PHRASES)} {subject}"
+        vendor = f"vendor{rng.randrange(1000):04d}"
+        body = " ".join(rng.choices(WORDS, k=40))
+        if rng.random() < 0.01:
+            body += " trackingnumber SF1234567890"
+        emails.append(Email(
+            account_id=account_id, folder_id=folder_id, uid=str(i), message_id=f"<{uuid.uuid4().hex}@bench>",
+            subject=subject, from_name=vendor.title(), from_address=f"noreply@{vendor}.example",
+            to_addresses="user@example.com", body_text=body, size_bytes=len(body),
+            received_at=now - timedelta(minutes=i),
+        ))
+    return emails
+
+
+@pytest.fixture(scope="module")
+def seeded(run, database):
+    """写入 SEED_EMAILS 封邮件及其全文索引，返回账户 ID；结束后删除 (不影响后续测试)"""
+    columns = [attr.key for attr in inspect(Email).column_attrs if attr.key != "id"]
+    rng = random.Random(20240601)
+
+    async def seed():
+        async with central_store.session() as db:
+            account = EmailAccount(
+                user_id=1, provider=ProviderType.IMAP, email_address=f"bench-{uuid.uuid4().hex[:8]}@example.com"
+            )
+            db.add(account)
+            await db.commit()
+            folder = await ensure_folder_exists(db, account.id, "INBOX", "INBOX", "inbox")
+            for start in range(0, SEED_EMAILS, SEED_BATCH):
+                emails = _seed_rows(account.id, folder.id, min(SEED_BATCH, SEED_EMAILS - start), rng)
+                fill_plain_text(emails)
+                rows = [{key: getattr(e, key) for key in columns if getattr(e, key) is not None} for e in emails]
+                ids = dict((await db.execute(insert(Email).returning(Email.message_id, Email.id), rows)).all())
+                for email in emails:
+                    email.id = ids[email.message_id]
+                await index_emails(db, emails)
+                await db.commit()
+            return account.id
+
+    async def drop(account_id):
+        async with central_store.session() as db:
+            if engine.dialect.name == "sqlite":
+                index = f"{FTS_TABLE} WHERE rowid"
+            else:
+                index = f"{PG_SEARCH_TABLE} WHERE email_id"
+            await db.execute(
+                text(f"DELETE FROM {index} IN (SELECT id FROM emails WHERE account_id = :account_id)"),
+                {"account_id": account_id},
+            )
+            await db.execute(delete(Email).where(Email.account_id == account_id))
+            await db.execute(delete(EmailAccount).where(EmailAccount.id == account_id))
+            await db.commit()
+
+    started = time.perf_counter()
+    account_id = run(seed())
+    print(f"\nseeded {SEED_EMAILS} emails in {time.perf_counter() - started:.1f}s")
+    yield account_id
+    run(drop(account_id))
+
+
+def _latency(api, account_id, q):
+    """REPEATS 次请求的 p50 (毫秒) 与首页条数"""
+    latencies, count = [], 0
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        response = api("GET", "/api/v1/emails/", params={"account_id": account_id, "q": q, "cursor": ""})
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.text
+        count = len(response.json()["data"])
+    return statistics.median(latencies), count
+
+
+def test_search_latency(api, seeded, monkeypatch):
+    monkeypatch.setattr(settings, "response_cache_enabled", False)
+    results = {}
+    # 全文索引：本模块写入时已建好索引，直接视为就绪
+    monkeypatch.setattr(search, "_fts_ready", True)
+    for name, q in QUERIES.items():
+        results[name] = [_latency(api, seeded, q)]
+
+    async def not_ready(db):
+        return False
+
+    monkeypatch.setattr(emails_api, "fts_ready", not_ready)
+    for name, q in QUERIES.items():
+        results[name].append(_latency(api, seeded, q))
+
+    print(f"\n{engine.dialect.name}, {SEED_EMAILS} emails, p50 of {REPEATS} requests (first page of 20)")
+    for name, ((fts_ms, fts_hits), (ilike_ms, ilike_hits)) in results.items():
+        print(f"  {name:20} {QUERIES[name]!r:18} fts {fts_ms:7.1f} ms ({fts_hits:2} hits)   "
+              f"ilike {ilike_ms:7.1f} ms ({ilike_hits:2} hits)")
+
+    for name, ((fts_ms, fts_hits), _) in results.items():
+        assert fts_hits > 0, name
+        assert fts_ms <= MAX_FTS_P50_MS, name
+    # 选择性高的查询不需要按时间顺序扫描大量邮件
+    assert results["rare sender"][0][0] < results["rare sender"][1][0]
+    # ILIKE 不搜索正文
+    assert results["body only"][1][1] == 0
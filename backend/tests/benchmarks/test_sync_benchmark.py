@@ -0,0 +1,230 @@
+"""
+同步写入与列表读取的并发基准
+
+SYNCS 个账户同时同步 ROUNDS 轮 (每轮先等待 FETCH_LATENCY 模拟 IMAP 抓取，再按同步入库的方式写入 EMAILS_PER_SYNC 封新邮件)，
+同时 READERS 个读者不断请求邮件列表接口，读写共用一个事件循环 (与内嵌调度器的单进程部署相同)：
+- 写入吞吐: 所有同步实际写入的邮件数 / 耗时 (邮件 / 秒)
+- 读取延迟: 列表请求的 p50 / p95
+- 失败: 同步或读取抛出的异常 (如 "database is locked")，必须为 0
+运行 `pytest tests/benchmarks -s` 查看报告；阈值远低于实测值，只用于发现数量级的退化
+TEST_DATABASE_URL 为 PostgreSQL 时 test_sqlite_vs_postgresql 在同一负载下对比 PostgreSQL 与临时 SQLite
+"""
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List
+
+import pytest
+
+from app.core.config import settings
+from app.core.database import engine
+from app.core.shards import mail_store
+from app.models.email import Email
+from app.services.plain_text import fill_plain_text
+from app.services.sync_helpers import ensure_folder_exists
+from app.services.write_coalescer import persist_sync_results, write_coalescer
+
+pytestmark = pytest.mark.benchmark
+
+SYNCS = 8
+ROUNDS = 5
+READERS = 4
+EMAILS_PER_SYNC = 50
+FETCH_LATENCY = 0.05
+PAGE_SIZE = 20
+# 远低于实测值 (单核、临时 SQLite)
+MIN_EMAILS_PER_SECOND = 200
+MAX_READ_P95_MS = 2000
+# 设置时 test_sync_contention 把结果写入该 JSON 文件 (test_sqlite_vs_postgresql 在子进程中运行 SQLite 时使用)
+RESULT_FILE_ENV = "SYNC_BENCHMARK_RESULT"
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 合并写入的吞吐不低于不合并时的这个比例 (synchronous=NORMAL 下提交不 fsync，实测提升有限且波动大)
+MIN_COALESCE_RATIO = 0.7
+
+
+@dataclass
+class Result:
+    emails: int
+    elapsed: float
+    commits: int
+    failures: List[BaseException] = field(default_factory=list)
+    latencies: List[float] = field(default_factory=list)
+
+    @property
+    def rate(self) -> float:
+        return self.emails / self.elapsed
+
+    def percentile(self, p: int) -> float:
+        """读取延迟的第 p 百分位 (毫秒)"""
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else 0.0
+        return statistics.quantiles(self.latencies, n=100, method="inclusive")[p - 1]
+
+    def summary(self) -> dict:
+        return {
+            "emails": self.emails,
+            "emails_per_second": round(self.rate, 1),
+            "commits": self.commits,
+            "reads": len(self.latencies),
+            "read_p50_ms": round(self.percentile(50), 1),
+            "read_p95_ms": round(self.percentile(95), 1),
+            "failures": len(self.failures),
+        }
+
+    def report(self, label: str) -> str:
+        return (
+            f"{label}: {self.emails} emails in {self.elapsed:.2f}s = {self.rate:,.0f} emails/s, "
+            f"{self.commits} commits, {len(self.latencies)} reads "
+            f"p50 {self.percentile(50):.0f} ms / p95 {self.percentile(95):.0f} ms, {len(self.failures)} failures"
+        )
+
+
+@pytest.fixture
+def folders(run, create_account):
+    """SYNCS 个账户及其收件箱 [(account_id, folder_id)]"""
+    async def create(account_id):
+        async with mail_store(1) as store:
+            async with store.session() as db:
+                return account_id, (await ensure_folder_exists(db, account_id, "INBOX", "INBOX", "inbox")).id
+
+    return [run(create(create_account())) for _ in range(SYNCS)]
+
+
+@pytest.fixture(autouse=True)
+def no_response_cache(monkeypatch):
+    # 读者测的是数据库读取，不能命中列表缓存
+    monkeypatch.setattr(settings, "response_cache_enabled", False)
+
+
+def _new_emails(account_id: int, folder_id: int, count: int) -> List[Email]:
+    now = datetime.utcnow()
+    return [
+        Email(
+            account_id=account_id, folder_id=folder_id, uid=uuid.uuid4().hex[:12],
+            message_id=f"<{uuid.uuid4().hex}@example.com>",
+            subject=f"您的验证码 {i}", from_address="Service <noreply@example.com>", to_addresses="user@example.com",
+            body_text=f"您好，您的验证码是 {100000 + i}，10 分钟内有效。" * 5, size_bytes=2000, received_at=now,
+        )
+        for i in range(count)
+    ]
+
+
+async def _sync(account_id: int, folder_id: int) -> int:
+    """一个账户的 ROUNDS 次同步，返回写入的邮件数"""
+    written = 0
+    for _ in range(ROUNDS):
+        await asyncio.sleep(FETCH_LATENCY)
+        emails = _new_emails(account_id, folder_id, EMAILS_PER_SYNC)
+        fill_plain_text(emails)
+        async with mail_store(1) as store:
+            async with store.session() as db:
+                written += await persist_sync_results(store, db, account_id, emails, datetime.utcnow())
+    return written
+
+
+async def _read_until(client, account_ids: List[int], done: asyncio.Event, result: Result):
+    i = 0
+    while not done.is_set():
+        started = time.perf_counter()
+        try:
+            response = await client.get(
+                "/api/v1/emails/", params={"account_id": account_ids[i % len(account_ids)], "page_size": PAGE_SIZE}
+            )
+            response.raise_for_status()
+        except Exception as e:
+            result.failures.append(e)
+        result.latencies.append((time.perf_counter() - started) * 1000)
+        i += 1
+
+
+async def contention(client, folders, readers: int = READERS) -> Result:
+    """len(folders) 个同步与 readers 个列表读者并发执行，返回写入吞吐与读取延迟"""
+    result = Result(emails=0, elapsed=0.0, commits=0)
+    done = asyncio.Event()
+    account_ids = [account_id for account_id, _ in folders]
+    flushes = write_coalescer.flushes
+    reader_tasks = [asyncio.create_task(_read_until(client, account_ids, done, result)) for _ in range(readers)]
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(_sync(account_id, folder_id) for account_id, folder_id in folders), return_exceptions=True
+    )
+    result.elapsed = time.perf_counter() - started
+    done.set()
+    await asyncio.gather(*reader_tasks)
+    await write_coalescer.stop()
+    # 不合并时每次同步的写入各自提交一次
+    if settings.write_coalesce_enabled:
+        result.commits = write_coalescer.flushes - flushes
+    else:
+        result.commits = len(folders) * ROUNDS
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            result.failures.append(outcome)
+        else:
+            result.emails += outcome
+    return result
+
+
+def test_sync_contention(run, api_client, folders):
+    result = run(contention(api_client, folders))
+    print(f"\n{engine.dialect.name}, {SYNCS} syncs x{ROUNDS} ({EMAILS_PER_SYNC} emails each), {READERS} readers")
+    print(result.report("contention"))
+    for failure in result.failures[:5]:
+        print(f"  {failure!r}")
+    if os.environ.get(RESULT_FILE_ENV):
+        with open(os.environ[RESULT_FILE_ENV], "w") as f:
+            json.dump(result.summary(), f)
+    assert not result.failures
+    assert result.emails == SYNCS * ROUNDS * EMAILS_PER_SYNC
+    assert result.rate >= MIN_EMAILS_PER_SECOND
+    assert result.percentile(95) <= MAX_READ_P95_MS
+
+
+def test_coalescing_throughput(run, api_client, folders, monkeypatch):
+    """合并写入 (group commit) 开启与关闭时的写入吞吐、提交次数与读取延迟"""
+    results = {}
+    for enabled in (False, True):
+        monkeypatch.setattr(settings, "write_coalesce_enabled", enabled)
+        results[enabled] = run(contention(api_client, folders))
+    off, on = results[False], results[True]
+    print(f"\n{engine.dialect.name}, {SYNCS} syncs x{ROUNDS} ({EMAILS_PER_SYNC} emails each), {READERS} readers")
+    print(off.report("coalescing off"))
+    print(on.report("coalescing on "))
+    print(f"throughput x{on.rate / off.rate:.2f}, commits {off.commits} -> {on.commits}")
+    assert not off.failures and not on.failures
+    assert off.emails == on.emails == SYNCS * ROUNDS * EMAILS_PER_SYNC
+    assert on.commits < off.commits
+    assert on.rate >= off.rate * MIN_COALESCE_RATIO
+
+
+@pytest.mark.skipif(engine.dialect.name != "postgresql", reason="对比 PostgreSQL 与 SQLite (设置 TEST_DATABASE_URL)")
+def test_sqlite_vs_postgresql(run, api_client, folders, tmp_path):
+    """同一负载在 PostgreSQL (本进程) 与 SQLite (子进程，使用 conftest 的临时 SQLite 库) 上各运行一次"""
+    postgresql = run(contention(api_client, folders))
+
+    output = tmp_path / "sqlite.json"
+    env = {key: value for key, value in os.environ.items() if key != "TEST_DATABASE_URL"}
+    env[RESULT_FILE_ENV] = str(output)
+    child = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", f"{__file__}::test_sync_contention"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=600,
+    )
+    assert child.returncode == 0, child.stdout[-2000:]
+    sqlite = json.loads(output.read_text())
+
+    print(f"\n{SYNCS} syncs x{ROUNDS} ({EMAILS_PER_SYNC} emails each), {READERS} readers")
+    print(f"  {'':20} {'sqlite':>10} {'postgresql':>12}")
+    for key, value in postgresql.summary().items():
+        print(f"  {key:20} {sqlite[key]:>10} {value:>12}")
+    assert sqlite["failures"] == 0
+    assert not postgresql.failures
+    assert postgresql.emails == SYNCS * ROUNDS * EMAILS_PER_SYNC
+    assert postgresql.rate >= MIN_EMAILS_PER_SECOND
+    assert postgresql.percentile(95) <= MAX_READ_P95_MS
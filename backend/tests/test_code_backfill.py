@@ -0,0 +1,178 @@
+"""历史邮件验证码回填 (app/services/verification_codes.py)：分批游标、中断后从游标继续、重复执行不产生重复行"""
+import json
+
+import pytest
+from sqlalchemy import delete, func, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.email import Email
+from app.models.job import Job, JobKind, JobStatus
+from app.models.setting import SystemSetting
+from app.models.verification_code import VerificationCode
+from app.services import verification_codes
+from app.services.verification_codes import BACKFILL_DONE_KEY, ensure_code_backfill, run_code_backfill_job
+
+BATCH = 4
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(verification_codes, "BACKFILL_BATCH_SIZE", BATCH)
+
+
+@pytest.fixture
+def clear_jobs(run, database):
+    async def clear():
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Job))
+            await db.commit()
+
+    run(clear())
+    yield
+    run(clear())
+
+
+@pytest.fixture
+def progress(monkeypatch):
+    """记录每次写入的任务进度 result；interrupt_after 设为 n 时第 n 次写入后中断任务"""
+    calls = []
+    original = verification_codes.update_job_progress
+
+    async def record(job_id, message=None, result=None):
+        await original(job_id, message=message, result=result)
+        calls.append(result)
+        if len(calls) == record.interrupt_after:
+            raise Interrupted()
+
+    record.interrupt_after = None
+    record.calls = calls
+    monkeypatch.setattr(verification_codes, "update_job_progress", record)
+    return record
+
+
+def _account_without_codes(run, create_account, create_emails, count):
+    """写入 count 封含验证码的邮件后删除其验证码 (模拟提取验证码之前同步的历史邮件)，返回 (账户 ID, 邮件 ID 升序)"""
+    account_id = create_account()
+    create_emails(account_id, count)
+
+    async def strip():
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(VerificationCode).where(VerificationCode.account_id == account_id))
+            await db.commit()
+            return (await db.execute(
+                select(Email.id).where(Email.account_id == account_id).order_by(Email.id)
+            )).scalars().all()
+
+    return account_id, run(strip())
+
+
+def _codes(run, account_id):
+    """账户的 (邮件 ID, 验证码)，按邮件 ID 升序"""
+    async def load():
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(VerificationCode.email_id, VerificationCode.code)
+                .where(VerificationCode.account_id == account_id)
+                .order_by(VerificationCode.email_id)
+            )
+            return [tuple(row) for row in result.all()]
+
+    return run(load())
+
+
+def _job(run, account_id) -> Job:
+    async def create():
+        async with AsyncSessionLocal() as db:
+            job = Job(kind=JobKind.BACKFILL_CODES.value, account_id=account_id, status=JobStatus.RUNNING.value)
+            db.add(job)
+            await db.commit()
+            return job
+
+    return run(create())
+
+
+def _reload(run, job_id) -> Job:
+    async def load():
+        async with AsyncSessionLocal() as db:
+            return await db.get(Job, job_id)
+
+    return run(load())
+
+
+def test_backfill_resumes_from_cursor_after_interruption(run, clear_jobs, progress, create_account, create_emails):
+    account_id, email_ids = _account_without_codes(run, create_account, create_emails, 10)
+    expected = [(email_id, str(100000 + i)) for i, email_id in enumerate(email_ids)]
+
+    job = _job(run, account_id)
+    progress.interrupt_after = 1
+    with pytest.raises(Interrupted):
+        run(run_code_backfill_job(job))
+    # 第一批已提交，游标写入任务结果
+    assert _codes(run, account_id) == expected[:BATCH]
+    saved = json.loads(_reload(run, job.id).result)
+    assert (saved["last_email_id"], saved["scanned"], saved["found"]) == (email_ids[BATCH - 1], BATCH, BATCH)
+
+    # 重新认领：从游标继续，累计的数量接着增加
+    progress.interrupt_after = None
+    result = run(run_code_backfill_job(_reload(run, job.id)))
+    assert result == {"last_email_id": email_ids[-1], "scanned": 10, "found": 10}
+    assert [call["scanned"] for call in progress.calls] == [4, 8, 10]
+    assert _codes(run, account_id) == expected
+
+
+def test_backfill_rerun_is_idempotent(run, clear_jobs, progress, create_account, create_emails):
+    account_id, email_ids = _account_without_codes(run, create_account, create_emails, 6)
+
+    def backfill(result=None):
+        job = Job(kind=JobKind.BACKFILL_CODES.value, account_id=account_id)
+        job.result = json.dumps(result) if result else None
+        return run(run_code_backfill_job(job))
+
+    assert backfill()["found"] == 6
+    # 游标从头开始也只处理还没有验证码的邮件
+    assert backfill() == {"last_email_id": 0, "scanned": 0, "found": 0}
+    # 结果中的游标落后 (任务在提交后、写入进度前中断)：已回填的邮件不会重复写入
+    assert backfill({"store": None, "last_email_id": email_ids[1], "scanned": 2, "found": 2})["scanned"] == 2
+    assert len(_codes(run, account_id)) == 6
+
+
+def test_ensure_code_backfill_queues_once(run, clear_jobs):
+    async def reset(value):
+        async with AsyncSessionLocal() as db:
+            previous = (await db.execute(
+                select(SystemSetting.value).where(SystemSetting.key == BACKFILL_DONE_KEY)
+            )).scalar()
+            await db.execute(delete(SystemSetting).where(SystemSetting.key == BACKFILL_DONE_KEY))
+            if value is not None:
+                db.add(SystemSetting(key=BACKFILL_DONE_KEY, value=value))
+            await db.commit()
+            return previous
+
+    async def ensure():
+        async with AsyncSessionLocal() as db:
+            job = await ensure_code_backfill(db)
+            await db.commit()
+            return job
+
+    async def active_jobs():
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(
+                select(func.count()).select_from(Job).where(Job.kind == JobKind.BACKFILL_CODES.value)
+            )).scalar()
+
+    original = run(reset(None))
+    try:
+        first = run(ensure())
+        assert first is not None and first.account_id is None
+        # 已有活动任务时合并
+        assert run(ensure()).id == first.id
+        assert run(active_jobs()) == 1
+
+        run(reset("2026-01-01T00:00:00"))
+        assert run(ensure()) is None
+    finally:
+        run(reset(original))
@@ -0,0 +1,80 @@
+"""验证码规则引擎 (app/services/code_extractor.py)"""
+import pytest
+
+from app.services.code_extractor import (
+    CodeExtractor,
+    CodeRule,
+    KeywordMatcher,
+    extract_code,
+    parse_code_rules,
+    sender_address,
+)
+
+GITHUB_RULE = CodeRule(name="github", pattern=r"code:?\s*(?P<code>[A-Z0-9]{6})", domains=["github.com"])
+
+
+@pytest.mark.parametrize("sender", [
+    "noreply@github.com",
+    "GitHub <noreply@github.com>",
+    '"GitHub, Inc." <NoReply@GitHub.com>',
+    "GitHub <noreply@mail.github.com>",
+])
+def test_domain_rule_matches_display_name_sender(sender):
+    extractor = CodeExtractor([GITHUB_RULE])
+    match = extractor.extract("Sign in", "Your code: ABC123", None, sender)
+    assert match is not None
+    assert (match.code, match.rule) == ("ABC123", "github")
+
+
+def test_sender_rule_matches_display_name_sender():
+    rule = CodeRule(name="svc", pattern=r"PIN (\d{4})", senders=["Alerts@Bank.example"])
+    extractor = CodeExtractor([rule])
+    assert extractor.extract("", "PIN 4821", None, "My Bank <alerts@bank.example>").rule == "svc"
+
+
+def test_domain_rule_ignores_other_senders():
+    extractor = CodeExtractor([GITHUB_RULE])
+    match = extractor.extract("Hello", "code: ABC123", None, "Evil <noreply@github.com.evil.example>")
+    assert match is None or match.rule is None
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("GitHub <noreply@github.com>", "noreply@github.com"),
+    ("noreply@github.com", "noreply@github.com"),
+    ("<A@B.COM>", "a@b.com"),
+    ("", ""),
+    (None, ""),
+])
+def test_sender_address(value, expected):
+    assert sender_address(value) == expected
+
+
+def test_keyword_matcher_word_boundaries():
+    matcher = KeywordMatcher(["code", "验证码"])
+    found = [keyword for _, _, keyword in matcher.finditer("barcode 验证码 code:")]
+    assert found == ["验证码", "code"]
+
+
+@pytest.mark.parametrize("subject, body, expected", [
+    ("您的验证码", "验证码：834211，5 分钟内有效", "834211"),
+    ("Your verification code", "Use 123 456 to sign in.", "123456"),
+    ("订单已发货", "订单号 20240315889，客服电话 4008123456", None),
+    ("Login", "Your one-time code is K7P2QX", "K7P2QX"),
+    ("G-552281 is your Google verification code", "", "552281"),
+])
+def test_extract_code(subject, body, expected):
+    assert extract_code(subject, body, None) == expected
+
+
+def test_html_body_ignores_styles():
+    html = "<style>.a{color:#123456}</style><p>验证码</p><p><b>908172</b></p>"
+    assert extract_code("", None, html) == "908172"
+
+
+def test_parse_code_rules():
+    rules = parse_code_rules('[{"name": "gh", "domains": ["@github.com"], "pattern": "code (\\\\d{6})"}]')
+    assert rules[0].domains == ("github.com",)
+    with pytest.raises(ValueError):
+        parse_code_rules('[{"name": "bad", "pattern": "no group"}]')
+    with pytest.raises(ValueError):
+        parse_code_rules("{}")
@@ -0,0 +1,72 @@
+"""SQLite 连接参数与读写分离 (app/core/database.py)：每个连接的 PRAGMA、只读引擎拒绝写入、本进程内串行写入"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, ReadSessionLocal, engine, read_engine, serialized_write
+
+pytestmark = pytest.mark.skipif(engine.dialect.name != "sqlite", reason="只适用于 SQLite")
+
+
+async def _pragmas(session_factory):
+    async with session_factory() as db:
+        names = ("journal_mode", "foreign_keys", "busy_timeout", "synchronous", "temp_store", "query_only", "cache_size")
+        return {name: (await db.execute(text(f"PRAGMA {name}"))).scalar() for name in names}
+
+
+def test_write_engine_pragmas(run, database):
+    pragmas = run(_pragmas(AsyncSessionLocal))
+    assert pragmas["journal_mode"].lower() == "wal"
+    assert pragmas["foreign_keys"] == 1
+    assert pragmas["busy_timeout"] == settings.sqlite_busy_timeout_ms
+    assert pragmas["synchronous"] == 1  # NORMAL
+    assert pragmas["temp_store"] == 2  # MEMORY
+    assert pragmas["cache_size"] == -settings.sqlite_cache_size_kb
+    assert pragmas["query_only"] == 0
+
+
+def test_read_engine_is_separate_and_read_only(run, database):
+    assert read_engine is not engine
+    pragmas = run(_pragmas(ReadSessionLocal))
+    assert pragmas["query_only"] == 1
+    assert pragmas["foreign_keys"] == 1
+
+    async def write():
+        async with ReadSessionLocal() as db:
+            await db.execute(text("UPDATE users SET full_name = full_name WHERE id = 1"))
+
+    with pytest.raises(OperationalError, match="readonly"):
+        run(write())
+
+
+def test_read_engine_sees_committed_writes(run, database):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("UPDATE users SET full_name = 'read-after-write' WHERE id = 1"))
+            await db.commit()
+        async with ReadSessionLocal() as db:
+            return (await db.execute(text("SELECT full_name FROM users WHERE id = 1"))).scalar()
+
+    assert run(scenario()) == "read-after-write"
+
+
+def test_serialized_write_orders_writers_per_database(run):
+    events = []
+
+    async def writer(name, key):
+        async with serialized_write(key):
+            events.append(f"{name}:start")
+            await asyncio.sleep(0.01)
+            events.append(f"{name}:end")
+
+    async def scenario():
+        await asyncio.gather(writer("a", None), writer("b", None), writer("shard", "user_7"))
+
+    run(scenario())
+    main = [event for event in events if not event.startswith("shard")]
+    # 同一数据库的写入依次执行；其他数据库 (分库) 的写入不排队
+    assert main == ["a:start", "a:end", "b:start", "b:end"]
+    assert events.index("shard:start") < events.index("a:end")
@@ -0,0 +1,140 @@
+"""地址索引 (app/services/email_addresses.py) 与按收件地址查询：GET /emails/by-recipient、/emails/by-recipient/latest-code"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.core.shards import mail_store
+from app.models.email import Email
+from app.services.email_addresses import address_rows, normalize_address, parse_addresses
+from app.services.sync_helpers import ensure_folder_exists, save_new_emails
+
+
+@pytest.fixture(autouse=True)
+def no_response_cache(monkeypatch):
+    monkeypatch.setattr(settings, "response_cache_enabled", False)
+
+
+@pytest.fixture
+def domain():
+    """每个测试独立的域名，按地址 / 域名查询不会匹配到其他测试的邮件"""
+    return f"{uuid.uuid4().hex[:10]}.example.com"
+
+
+@pytest.fixture
+def save_email(run, database):
+    """按同步入库的方式写入一封邮件 (headers 为 Email 的地址字段，含只在入库时传入的 delivered_to)，返回邮件 ID"""
+
+    async def save(account_id: int, minutes_ago: int = 0, code: int = 123456, **headers) -> int:
+        headers.setdefault("from_address", "Service <noreply@example.com>")
+        headers.setdefault("to_addresses", "user@example.com")
+        async with mail_store(1) as store:
+            async with store.session() as db:
+                folder = await ensure_folder_exists(db, account_id, "INBOX", "INBOX", "inbox")
+                email = Email(
+                    account_id=account_id,
+                    folder_id=folder.id,
+                    uid=uuid.uuid4().hex[:8],
+                    message_id=f"<{uuid.uuid4().hex}@example.com>",
+                    subject=f"验证码 {code}",
+                    body_text=f"您的验证码是 {code}",
+                    size_bytes=1000,
+                    received_at=datetime.utcnow() - timedelta(minutes=minutes_ago),
+                    **headers,
+                )
+                await save_new_emails(db, [email])
+                await db.commit()
+                return email.id
+
+    return lambda account_id, **kwargs: run(save(account_id, **kwargs))
+
+
+def _by_recipient(api, address, **params):
+    response = api("GET", "/api/v1/emails/by-recipient", params={"address": address, **params})
+    assert response.status_code == 200, response.text
+    return [item["id"] for item in response.json()["data"]]
+
+
+def test_parse_addresses_display_names_and_case():
+    value = '"Doe, John" <John.Doe@Example.COM>, 张三 <zhang@例子.cn>, john.doe@example.com, undisclosed-recipients:;'
+    assert parse_addresses(value) == ["john.doe@example.com", "zhang@例子.cn"]
+    assert parse_addresses(None) == []
+    assert normalize_address(" <A@B.com> ") == "a@b.com"
+    for invalid in ("", "no-at-sign", "@example.com", "user@"):
+        assert normalize_address(invalid) is None
+
+
+def test_address_rows_record_each_recipient_once():
+    rows = address_rows(1, None, {
+        "from": "a@x.com",
+        "to": "A <a@x.com>, b@x.com",
+        "cc": "B@X.com",
+        "delivered_to": "a@x.com, catchall@x.com",
+    })
+    assert [(row["role"], row["address"]) for row in rows] == [
+        ("from", "a@x.com"),
+        ("to", "a@x.com"),
+        ("to", "b@x.com"),
+        ("delivered_to", "catchall@x.com"),
+    ]
+    assert all(row["domain"] == "x.com" for row in rows)
+
+
+def test_by_recipient_matches_all_recipient_roles(api, create_account, save_email, domain):
+    account_id = create_account()
+    target = f"alias@{domain}"
+    to_id = save_email(account_id, minutes_ago=4, to_addresses=f"别名 <Alias@{domain.upper()}>")
+    cc_id = save_email(account_id, minutes_ago=3, to_addresses="other@example.com", cc_addresses=target)
+    bcc_id = save_email(account_id, minutes_ago=2, bcc_addresses=f"x@{domain}, {target}")
+    # catch-all 转发：收件人头部中没有该地址，只出现在 Delivered-To 中
+    delivered_id = save_email(account_id, minutes_ago=1, to_addresses="list@example.com", delivered_to=target)
+    # 只作为发件人 / 回复地址出现的不算
+    save_email(account_id, from_address=target, reply_to=target, to_addresses="someone@example.com")
+
+    assert _by_recipient(api, target) == [delivered_id, bcc_id, cc_id, to_id]
+    assert _by_recipient(api, f"  <ALIAS@{domain}>") == [delivered_id, bcc_id, cc_id, to_id]
+    assert _by_recipient(api, target, limit=2) == [delivered_id, bcc_id]
+    since = (datetime.utcnow() - timedelta(minutes=2, seconds=30)).isoformat()
+    assert _by_recipient(api, target, since=since) == [delivered_id, bcc_id]
+
+
+def test_by_recipient_domain_returns_each_email_once(api, create_account, save_email, domain):
+    account_id = create_account()
+    both = save_email(account_id, minutes_ago=2, to_addresses=f"a@{domain}, b@{domain}", cc_addresses=f"c@{domain}")
+    single = save_email(account_id, minutes_ago=1, delivered_to=f"z@{domain}", to_addresses="list@example.com")
+    save_email(account_id, to_addresses=f"a@sub.{domain}")
+
+    assert _by_recipient(api, f"@{domain}") == [single, both]
+    assert _by_recipient(api, f"@{domain.upper()}", limit=1) == [single]
+    assert _by_recipient(api, f"a@{domain}") == [both]
+
+
+@pytest.mark.parametrize("address", ["not-an-address", "@", "@a@b.com", "user@"])
+def test_by_recipient_rejects_invalid_address(api, address):
+    for path in ("/api/v1/emails/by-recipient", "/api/v1/emails/by-recipient/latest-code"):
+        response = api("GET", path, params={"address": address})
+        assert response.status_code == 400, response.text
+        assert response.json()["detail"] == "无效的邮件地址"
+
+
+def test_latest_code_by_recipient(api, create_account, save_email, domain):
+    account_id = create_account()
+    target = f"signup@{domain}"
+
+    def latest(address, **params):
+        response = api("GET", "/api/v1/emails/by-recipient/latest-code", params={"address": address, **params})
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    assert latest(target) == {"success": False, "code": None}
+
+    save_email(account_id, minutes_ago=10, code=111111, to_addresses=target)
+    newest = save_email(account_id, minutes_ago=1, code=222222, delivered_to=f"Signup@{domain}")
+    save_email(account_id, code=333333, to_addresses=f"other@{domain}")
+
+    body = latest(target)
+    assert (body["success"], body["code"], body["email_id"], body["account_id"]) == (True, "222222", newest, account_id)
+    assert latest(f"@{domain}")["code"] == "333333"
+    since = (datetime.utcnow() - timedelta(seconds=30)).isoformat()
+    assert latest(target, since=since) == {"success": False, "code": None}
@@ -0,0 +1,61 @@
+"""正文压缩存储 (app/services/email_bodies.py)：各压缩算法的往返，以及不同算法写入的正文混合读取"""
+import pytest
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.shards import central_store
+from app.models.email import Email
+from app.models.email_body import EmailBody
+from app.services import email_bodies
+from app.services.email_bodies import CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD, compress, decompress, load_bodies
+
+TEXT = "您的验证码是 834211，5 分钟内有效。\nYour code is 834211 — ありがとう 🙂\n" * 20
+
+CODEC_PARAMS = [
+    CODEC_ZLIB,
+    CODEC_NONE,
+    pytest.param(CODEC_ZSTD, marks=pytest.mark.skipif(email_bodies.zstandard is None, reason="未安装 zstandard")),
+]
+
+
+@pytest.mark.parametrize("codec", CODEC_PARAMS)
+def test_compress_round_trip(codec):
+    data = compress(TEXT, codec)
+    assert isinstance(data, bytes)
+    assert decompress(data, codec) == TEXT
+    assert compress(None, codec) is None and decompress(None, codec) is None
+    assert decompress(compress("", codec), codec) == ""
+    if codec != CODEC_NONE:
+        assert len(data) < len(TEXT.encode("utf-8"))
+
+
+def test_unknown_codec_falls_back_to_zlib(monkeypatch):
+    monkeypatch.setattr(settings, "email_body_compression", "lz4")
+    assert email_bodies.current_codec() == CODEC_ZLIB
+
+
+def test_mixed_codecs_read_back(run, create_account, create_emails, monkeypatch):
+    """切换压缩算法后，新旧算法写入的正文与纯文本都能读出 (每行记录自己的 codec)"""
+    account_id = create_account()
+    codecs = [CODEC_ZLIB, CODEC_NONE] + ([CODEC_ZSTD] if email_bodies.zstandard is not None else [])
+    for codec in codecs:
+        monkeypatch.setattr(settings, "email_body_compression", codec)
+        create_emails(account_id, 2, folder=f"F-{codec}")
+
+    async def read():
+        async with central_store.session() as db:
+            emails = (await db.execute(
+                select(Email).where(Email.account_id == account_id).order_by(Email.id)
+            )).scalars().all()
+            stored = dict((await db.execute(
+                select(EmailBody.email_id, EmailBody.codec).where(EmailBody.email_id.in_([e.id for e in emails]))
+            )).all())
+            await load_bodies(db, emails)
+            return emails, stored
+
+    emails, stored = run(read())
+    assert sorted(set(stored.values())) == sorted(codecs)
+    for email in emails:
+        assert email.body_text == f"您的验证码是 {100000 + int(email.uid)}"
+        assert email.plain_text == email.body_text
+        assert email.snippet == email.body_text
@@ -0,0 +1,152 @@
+"""邮件接口 (app/api/v1/emails.py)：游标分页、修改标记时的文件夹 / 账户计数"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.email import Email
+from app.models.email_account import EmailAccount
+from app.models.folder import Folder
+from app.models.job import Job, JobKind
+from app.services.maintenance import reconcile_account_counters
+from app.services.search import run_search_backfill_job
+
+
+@pytest.fixture(autouse=True)
+def no_response_cache(monkeypatch):
+    monkeypatch.setattr(settings, "response_cache_enabled", False)
+
+
+def _list(api, **params):
+    response = api("GET", "/api/v1/emails/", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _walk(api, account_id, page_size):
+    """从首页开始按 next_cursor 翻到最后一页，返回 (全部邮件 ID, 每页的 pagination)"""
+    ids, pages, cursor = [], [], ""
+    while cursor is not None:
+        body = _list(api, account_id=account_id, cursor=cursor, page_size=page_size)
+        ids += [item["id"] for item in body["data"]]
+        pages.append(body["pagination"])
+        cursor = body["pagination"]["next_cursor"]
+    return ids, pages
+
+
+def test_cursor_walks_all_pages_without_gaps_or_duplicates(api, create_account, create_emails):
+    account_id = create_account()
+    create_emails(account_id, 23)
+    ids, pages = _walk(api, account_id, page_size=5)
+    # 与一次取全部的结果 (received_at DESC, id DESC) 完全一致
+    expected = [item["id"] for item in _list(api, account_id=account_id, page_size=100)["data"]]
+    assert len(expected) == 23
+    assert ids == expected
+    assert [page["has_more"] for page in pages] == [True] * 4 + [False]
+    assert pages[-1]["next_cursor"] is None
+    assert all(page["total"] is None for page in pages)  # 游标分页默认不统计总数
+
+
+def test_last_page_exactly_full_has_no_next_cursor(api, create_account, create_emails):
+    account_id = create_account()
+    create_emails(account_id, 10)
+    ids, pages = _walk(api, account_id, page_size=5)
+    assert len(ids) == 10
+    assert [page["has_more"] for page in pages] == [True, False]
+    assert _list(api, account_id=account_id, cursor="", include_total=True)["pagination"]["total"] == 10
+
+
+def test_cursor_breaks_ties_on_received_at_by_id(api, create_account, create_emails):
+    account_id = create_account()
+    start = datetime.utcnow() - timedelta(hours=1)
+    # 三个文件夹中的邮件两两 (三三) 收件时间相同
+    for folder in ("INBOX", "Archive", "Receipts"):
+        create_emails(account_id, 4, folder=folder, start=start)
+    ids, _ = _walk(api, account_id, page_size=2)
+    assert len(ids) == len(set(ids)) == 12
+    expected = [item["id"] for item in _list(api, account_id=account_id, page_size=100)["data"]]
+    assert ids == expected
+
+
+def test_empty_result_with_cursor(api, create_account):
+    body = _list(api, account_id=create_account(), cursor="")
+    assert body["data"] == []
+    assert body["pagination"] == {"page_size": 20, "next_cursor": None, "has_more": False, "total": None}
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "e30", "WyJ4IiwgMV0"])  # 乱码 / {} / ["x", 1]
+def test_invalid_cursor_is_400(api, create_account, cursor):
+    response = api("GET", "/api/v1/emails/", params={"account_id": create_account(), "cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "无效的分页游标"
+
+
+def test_cursor_with_relevance_sort_is_400(run, api, create_account, create_emails):
+    account_id = create_account()
+    create_emails(account_id, 1)
+    run(run_search_backfill_job(Job(kind=JobKind.BACKFILL_SEARCH.value)))
+    params = {"account_id": account_id, "q": "验证码", "sort": "relevance"}
+    assert api("GET", "/api/v1/emails/", params=params).status_code == 200
+    response = api("GET", "/api/v1/emails/", params={**params, "cursor": ""})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "按相关度排序不支持游标分页"
+
+
+def _counters(run, account_id, folder_id):
+    """(文件夹 total / unread, 账户 total / unread / storage)"""
+    async def load():
+        async with AsyncSessionLocal() as db:
+            folder = (await db.execute(
+                select(Folder.total_count, Folder.unread_count).where(Folder.id == folder_id)
+            )).one()
+            account = (await db.execute(
+                select(EmailAccount.total_emails, EmailAccount.unread_count, EmailAccount.storage_used)
+                .where(EmailAccount.id == account_id)
+            )).one()
+            return tuple(folder), tuple(account)
+
+    return run(load())
+
+
+def test_patch_updates_counters_once(run, api, create_account, create_emails):
+    account_id = create_account()
+    folder_id = create_emails(account_id, 3)  # 3 封未读，各 1000 字节
+
+    async def email_ids():
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(
+                select(Email.id).where(Email.account_id == account_id).order_by(Email.id)
+            )).scalars().all()
+
+    first, second, _ = run(email_ids())
+    assert _counters(run, account_id, folder_id) == ((3, 3), (3, 3, 3000))
+
+    def patch(email_id, **values):
+        response = api("PATCH", f"/api/v1/emails/{email_id}", json=values)
+        assert response.status_code == 200, response.text
+        return _counters(run, account_id, folder_id)
+
+    # 标记已读：未读数减一，重复同样的请求不再变化
+    assert patch(first, is_read=True) == ((3, 2), (3, 2, 3000))
+    assert patch(first, is_read=True) == ((3, 2), (3, 2, 3000))
+    # 移入垃圾箱：总数与未读数减一，占用空间不变；重复请求不变
+    assert patch(second, is_deleted=True) == ((2, 1), (2, 1, 3000))
+    assert patch(second, is_deleted=True) == ((2, 1), (2, 1, 3000))
+    # 垃圾箱中的邮件标记已读不影响计数，移回后按已读计入
+    assert patch(second, is_read=True) == ((2, 1), (2, 1, 3000))
+    assert patch(second, is_deleted=False) == ((3, 1), (3, 1, 3000))
+    # 星标不影响计数；同一请求同时修改多个标记
+    assert patch(first, is_flagged=True) == ((3, 1), (3, 1, 3000))
+    assert patch(first, is_read=False, is_deleted=True) == ((2, 1), (2, 1, 3000))
+
+    async def drift():
+        async with AsyncSessionLocal() as db:
+            corrected = await reconcile_account_counters(db, account_id)
+            await db.rollback()
+            return corrected
+
+    # 增量维护的计数与按邮件表重新统计的结果一致
+    assert run(drift()) == 0
@@ -0,0 +1,176 @@
+"""任务队列 (app/services/job_queue.py)：去重、认领条件与限流延后"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+
+from app.core.database import AsyncSessionLocal
+from app.models.job import Job, JobKind, JobStatus
+from app.models.sync_lease import SyncLease
+from app.services.job_queue import JobRunner, claim_next_job, enqueue_job, finish_job
+
+WORKER = "test-worker"
+
+
+@pytest.fixture(autouse=True)
+def empty_queue(run, database):
+    async def clear():
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Job))
+            await db.execute(delete(SyncLease))
+            await db.commit()
+
+    run(clear())
+    yield
+    run(clear())
+
+
+async def _enqueue(kind, account_id=None, **values):
+    async with AsyncSessionLocal() as db:
+        job, _ = await enqueue_job(db, kind, account_id)
+        if values:
+            for name, value in values.items():
+                setattr(job, name, value)
+            await db.commit()
+        return job.id
+
+
+async def _get(job_id):
+    async with AsyncSessionLocal() as db:
+        return await db.get(Job, job_id)
+
+
+def test_global_jobs_are_unique_per_kind(run):
+    async def scenario():
+        first = await _enqueue(JobKind.RECONCILE_COUNTERS.value)
+        assert await _enqueue(JobKind.RECONCILE_COUNTERS.value) == first
+        # 绕过 get_active_job 的并发入队由唯一索引拦截
+        async with AsyncSessionLocal() as db:
+            db.add(Job(kind=JobKind.RECONCILE_COUNTERS.value, status=JobStatus.PENDING.value))
+            with pytest.raises(IntegrityError):
+                await db.commit()
+
+    run(scenario())
+
+
+def test_running_global_job_blocks_other_global_jobs(run):
+    async def scenario():
+        first = await _enqueue(JobKind.RECONCILE_COUNTERS.value)
+        second = await _enqueue(JobKind.RETENTION.value)
+        assert (await claim_next_job(WORKER)).id == first
+        assert await claim_next_job(WORKER) is None
+        await finish_job(first, JobStatus.SUCCEEDED)
+        assert (await claim_next_job(WORKER)).id == second
+
+    run(scenario())
+
+
+def test_claim_respects_shards(run, create_account):
+    accounts = [create_account(), create_account()]
+
+    async def scenario():
+        for account_id in accounts:
+            await _enqueue(JobKind.SYNC.value, account_id)
+        claimed = {}
+        for shard_index in (0, 1):
+            job = await claim_next_job(WORKER, shard_index=shard_index, shard_count=2)
+            claimed[shard_index] = job.account_id
+            assert await claim_next_job(WORKER, shard_index=shard_index, shard_count=2) is None
+        assert {account_id % 2: account_id for account_id in accounts} == claimed
+
+    run(scenario())
+
+
+def test_claim_respects_leases(run, create_account):
+    account_id = create_account()
+
+    async def scenario():
+        job_id = await _enqueue(JobKind.SYNC.value, account_id)
+        global_id = await _enqueue(JobKind.GC_RAW_STORE.value)
+        # 没有租约时只能认领全局任务
+        assert (await claim_next_job(WORKER, leased=True)).id == global_id
+        await finish_job(global_id, JobStatus.SUCCEEDED)
+        assert await claim_next_job(WORKER, leased=True) is None
+
+        async with AsyncSessionLocal() as db:
+            lease = SyncLease(account_id=account_id, worker_id="other-worker", expires_at=datetime.utcnow() + timedelta(minutes=1))
+            db.add(lease)
+            await db.commit()
+            assert await claim_next_job(WORKER, leased=True) is None
+
+            # 租约过期后即使仍记在本 worker 名下也不能认领
+            lease.worker_id = WORKER
+            lease.expires_at = datetime.utcnow() - timedelta(seconds=1)
+            await db.commit()
+            assert await claim_next_job(WORKER, leased=True) is None
+
+            lease.expires_at = datetime.utcnow() + timedelta(minutes=1)
+            await db.commit()
+        assert (await claim_next_job(WORKER, leased=True)).id == job_id
+
+    run(scenario())
+
+
+def test_claim_skips_deferred_jobs(run, create_account):
+    account_id = create_account()
+
+    async def scenario():
+        job_id = await _enqueue(JobKind.SYNC.value, account_id, not_before=datetime.utcnow() + timedelta(minutes=5))
+        assert await claim_next_job(WORKER) is None
+        async with AsyncSessionLocal() as db:
+            job = await db.get(Job, job_id)
+            job.not_before = datetime.utcnow() - timedelta(seconds=1)
+            await db.commit()
+        assert (await claim_next_job(WORKER)).id == job_id
+
+    run(scenario())
+
+
+def test_runner_defers_throttled_jobs_without_running_them(run, create_account):
+    account_id = create_account()
+    handled = []
+
+    async def handler(job):
+        handled.append(job.id)
+        return {}
+
+    async def throttled(job):
+        return 30.0
+
+    async def scenario():
+        job_id = await _enqueue(JobKind.SYNC.value, account_id)
+        runner = JobRunner(
+            {JobKind.SYNC.value: handler}, WORKER, max_concurrency=1, poll_interval=0.05,
+            throttles={JobKind.SYNC.value: throttled},
+        )
+        await runner.start()
+        await asyncio.sleep(0.3)
+        await runner.stop()
+        job = await _get(job_id)
+        assert handled == []
+        assert job.status == JobStatus.PENDING.value
+        assert job.attempts == 0
+        assert job.not_before > datetime.utcnow() + timedelta(seconds=20)
+
+    run(scenario())
+
+
+def test_deleting_accounts_closes_their_jobs(run, create_account):
+    first, second = create_account(), create_account()
+
+    async def scenario():
+        from app.services.job_queue import close_account_jobs
+        from app.models.email_account import EmailAccount
+
+        jobs = [await _enqueue(JobKind.SYNC.value, account_id) for account_id in (first, second)]
+        async with AsyncSessionLocal() as db:
+            await close_account_jobs(db, [first, second])
+            await db.execute(delete(EmailAccount).where(EmailAccount.id.in_([first, second])))
+            await db.commit()
+        for job_id in jobs:
+            job = await _get(job_id)
+            assert (job.account_id, job.status) == (None, JobStatus.FAILED.value)
+
+    run(scenario())
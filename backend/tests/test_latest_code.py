@@ -0,0 +1,206 @@
+"""GET /accounts/{id}/latest-code：数据不够新时触发的快速同步、长轮询 (wait)、since 过滤"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.email_account import EmailAccount
+from app.models.job import Job, JobKind, JobPriority, JobStatus
+from app.services.events import notify_new_emails
+from app.services.imap_sync import CODE_LOOKUP_SOURCE
+from app.services.job_queue import JobRunner, enqueue_job
+from app.services.rate_limiter import rate_limiter
+
+
+@pytest.fixture(autouse=True)
+def empty_queue(run, database):
+    async def clear():
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Job))
+            await db.commit()
+
+    run(clear())
+    yield
+    run(clear())
+
+
+@pytest.fixture
+def stub_sync(run):
+    """代替真实同步的 JobRunner：同步任务只更新账户的 last_sync_at，返回已执行的任务列表"""
+    synced = []
+
+    async def sync(job):
+        synced.append(job)
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(EmailAccount).where(EmailAccount.id == job.account_id).values(last_sync_at=datetime.utcnow())
+            )
+            await db.commit()
+        return {"new_emails": 0}
+
+    runner = JobRunner({JobKind.SYNC.value: sync}, "test-code-lookup", max_concurrency=1, poll_interval=0.05)
+    run(runner.start())
+    yield synced
+    run(runner.stop())
+
+
+async def _sync_jobs(account_id):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(Job).where(Job.kind == JobKind.SYNC.value, Job.account_id == account_id)
+        )).scalars().all()
+
+
+def _latest_code(api, account_id, **params):
+    return api("GET", f"/api/v1/accounts/{account_id}/latest-code", params={"refresh": False, **params})
+
+
+def test_returns_newest_code(api, create_account, create_emails):
+    account_id = create_account()
+    create_emails(account_id, 3)
+    response = _latest_code(api, account_id)
+    assert response.status_code == 200
+    assert response.json()["code"] == "100002"
+
+
+def test_wait_times_out_with_204(api, create_account, monkeypatch):
+    monkeypatch.setattr(settings, "code_wait_recheck_seconds", 0.2)
+    account_id = create_account()
+    response = _latest_code(api, account_id, wait=1)
+    assert response.status_code == 204
+    assert response.content == b""
+
+
+def test_wait_returns_when_email_arrives(run, api_client, create_account, insert_emails, monkeypatch):
+    # 重新查询的间隔远大于测试时间：只有同步写入后的事件能提前唤醒等待中的请求
+    monkeypatch.setattr(settings, "code_wait_recheck_seconds", 60)
+    account_id = create_account()
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        request = asyncio.create_task(api_client.get(
+            f"/api/v1/accounts/{account_id}/latest-code", params={"refresh": False, "wait": 30},
+        ))
+        await asyncio.sleep(0.3)
+        assert not request.done()
+        await insert_emails(account_id, 1)
+        notify_new_emails(account_id)
+        response = await asyncio.wait_for(request, timeout=10)
+        return response, loop.time() - started
+
+    response, elapsed = run(scenario())
+    assert response.status_code == 200
+    assert response.json()["code"] == "100000"
+    assert elapsed < 5
+
+
+def test_wait_rechecks_database_without_events(api, create_account, create_emails, monkeypatch):
+    """同步由独立 Worker 执行时收不到进程内事件：按 CODE_WAIT_RECHECK_SECONDS 重新查询"""
+    monkeypatch.setattr(settings, "code_wait_recheck_seconds", 0.1)
+    account_id = create_account()
+    create_emails(account_id, 1)
+    response = _latest_code(api, account_id, wait=5)
+    assert response.json()["code"] == "100000"
+
+
+def test_since_filters_older_codes(api, create_account, create_emails):
+    account_id = create_account()
+    start = datetime.utcnow() - timedelta(hours=1)
+    create_emails(account_id, 3, start=start)  # 收件时间 start、start+1 分钟、start+2 分钟
+
+    def code_since(since):
+        return _latest_code(api, account_id, since=since).json()["code"]
+
+    assert code_since((start + timedelta(seconds=90)).isoformat()) == "100002"
+    assert code_since((start + timedelta(minutes=5)).isoformat()) is None
+    # Unix 时间戳
+    epoch = (start + timedelta(seconds=30)).replace(tzinfo=timezone.utc).timestamp()
+    assert code_since(str(int(epoch))) == "100002"
+
+
+def test_since_with_timezone_is_converted_to_utc(api, create_account, create_emails):
+    account_id = create_account()
+    start = datetime.utcnow() - timedelta(hours=1)
+    create_emails(account_id, 2, start=start)
+    boundary = start + timedelta(seconds=30)
+    # 同一时刻用 +08:00 表示：按 UTC 比较时第二封 (start + 1 分钟) 仍在 since 之后
+    shanghai = boundary.replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=8)))
+    response = _latest_code(api, account_id, since=shanghai.isoformat())
+    assert response.json()["code"] == "100001"
+    # 不转换时 (把 +08:00 的本地时间当作 UTC) 会晚 8 小时，找不到验证码
+    late = shanghai.replace(tzinfo=None).isoformat()
+    assert _latest_code(api, account_id, since=late).json()["code"] is None
+
+
+def test_unknown_account_is_404(api):
+    assert _latest_code(api, 999999).status_code == 404
+
+
+def test_fresh_data_does_not_trigger_sync(run, api, create_account):
+    account_id = create_account(last_sync_at=datetime.utcnow())
+    response = api("GET", f"/api/v1/accounts/{account_id}/latest-code")
+    freshness = response.json()["freshness"]
+    assert freshness["sync_job"] is None
+    assert not freshness["refreshed"]
+    assert 0 <= freshness["age_seconds"] < settings.code_lookup_fresh_seconds
+    assert run(_sync_jobs(account_id)) == []
+
+
+def test_stale_data_triggers_priority_sync(run, api, create_account, stub_sync):
+    stale = datetime.utcnow() - timedelta(seconds=settings.code_lookup_fresh_seconds + 30)
+    account_id = create_account(last_sync_at=stale)
+    response = api("GET", f"/api/v1/accounts/{account_id}/latest-code")
+    assert response.status_code == 200
+    freshness = response.json()["freshness"]
+    job = freshness["sync_job"]
+    assert (job["kind"], job["priority"], job["source"]) == (JobKind.SYNC.value, JobPriority.CODE_LOOKUP, CODE_LOOKUP_SOURCE)
+    assert job["status"] == JobStatus.SUCCEEDED.value
+    assert [synced.id for synced in stub_sync] == [job["id"]]
+    # 等待同步完成后重新读取同步时间
+    assert freshness["refreshed"]
+    assert datetime.fromisoformat(freshness["synced_at"]) > stale
+    assert freshness["age_seconds"] < settings.code_lookup_fresh_seconds
+
+
+def test_lookup_joins_existing_sync_and_raises_priority(run, api, create_account, monkeypatch):
+    monkeypatch.setattr(settings, "code_lookup_sync_timeout_seconds", 0.1)
+    account_id = create_account()
+
+    async def queue_scheduled():
+        async with AsyncSessionLocal() as db:
+            job, _ = await enqueue_job(db, JobKind.SYNC.value, account_id, source="scheduled")
+            return job.id
+
+    existing = run(queue_scheduled())
+    response = api("GET", f"/api/v1/accounts/{account_id}/latest-code")
+    job = response.json()["freshness"]["sync_job"]
+    assert job["id"] == existing
+    assert job["status"] == JobStatus.PENDING.value
+    jobs = run(_sync_jobs(account_id))
+    assert [(j.id, j.priority) for j in jobs] == [(existing, JobPriority.CODE_LOOKUP)]
+
+
+def test_rate_limited_account_is_not_synced(run, api, create_account):
+    account_id = create_account()
+    key = f"account:{account_id}"
+    rate_limiter.throttled([key], retry_after=60)
+    try:
+        response = api("GET", f"/api/v1/accounts/{account_id}/latest-code")
+    finally:
+        rate_limiter._states.pop(key, None)
+    assert response.json()["freshness"]["sync_job"] is None
+    assert run(_sync_jobs(account_id)) == []
+
+
+def test_refresh_false_and_disabled_sync_skip_quick_sync(run, api, create_account):
+    disabled = create_account(sync_enabled=False)
+    for account_id, params in ((create_account(), {"refresh": False}), (disabled, {})):
+        response = api("GET", f"/api/v1/accounts/{account_id}/latest-code", params=params)
+        assert response.json()["freshness"] == {
+            "synced_at": None, "age_seconds": None, "refreshed": False, "sync_job": None,
+        }
+        assert run(_sync_jobs(account_id)) == []
@@ -0,0 +1,84 @@
+"""账户租约 (app/services/scheduler/leases.py)：多个 worker 分摊账户，认领任务时只认领自己持有租约的账户"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.email_account import EmailAccount
+from app.models.job import Job, JobKind, JobStatus
+from app.models.sync_lease import SyncLease, SyncWorker
+from app.services.job_queue import claim_next_job, enqueue_jobs, finish_job
+from app.services.scheduler import SyncScheduler
+from app.services.scheduler.leases import LeaseManager
+
+
+@pytest.fixture(autouse=True)
+def empty_tables(run, database):
+    async def clear():
+        async with AsyncSessionLocal() as db:
+            for model in (Job, SyncLease, SyncWorker, EmailAccount):
+                await db.execute(delete(model))
+            await db.commit()
+
+    run(clear())
+    yield
+    run(clear())
+
+
+def test_workers_split_accounts_and_claim_only_their_own(run, create_account):
+    accounts = {create_account() for _ in range(6)}
+
+    async def scenario():
+        first, second = LeaseManager("worker-a"), LeaseManager("worker-b")
+        await first.heartbeat()
+        await second.heartbeat()
+        # 第一次心跳时只有一个存活 worker，第二轮按两个 worker 重新平衡
+        for _ in range(2):
+            await first.heartbeat()
+            await second.heartbeat()
+        assert first.owned | second.owned == accounts
+        assert not first.owned & second.owned
+        assert len(first.owned) == len(second.owned) == 3
+
+        async with AsyncSessionLocal() as db:
+            await enqueue_jobs(db, JobKind.SYNC.value, sorted(accounts))
+        for manager in (first, second):
+            claimed = set()
+            while (job := await claim_next_job(manager.worker_id, leased=True)) is not None:
+                claimed.add(job.account_id)
+                await finish_job(job.id, JobStatus.SUCCEEDED)
+            assert claimed == manager.owned
+
+        # 释放租约后另一个 worker 接手全部账户
+        await first.release_all()
+        await second.heartbeat()
+        assert second.owned == accounts
+
+    run(scenario())
+
+
+def test_scheduler_queues_only_leased_due_accounts(run, create_account, queries):
+    accounts = [create_account() for _ in range(4)]
+    recent = create_account(last_sync_at=datetime.utcnow())
+
+    async def scenario():
+        other = LeaseManager("worker-b")
+        scheduler = SyncScheduler(use_leases=True)
+        await scheduler._leases.heartbeat()
+        await other.heartbeat()
+        for _ in range(2):
+            await scheduler._leases.heartbeat()
+            await other.heartbeat()
+        owned = scheduler._leases.owned
+        with queries() as counter:
+            await scheduler._sync_all_accounts()
+        async with AsyncSessionLocal() as db:
+            queued = set((await db.execute(select(Job.account_id).where(Job.kind == JobKind.SYNC.value))).scalars())
+        return owned, queued, counter
+
+    owned, queued, counter = run(scenario())
+    assert owned and owned != set(accounts) | {recent}
+    # 只派发本 worker 持有租约且已到同步间隔的账户；其他账户不会从数据库加载
+    assert queued == owned - {recent}
+    assert counter.loaded == 0
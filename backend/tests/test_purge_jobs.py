@@ -0,0 +1,165 @@
+"""分批清空 / 删除任务 (app/services/maintenance.py)：经 API 放入队列，按批执行并通过 /jobs/{id} 报告进度"""
+import json
+
+import pytest
+from sqlalchemy import delete, func, select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.shards import central_store
+from app.models.email import Email
+from app.models.email_account import EmailAccount
+from app.models.folder import Folder
+from app.models.job import Job, JobKind, JobStatus
+from app.services import maintenance
+from app.services.job_queue import JobRunner, wait_for_job
+
+BATCH = 7
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(settings, "retention_batch_size", BATCH)
+    monkeypatch.setattr(settings, "maintenance_duty_cycle", 1.0)  # 批与批之间不休眠
+
+
+@pytest.fixture
+def progress(monkeypatch):
+    """记录每次写入的任务进度 message"""
+    messages = []
+    original = maintenance.update_job_progress
+
+    async def record(job_id, message=None, result=None):
+        messages.append(message)
+        await original(job_id, message=message, result=result)
+
+    monkeypatch.setattr(maintenance, "update_job_progress", record)
+    return messages
+
+
+@pytest.fixture
+def runner(run, database):
+    async def clear():
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Job))
+            await db.commit()
+
+    run(clear())
+    runner = JobRunner(
+        {
+            JobKind.CLEAR_INBOX.value: maintenance.run_clear_inbox_job,
+            JobKind.CLEAR_TRASH.value: maintenance.run_clear_trash_job,
+            JobKind.DELETE_ACCOUNT.value: maintenance.run_delete_account_job,
+        },
+        "test-purge", max_concurrency=1, poll_interval=0.05,
+    )
+    run(runner.start())
+    yield runner
+    run(runner.stop())
+    run(clear())
+
+
+def _finish(run, api, response):
+    """等待 API 返回的任务结束，返回 GET /jobs/{id} 的任务数据"""
+    assert response.status_code == 200, response.text
+    job_id = response.json()["data"]["id"]
+    run(wait_for_job(job_id, timeout=10, poll_interval=0.05))
+    job = api("GET", f"/api/v1/jobs/{job_id}")
+    assert job.status_code == 200
+    return job.json()["data"]
+
+
+def _state(run, account_id, folder_id):
+    """(未删除邮件数, 已删除邮件数, 文件夹 total / unread, 账户 total / unread / storage)"""
+    async def load():
+        async with AsyncSessionLocal() as db:
+            def count(deleted):
+                return select(func.count()).select_from(Email).where(
+                    Email.account_id == account_id, Email.is_deleted == deleted
+                )
+            visible = (await db.execute(count(False))).scalar()
+            trashed = (await db.execute(count(True))).scalar()
+            folder = (await db.execute(
+                select(Folder.total_count, Folder.unread_count).where(Folder.id == folder_id)
+            )).one()
+            account = (await db.execute(
+                select(EmailAccount.total_emails, EmailAccount.unread_count, EmailAccount.storage_used)
+                .where(EmailAccount.id == account_id)
+            )).one()
+            return visible, trashed, tuple(folder), tuple(account)
+
+    return run(load())
+
+
+def test_clear_inbox_then_trash_in_batches(run, api, runner, progress, create_account, create_emails):
+    account_id = create_account()
+    folder_id = create_emails(account_id, 20)
+
+    job = _finish(run, api, api("DELETE", "/api/v1/emails/clear", params={"account_id": account_id}))
+    assert job["kind"] == JobKind.CLEAR_INBOX.value
+    assert job["status"] == JobStatus.SUCCEEDED.value
+    assert job["result"] == {"trashed": 20, "total": 20}
+    assert job["message"] == "已移入垃圾箱 20 / 20 封邮件"
+    assert progress == [f"已移入垃圾箱 {n} / 20 封邮件" for n in (7, 14, 20)]
+    # 移入垃圾箱：计数归零，占用空间不变
+    assert _state(run, account_id, folder_id) == (0, 20, (0, 0), (0, 0, 20000))
+
+    progress.clear()
+    job = _finish(run, api, api("DELETE", "/api/v1/emails/clear", params={"account_id": account_id, "is_trash": True}))
+    assert job["result"] == {"deleted": 20, "total": 20}
+    assert progress == [f"已删除 {n} / 20 封邮件" for n in (7, 14, 20)]
+    assert _state(run, account_id, folder_id) == (0, 0, (0, 0), (0, 0, 0))
+
+
+def test_clear_trash_keeps_inbox(run, api, runner, create_account, create_emails):
+    account_id = create_account()
+    folder_id = create_emails(account_id, 10)
+
+    async def trash_some():
+        ids = select(Email.id).where(Email.account_id == account_id).order_by(Email.id).limit(4)
+        await maintenance.trash_email_batch(central_store, ids)
+
+    run(trash_some())
+    job = _finish(run, api, api("DELETE", "/api/v1/emails/clear", params={"account_id": account_id, "is_trash": True}))
+    assert job["result"] == {"deleted": 4, "total": 4}
+    assert _state(run, account_id, folder_id) == (6, 0, (6, 6), (6, 6, 6000))
+
+
+def test_delete_account_in_batches(run, api, runner, progress, create_account, create_emails):
+    account_id = create_account()
+    create_emails(account_id, 16)
+    create_emails(account_id, 3, folder="Archive")
+
+    response = api("DELETE", f"/api/v1/accounts/{account_id}")
+    assert response.json()["message"] == "已开始删除"
+    job = _finish(run, api, response)
+    assert job["status"] == JobStatus.SUCCEEDED.value
+    assert job["result"] == {"deleted": 19, "total": 19}
+    assert progress == [f"已删除 {n} / 19 封邮件" for n in (7, 14, 19)]
+    assert api("GET", f"/api/v1/accounts/{account_id}").status_code == 404
+
+    async def leftovers():
+        async with AsyncSessionLocal() as db:
+            emails = (await db.execute(select(func.count()).select_from(Email).where(Email.account_id == account_id))).scalar()
+            folders = (await db.execute(select(func.count()).select_from(Folder).where(Folder.account_id == account_id))).scalar()
+            return emails, folders
+
+    assert run(leftovers()) == (0, 0)
+
+
+def test_interrupted_job_resumes_progress(run, create_account, create_emails):
+    """任务中断后重新认领：已处理的数量从 result 继续累计"""
+    account_id = create_account()
+    create_emails(account_id, 5)
+
+    async def resume():
+        async with AsyncSessionLocal() as db:
+            job = Job(
+                kind=JobKind.CLEAR_INBOX.value, account_id=account_id, status=JobStatus.RUNNING.value,
+                result=json.dumps({"trashed": 8, "total": 13}),
+            )
+            db.add(job)
+            await db.commit()
+        return await maintenance.run_clear_inbox_job(job)
+
+    assert run(resume()) == {"trashed": 13, "total": 13}
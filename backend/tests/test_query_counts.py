@@ -0,0 +1,118 @@
+"""
+查询次数回归测试：同步写入一批邮件、以及各列表接口一次请求执行的 SQL 语句数与加载的 ORM 对象数
+语句数与批量大小 / 返回行数无关 (没有 N+1)；预算为当前的实际次数，增加查询时需同时调整这里
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.core.shards import central_store
+from app.models.email import Email
+from app.services.sync_helpers import ensure_folder_exists, save_new_emails
+from app.services.write_coalescer import persist_sync_results
+
+# 写入一批邮件：emails、email_bodies、email_addresses、verification_codes、全文索引 各一条，
+# 文件夹与账户计数器各一条，读取验证码规则与检查全文索引表各一条
+SAVE_BATCH_STATEMENTS = 9
+
+
+def _emails(account_id, folder_id, count):
+    now = datetime.utcnow()
+    return [
+        Email(
+            account_id=account_id,
+            folder_id=folder_id,
+            uid=str(i),
+            message_id=f"<{uuid.uuid4().hex}@example.com>",
+            subject="Your verification code",
+            from_address="Service <noreply@example.com>",
+            to_addresses="user@example.com",
+            body_text=f"Your code is {200000 + i}",
+            size_bytes=500,
+            received_at=now - timedelta(seconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.fixture(autouse=True)
+def fts_not_cached(monkeypatch):
+    """全文索引就绪的标记在进程内缓存 (其他测试完成回填后为真)：固定为未缓存，写入时总是检查索引表"""
+    from app.services import search
+
+    monkeypatch.setattr(search, "_fts_ready", False)
+
+
+@pytest.fixture
+def folder(run, create_account):
+    account_id = create_account()
+
+    async def create():
+        async with central_store.session() as db:
+            return (await ensure_folder_exists(db, account_id, "INBOX", "INBOX", "inbox")).id
+
+    return account_id, run(create())
+
+
+@pytest.mark.parametrize("count", [1, 20, 100])
+def test_save_batch_statement_count(run, queries, folder, count):
+    account_id, folder_id = folder
+
+    async def save():
+        async with central_store.session() as db:
+            saved = await save_new_emails(db, _emails(account_id, folder_id, count))
+            await db.commit()
+            return saved
+
+    with queries() as counter:
+        assert run(save()) == count
+    assert counter.count == SAVE_BATCH_STATEMENTS
+    assert counter.loaded == 0
+
+
+def test_persist_sync_results_statement_count(run, queries, folder, monkeypatch):
+    account_id, folder_id = folder
+    monkeypatch.setattr(settings, "write_coalesce_enabled", False)
+
+    async def persist():
+        async with central_store.session() as db:
+            return await persist_sync_results(
+                central_store, db, account_id, _emails(account_id, folder_id, 50), datetime.utcnow()
+            )
+
+    with queries() as counter:
+        assert run(persist()) == 50
+    # 写入一批 + 更新账户的 last_sync_at
+    assert counter.count == SAVE_BATCH_STATEMENTS + 1
+
+
+# (接口, 语句数, 除当前用户与返回的列表行之外加载的对象数)
+ENDPOINT_BUDGETS = [
+    ("/api/v1/auth/me", 1, 0),
+    ("/api/v1/accounts/", 2, 0),
+    ("/api/v1/folders/", 2, 0),
+    ("/api/v1/emails/?page_size=20", 4, 0),  # 用户、总数、当前页、账户信息
+    ("/api/v1/emails/?cursor=&page_size=20", 3, 1),  # 游标分页多取一行判断是否还有下一页
+    ("/api/v1/emails/?account_id={account_id}&cursor=&page_size=20", 3, 1),
+    ("/api/v1/accounts/{account_id}/latest-code?refresh=false", 4, 2),  # 账户、收件箱同步时间、验证码
+    ("/api/v1/emails/by-recipient?address={address}", 3, 0),
+    ("/api/v1/emails/by-recipient/latest-code?address={address}", 2, 1),
+]
+
+
+@pytest.mark.parametrize("path, statements, extra", ENDPOINT_BUDGETS)
+def test_endpoint_query_budget(api, queries, create_account, create_emails, monkeypatch, path, statements, extra):
+    monkeypatch.setattr(settings, "response_cache_enabled", False)
+    account_id = create_account()
+    create_emails(account_id, 30)
+    path = path.format(account_id=account_id, address="user@example.com")
+
+    with queries() as counter:
+        response = api("GET", path)
+    assert response.status_code == 200, response.text
+    data = response.json().get("data")
+    rows = len(data) if isinstance(data, list) else 0
+    assert counter.count == statements, counter.statements
+    assert counter.loaded <= 1 + rows + extra
@@ -0,0 +1,79 @@
+"""
+热点查询的执行计划 (SQLite EXPLAIN QUERY PLAN)：邮件列表、最新验证码、按收件地址查询与同步去重
+记录接口实际执行的语句与参数后逐条 EXPLAIN，任何一条全表扫描 (SCAN emails 等) 或整体排序都视为索引失效
+"""
+import re
+
+import pytest
+
+from app.core.config import settings
+from app.core.database import engine
+from app.core.shards import central_store
+from app.services.sync_helpers import batch_check_existing_emails
+
+pytestmark = pytest.mark.skipif(engine.dialect.name != "sqlite", reason="EXPLAIN QUERY PLAN 只适用于 SQLite")
+
+HOT_TABLES = ("emails", "verification_codes", "email_addresses", "folders")
+FULL_SCAN = re.compile(rf"\bSCAN ({'|'.join(HOT_TABLES)})\b")
+# ORDER BY 无法由索引满足时对全部匹配行排序 (只对同一 received_at 内排序的 "RIGHT PART" 不算)
+FULL_SORT = re.compile(r"USE TEMP B-TREE FOR ORDER BY")
+
+
+def explain(run, counter):
+    """对计数器记录的每条 SELECT 执行 EXPLAIN QUERY PLAN，返回 [(语句, [计划行])]"""
+    async def plans():
+        result = []
+        async with engine.connect() as conn:
+            raw = (await conn.get_raw_connection()).driver_connection
+            for statement, parameters in zip(counter.statements, counter.parameters):
+                if not statement.lstrip().upper().startswith("SELECT"):
+                    continue
+                cursor = await raw.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                result.append((statement, [row[3] for row in await cursor.fetchall()]))
+        return result
+
+    return run(plans())
+
+
+def assert_indexed(plans):
+    assert plans
+    for statement, plan in plans:
+        for detail in plan:
+            assert not FULL_SCAN.search(detail), f"{detail}\n{statement}"
+            assert not FULL_SORT.search(detail), f"{detail}\n{statement}"
+
+
+@pytest.mark.parametrize("path", [
+    "/api/v1/emails/?page_size=20",
+    "/api/v1/emails/?cursor=&page_size=20",
+    "/api/v1/emails/?account_id={account_id}&cursor=&page_size=20",
+    "/api/v1/emails/?account_id={account_id}&page=2&page_size=10",
+    "/api/v1/emails/?account_id={account_id}&folder_id={folder_id}&cursor=&page_size=20",
+    "/api/v1/accounts/{account_id}/latest-code?refresh=false",
+    "/api/v1/emails/by-recipient?address=user@example.com",
+    "/api/v1/emails/by-recipient/latest-code?address=user@example.com",
+])
+def test_endpoint_queries_use_indexes(run, api, queries, create_account, create_emails, monkeypatch, path):
+    monkeypatch.setattr(settings, "response_cache_enabled", False)
+    account_id = create_account()
+    folder_id = create_emails(account_id, 30)
+
+    with queries() as counter:
+        response = api("GET", path.format(account_id=account_id, folder_id=folder_id))
+    assert response.status_code == 200, response.text
+    assert_indexed(explain(run, counter))
+
+
+def test_sync_dedup_uses_unique_index(run, queries, create_account, create_emails):
+    account_id = create_account()
+    create_emails(account_id, 30)
+
+    async def check():
+        async with central_store.session() as db:
+            return await batch_check_existing_emails(db, account_id, [f"<missing-{i}@example.com>" for i in range(50)])
+
+    with queries() as counter:
+        assert run(check()) == set()
+    plans = explain(run, counter)
+    assert_indexed(plans)
+    assert any("uq_emails_account_message" in detail for _, plan in plans for detail in plan)
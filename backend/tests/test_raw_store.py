@@ -0,0 +1,96 @@
+"""原始邮件存储 (app/services/raw_store.py)：按内容去重、读取往返，以及删除邮件后按引用清理文件"""
+import os
+import time
+
+import pytest
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.core.shards import central_store
+from app.models.email import Email
+from app.services import raw_store
+from app.services.maintenance import delete_email_batch
+
+RAW = (
+    b"From: Service <noreply@example.com>\r\n"
+    b"To: user@example.com\r\n"
+    b"Subject: =?utf-8?b?6aqM6K+B56CB?=\r\n"
+    b"MIME-Version: 1.0\r\n"
+    b'Content-Type: multipart/mixed; boundary="b"\r\n\r\n'
+    b"--b\r\nContent-Type: text/plain; charset=utf-8\r\n\r\nYour code is 834211\r\n"
+    b'--b\r\nContent-Type: text/plain; name="a.txt"\r\nContent-Disposition: attachment; filename="a.txt"\r\n\r\nhello\r\n'
+    b"--b--\r\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def raw_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "raw_store_enabled", True)
+    monkeypatch.setattr(settings, "raw_store_dir", str(tmp_path / "raw"))
+    return tmp_path / "raw"
+
+
+def _files(root):
+    return sorted(name for _, _, names in os.walk(root) for name in names)
+
+
+def test_put_deduplicates_by_content(raw_dir):
+    digest = raw_store.put(RAW)
+    other = raw_store.put(RAW + b"x")
+    assert raw_store.put_many([RAW, RAW + b"x", RAW]) == [digest, other, digest]
+    assert _files(raw_dir) == sorted([digest + ".eml", other + ".eml"])
+    assert raw_store.digest_path(digest).startswith(os.path.join(str(raw_dir), digest[:2], digest[2:4]))
+
+
+def test_read_round_trip():
+    digest = raw_store.put(RAW)
+    assert b"".join(raw_store.iter_raw(digest)) == RAW
+    assert raw_store.raw_size(digest) == len(RAW)
+    details = raw_store.message_details(digest)
+    assert "834211" in details["body_text"]
+    assert [a["filename"] for a in details["attachments"]] == ["a.txt"]
+    assert raw_store.read_attachment(digest, 0) == ("a.txt", "text/plain", b"hello")
+    assert raw_store.read_attachment(digest, 1) is None
+    assert raw_store.message_details("0" * 64) is None
+
+
+def test_gc_removes_files_only_after_last_reference(run, create_account, create_emails):
+    """两个账户的邮件引用同一份原文：删除其中一封后文件仍保留，两封都删除后才被清理"""
+    shared = raw_store.put(RAW)
+    orphan = raw_store.put(RAW + b"orphan")
+    folder_ids = [create_emails(create_account(), 1) for _ in range(2)]
+
+    async def reference():
+        async with central_store.session() as db:
+            await db.execute(update(Email).where(Email.folder_id.in_(folder_ids)).values(raw_digest=shared))
+            await db.commit()
+            return (await db.execute(select(Email.id).where(Email.folder_id.in_(folder_ids)))).scalars().all()
+
+    def age_files():
+        old = time.time() - raw_store.GC_GRACE_SECONDS - 60
+        for digest in (shared, orphan):
+            if os.path.exists(raw_store.digest_path(digest)):
+                os.utime(raw_store.digest_path(digest), (old, old))
+
+    def gc():
+        return run(raw_store.run_raw_store_gc_job(None))
+
+    first, second = run(reference())
+    age_files()
+    assert gc()["removed"] == 1
+    assert os.path.exists(raw_store.digest_path(shared))
+    assert not os.path.exists(raw_store.digest_path(orphan))
+
+    run(delete_email_batch(central_store, select(Email.id).where(Email.id == first)))
+    assert gc()["removed"] == 0
+    assert os.path.exists(raw_store.digest_path(shared))
+
+    run(delete_email_batch(central_store, select(Email.id).where(Email.id == second)))
+    assert gc()["removed"] == 1
+    assert not os.path.exists(raw_store.digest_path(shared))
+
+
+def test_gc_skips_recent_files(run):
+    digest = raw_store.put(RAW + b"recent")
+    assert run(raw_store.run_raw_store_gc_job(None))["removed"] == 0
+    assert os.path.exists(raw_store.digest_path(digest))
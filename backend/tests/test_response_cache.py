@@ -0,0 +1,100 @@
+"""列表接口响应缓存 (app/services/response_cache.py)：ETag 与失效"""
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.response_cache import ResponseCache, etag_matches, normalize_params
+
+
+@pytest.fixture
+def local_cache(monkeypatch):
+    """进程内后端，单个 API 进程且同步在本进程内执行 (版本号能反映所有修改)"""
+    monkeypatch.setattr(settings, "redis_enabled", False)
+    monkeypatch.setattr(settings, "response_cache_enabled", True)
+    monkeypatch.setattr(settings, "web_concurrency", 1)
+    monkeypatch.setattr(settings, "sync_embedded_scheduler", True)
+
+
+PARAMS = {"account_id": 5, "page": 1, "folder": None}
+
+
+def test_etag_changes_only_with_data(run, local_cache, monkeypatch):
+    """ETag 只随版本号变化 (不随时间段变化)，修改后旧 ETag 不再返回 304"""
+    async def scenario():
+        cache = ResponseCache()
+        before = (await cache.lookup("emails", 1, PARAMS, account_id=5)).etag
+        # 不再按 TTL 时间段变化：数据未修改时一直可以 304
+        monkeypatch.setattr(settings, "response_cache_ttl_seconds", 1)
+        await asyncio.sleep(1.1)
+        unchanged = await cache.lookup("emails", 1, PARAMS, account_id=5, if_none_match=before)
+        await cache.invalidate(1, 5)
+        after = await cache.lookup("emails", 1, PARAMS, account_id=5, if_none_match=before)
+        return before, unchanged, after
+
+    before, unchanged, after = run(scenario())
+    assert before is not None
+    assert unchanged.not_modified
+    assert not after.not_modified and after.etag != before
+
+
+def test_restart_does_not_reuse_etags(run, local_cache):
+    """重启后 (新的进程内后端) 版本号重新初始化，重启前的 ETag 不会得到 304"""
+    async def scenario():
+        before = (await ResponseCache().lookup("emails", 1, PARAMS, account_id=5)).etag
+        return await ResponseCache().lookup("emails", 1, PARAMS, account_id=5, if_none_match=before)
+
+    assert not run(scenario()).not_modified
+
+
+@pytest.mark.parametrize("name, value", [("web_concurrency", 4), ("sync_embedded_scheduler", False)])
+def test_no_etag_when_other_processes_write(run, local_cache, monkeypatch, name, value):
+    """其他 API 进程 / 独立 Worker 的修改不会递增本进程的版本号：不带 ETag，也就不会返回过期的 304"""
+    monkeypatch.setattr(settings, name, value)
+
+    async def scenario():
+        cache = ResponseCache()
+        first = await cache.lookup("emails", 1, PARAMS, account_id=5)
+        second = await cache.lookup("emails", 1, PARAMS, account_id=5, if_none_match="*")
+        return first, second
+
+    first, second = run(scenario())
+    assert first.etag is None and first.headers() == {}
+    assert not second.not_modified
+
+
+def test_not_modified_and_hit(run, local_cache):
+    async def scenario():
+        cache = ResponseCache()
+        miss = await cache.lookup("folders", 1, {"account_id": 2})
+        await cache.set(miss.key, {"success": True, "data": []})
+        hit = await cache.lookup("folders", 1, {"account_id": 2})
+        not_modified = await cache.lookup("folders", 1, {"account_id": 2}, if_none_match=miss.etag)
+        return miss, hit, not_modified, cache.stats()["folders"]
+
+    miss, hit, not_modified, stats = run(scenario())
+    assert not miss.hit and hit.hit
+    assert not_modified.not_modified and not_modified.value is None
+    assert (stats["hits"], stats["misses"], stats["not_modified"]) == (1, 1, 1)
+
+
+def test_etag_matches_and_normalize_params():
+    assert etag_matches('"abc", W/"def"', 'W/"def"')
+    assert etag_matches("*", 'W/"x"')
+    assert not etag_matches(None, 'W/"x"')
+    assert normalize_params({"b": 1, "a": None, "c": "x"}) == normalize_params({"c": "x", "b": 1})
+
+
+def test_local_cache_disabled_with_multiple_api_processes(run, local_cache, monkeypatch):
+    """进程内缓存在多个 API 进程间不共享失效版本号：WEB_CONCURRENCY > 1 时不缓存响应"""
+    monkeypatch.setattr(settings, "web_concurrency", 4)
+
+    async def scenario():
+        cache = ResponseCache()
+        lookup = await cache.lookup("accounts", 1, {})
+        return cache, lookup
+
+    cache, lookup = run(scenario())
+    assert not cache.enabled
+    assert lookup.key is None and lookup.etag is None
+    assert cache.stats()["accounts"]["misses"] == 0
@@ -0,0 +1,78 @@
+"""保留策略 (app/services/maintenance.py)：按天数 / 数量删除旧邮件时保留同步仍会抓取的最新邮件"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from app.core.database import AsyncSessionLocal
+from app.core.shards import central_store
+from app.models.email import Email
+from app.models.folder import Folder
+from app.services.maintenance import RETENTION_MIN_KEEP, Throttle, apply_retention
+
+
+async def _remaining(folder_id):
+    async with AsyncSessionLocal() as db:
+        count = (await db.execute(select(func.count()).where(Email.folder_id == folder_id))).scalar()
+        folder = await db.get(Folder, folder_id)
+        return count, folder.total_count
+
+
+def test_days_policy_keeps_newest_emails(run, create_account, create_emails):
+    account_id = create_account()
+    # 全部邮件都在 30 天前收到：按天数全部过期，但最新的 RETENTION_MIN_KEEP 封仍会被同步抓取
+    folder_id = create_emails(account_id, RETENTION_MIN_KEEP + 20, start=datetime.utcnow() - timedelta(days=60))
+
+    deleted = run(apply_retention(central_store, account_id, 30, 0, Throttle(duty_cycle=1)))
+    assert deleted == 20
+    assert run(_remaining(folder_id)) == (RETENTION_MIN_KEEP, RETENTION_MIN_KEEP)
+
+
+def test_days_policy_deletes_only_expired(run, create_account, create_emails):
+    account_id = create_account()
+    old = create_emails(account_id, RETENTION_MIN_KEEP + 30, start=datetime.utcnow() - timedelta(days=60))
+    # 同一文件夹中再写入 10 封新邮件：最新的 RETENTION_MIN_KEEP 封里有 90 封已过期，仍然保留
+    create_emails(account_id, 10, start=datetime.utcnow() - timedelta(hours=1))
+
+    deleted = run(apply_retention(central_store, account_id, 30, 0, Throttle(duty_cycle=1)))
+    assert deleted == 40
+    assert run(_remaining(old)) == (RETENTION_MIN_KEEP, RETENTION_MIN_KEEP)
+
+
+def test_count_policy_never_keeps_fewer_than_minimum(run, create_account, create_emails):
+    account_id = create_account()
+    folder_id = create_emails(account_id, RETENTION_MIN_KEEP + 5)
+
+    deleted = run(apply_retention(central_store, account_id, 0, 10, Throttle(duty_cycle=1)))
+    assert deleted == 5
+    assert run(_remaining(folder_id)) == (RETENTION_MIN_KEEP, RETENTION_MIN_KEEP)
+
+
+def test_retention_job_leaves_counters_consistent(run, create_account, create_emails):
+    from app.models.email_account import EmailAccount
+    from app.models.job import Job, JobKind
+    from app.services.maintenance import reconcile_account_counters, run_retention_job
+
+    account_id = create_account(retention_days=30, retention_max_per_folder=RETENTION_MIN_KEEP)
+    inbox = create_emails(account_id, RETENTION_MIN_KEEP + 40, start=datetime.utcnow() - timedelta(days=60))
+    archive = create_emails(account_id, RETENTION_MIN_KEEP + 15, folder="Archive")
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            job = Job(kind=JobKind.RETENTION.value, account_id=account_id)
+            db.add(job)
+            await db.commit()
+        result = await run_retention_job(job)
+        assert result["deleted"] == 55
+        assert result["analyzed"]
+
+        async with AsyncSessionLocal() as db:
+            # 删除时按批扣减的计数器与按邮件表重新统计的结果一致
+            assert await reconcile_account_counters(db, account_id) == 0
+            await db.rollback()
+            account = await db.get(EmailAccount, account_id)
+            assert account.total_emails == account.unread_count == 2 * RETENTION_MIN_KEEP
+            assert account.storage_used == 2 * RETENTION_MIN_KEEP * 1000
+        for folder_id in (inbox, archive):
+            assert await _remaining(folder_id) == (RETENTION_MIN_KEEP, RETENTION_MIN_KEEP)
+
+    run(scenario())
@@ -0,0 +1,94 @@
+"""全文检索 (app/services/search.py)：查询语法转换，以及通过邮件列表接口按主题 / 发件人 / 正文搜索"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.shards import central_store
+from app.models.email import Email
+from app.models.job import Job, JobKind
+from app.services.maintenance import delete_email_batch
+from app.services.search import build_match_query, run_search_backfill_job, segment
+from app.services.sync_helpers import ensure_folder_exists, save_new_emails
+
+MESSAGES = [
+    ("Invoice #2024-03 is ready", "Billing <billing@shop.example>", "Please find your invoice attached."),
+    ("您的快递已签收", "顺丰速运 <notice@sf.example>", "快递员已将包裹放在门口。"),
+    ("Weekly digest", "News <news@example.com>", "Top stories: verification of the new release."),
+]
+
+
+@pytest.mark.parametrize("q, sqlite, postgresql", [
+    ("invoice", '"invoice"*', "invoice:*"),
+    ("Invoice 2024", '"invoice"* "2024"*', "invoice:* & 2024:*"),
+    ("快递签收", '"快 递 签 收"', "快 <-> 递 <-> 签 <-> 收"),
+    ("验证码 code", '"验 证 码" "code"*', "验 <-> 证 <-> 码 & code:*"),
+    ("!!!", None, None),
+])
+def test_build_match_query(q, sqlite, postgresql):
+    assert build_match_query(q) == sqlite
+    assert build_match_query(q, "postgresql") == postgresql
+
+
+def test_segment_splits_cjk_and_punctuation():
+    assert segment("您的code:123").split() == ["您", "的", "code", "123"]
+
+
+@pytest.fixture
+def searchable(run, create_account):
+    """写入 MESSAGES 并完成全文索引回填 (回填完成后搜索才使用索引)，返回 (账户 ID, 邮件 ID 列表)"""
+    account_id = create_account()
+
+    async def create():
+        async with central_store.session() as db:
+            folder = await ensure_folder_exists(db, account_id, "INBOX", "INBOX", "inbox")
+            emails = [
+                Email(
+                    account_id=account_id, folder_id=folder.id, uid=str(i), message_id=f"<{uuid.uuid4().hex}@x>",
+                    subject=subject, from_name=sender.split(" <")[0], from_address=sender.split("<")[1].rstrip(">"),
+                    to_addresses="user@example.com", body_text=body,
+                    received_at=datetime.utcnow() - timedelta(minutes=i),
+                )
+                for i, (subject, sender, body) in enumerate(MESSAGES)
+            ]
+            await save_new_emails(db, emails)
+            await db.commit()
+        await run_search_backfill_job(Job(kind=JobKind.BACKFILL_SEARCH.value))
+        return [email.id for email in emails]
+
+    return account_id, run(create())
+
+
+def _search(api, account_id, q, **params):
+    response = api("GET", "/api/v1/emails/", params={"account_id": account_id, "q": q, "cursor": "", **params})
+    assert response.status_code == 200, response.text
+    return [item["subject"] for item in response.json()["data"]]
+
+
+@pytest.mark.parametrize("q, expected", [
+    ("invo", [MESSAGES[0][0]]),          # 前缀匹配
+    ("2024", [MESSAGES[0][0]]),
+    ("快递", [MESSAGES[1][0]]),           # 中文按字切分后短语匹配
+    ("包裹", [MESSAGES[1][0]]),           # 正文
+    ("顺丰", [MESSAGES[1][0]]),           # 发件人名称
+    ("递快", []),
+    ("verification", [MESSAGES[2][0]]),
+    ("invoice digest", []),              # 各词之间为 AND
+])
+def test_search_subject_sender_and_body(api, searchable, monkeypatch, q, expected):
+    monkeypatch.setattr(settings, "response_cache_enabled", False)
+    account_id, _ = searchable
+    assert _search(api, account_id, q) == expected
+
+
+def test_relevance_sort_and_deleted_emails(run, api, searchable, monkeypatch):
+    monkeypatch.setattr(settings, "response_cache_enabled", False)
+    account_id, email_ids = searchable
+    response = api("GET", "/api/v1/emails/", params={"account_id": account_id, "q": "invoice", "sort": "relevance"})
+    assert [item["subject"] for item in response.json()["data"]] == [MESSAGES[0][0]]
+
+    # 删除邮件时全文索引中的行一起删除
+    run(delete_email_batch(central_store, select(Email.id).where(Email.id == email_ids[0])))
+    assert _search(api, account_id, "invoice") == []
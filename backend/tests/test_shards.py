@@ -0,0 +1,139 @@
+"""按用户分库 (app/core/shards.py)：分库写入、影子表计数器、copy_to_shards、LRU 关闭、删除用户时删除分库"""
+import os
+
+import pytest
+
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine
+from app.core.shards import copy_to_shards, mail_store, shard_router
+from app.models.email import Email
+from app.models.email_account import EmailAccount
+from app.models.user import User
+
+pytestmark = pytest.mark.skipif(engine.dialect.name != "sqlite", reason="按用户分库只支持 SQLite")
+
+
+@pytest.fixture
+def sharded(monkeypatch, tmp_path, run, database):
+    """开启分库，分库目录为本测试的临时目录 (前后都关闭已打开的分库)"""
+    run(shard_router.close())
+    monkeypatch.setattr(settings, "mail_shards_enabled", True)
+    monkeypatch.setattr(settings, "mail_shard_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "response_cache_enabled", False)
+    yield tmp_path
+    run(shard_router.close())
+
+
+async def _central_count(account_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(func.count(Email.id)).where(Email.account_id == account_id))).scalar()
+
+
+async def _shard_account(user_id: int, account_id: int):
+    """(分库中该账户的邮件数, 影子表的 total_emails / unread_count / storage_used)"""
+    async with mail_store(user_id) as store:
+        async with store.read_session() as db:
+            count = (await db.execute(select(func.count(Email.id)).where(Email.account_id == account_id))).scalar()
+            counters = (await db.execute(
+                select(EmailAccount.total_emails, EmailAccount.unread_count, EmailAccount.storage_used)
+                .where(EmailAccount.id == account_id)
+            )).one()
+    return count, tuple(counters)
+
+
+def test_emails_are_written_to_user_shard(sharded, run, api, create_account, create_emails):
+    account_id = create_account()
+    create_emails(account_id, 5)
+
+    assert os.path.exists(os.path.join(sharded, "user_1.db"))
+    assert run(_central_count(account_id)) == 0
+    assert run(_shard_account(1, account_id)) == (5, (5, 5, 5000))
+
+    # 账户接口用影子表的计数器覆盖主库中的值 (主库中仍为 0)
+    async def central_total():
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(EmailAccount.total_emails).where(EmailAccount.id == account_id))).scalar()
+
+    assert run(central_total()) == 0
+    account = api("GET", f"/api/v1/accounts/{account_id}").json()["data"]
+    assert (account["total_emails"], account["unread_count"]) == (5, 5)
+
+    response = api("GET", "/api/v1/emails/", params={"account_id": account_id, "page_size": 100})
+    assert response.status_code == 200, response.text
+    assert len(response.json()["data"]) == 5
+
+
+def test_copy_to_shards_copies_central_data_once(sharded, monkeypatch, run, create_account, create_emails):
+    monkeypatch.setattr(settings, "mail_shards_enabled", False)
+    account_id = create_account()
+    create_emails(account_id, 4)
+    create_emails(account_id, 3, folder="Archive")
+    assert run(_central_count(account_id)) == 7
+    monkeypatch.setattr(settings, "mail_shards_enabled", True)
+
+    async def central_user_emails():
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(
+                select(func.count(Email.id)).join(EmailAccount, EmailAccount.id == Email.account_id)
+                .where(EmailAccount.user_id == 1)
+            )).scalar()
+
+    copied = run(copy_to_shards())
+    assert copied[1] == run(central_user_emails())
+    assert run(_shard_account(1, account_id)) == (7, (7, 7, 7000))
+    # 主库中的数据不修改
+    assert run(_central_count(account_id)) == 7
+
+    # 分库中已有邮件的用户跳过
+    assert 1 not in run(copy_to_shards())
+    assert run(_shard_account(1, account_id))[0] == 7
+
+
+def test_idle_shards_are_closed_lru(sharded, monkeypatch, run):
+    monkeypatch.setattr(settings, "mail_shard_open_max", 2)
+    closed = shard_router.closed
+
+    async def touch(*user_ids):
+        for user_id in user_ids:
+            async with shard_router.open(user_id):
+                pass
+
+    run(touch(101, 102, 103))
+    assert list(shard_router._open) == [102, 103]
+    assert shard_router.closed == closed + 1
+
+    # 有会话在使用的分库不会被关闭，即使它最久未用
+    async def hold_102():
+        async with shard_router.open(102):
+            await touch(104, 105)
+            assert 102 in shard_router._open
+
+    run(hold_102())
+    assert list(shard_router._open) == [102, 105]
+    assert shard_router.closed == closed + 3
+    # 关闭的分库文件仍保留，下次使用时重新打开
+    assert shard_router.user_ids() == [101, 102, 103, 104, 105]
+
+
+def test_delete_user_drops_shard(sharded, run, api, create_account, create_emails):
+    async def create_user() -> int:
+        async with AsyncSessionLocal() as db:
+            user = User(username="shard-owner", email="shard-owner@example.com", hashed_password="x")
+            db.add(user)
+            await db.commit()
+            return user.id
+
+    user_id = run(create_user())
+    account_id = create_account(user_id=user_id)
+    create_emails(account_id, 3, user_id=user_id)
+    path = shard_router.path(user_id)
+    assert os.path.exists(path)
+    assert run(_shard_account(user_id, account_id))[0] == 3
+
+    response = api("DELETE", f"/api/v1/users/{user_id}")
+    assert response.status_code == 200, response.text
+    assert user_id not in shard_router._open
+    assert not any(os.path.exists(path + suffix) for suffix in ("", "-wal", "-shm"))
+    assert user_id not in shard_router.user_ids()
@@ -0,0 +1,39 @@
+"""独立同步 Worker (app/worker.py)：各分片进程的调度器只认领本分片账户的任务"""
+import pytest
+from sqlalchemy import delete
+
+from app.core.database import AsyncSessionLocal
+from app.models.job import Job, JobKind, JobStatus
+from app.services.job_queue import claim_next_job, enqueue_jobs, finish_job
+from app.services.scheduler import SyncScheduler
+
+
+@pytest.fixture(autouse=True)
+def empty_queue(run, database):
+    async def clear():
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Job))
+            await db.commit()
+
+    run(clear())
+    yield
+    run(clear())
+
+
+def test_shard_schedulers_claim_disjoint_accounts(run, create_account):
+    accounts = [create_account() for _ in range(4)]
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            await enqueue_jobs(db, JobKind.SYNC.value, accounts)
+        claimed = {}
+        for shard_index in range(2):
+            runner = SyncScheduler(use_leases=False, shard_index=shard_index, shard_count=2)._runner
+            while (job := await claim_next_job(
+                runner.worker_id, shard_index=runner.shard_index, shard_count=runner.shard_count, leased=runner.leased
+            )) is not None:
+                claimed[job.account_id] = shard_index
+                await finish_job(job.id, JobStatus.SUCCEEDED)
+        assert claimed == {account_id: account_id % 2 for account_id in accounts}
+
+    run(scenario())
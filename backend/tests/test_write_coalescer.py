@@ -0,0 +1,135 @@
+"""同步结果合并写入 (app/services/write_coalescer.py)：按行数、按时间窗口与停止时提交批次"""
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.shards import central_store
+from app.models.email import Email
+from app.models.email_account import EmailAccount
+from app.services.sync_helpers import ensure_folder_exists
+from app.services.write_coalescer import WriteCoalescer
+
+LONG_WINDOW_MS = 10_000
+
+
+@pytest.fixture
+def folders(run, create_account):
+    """三个账户及其收件箱 [(account_id, folder_id)]"""
+    async def create(account_id):
+        async with central_store.session() as db:
+            return account_id, (await ensure_folder_exists(db, account_id, "INBOX", "INBOX", "inbox")).id
+
+    return [run(create(create_account())) for _ in range(3)]
+
+
+def _emails(account_id, folder_id, count):
+    return [
+        Email(
+            account_id=account_id, folder_id=folder_id, uid=str(i), message_id=f"<{uuid.uuid4().hex}@example.com>",
+            subject="hello", from_address="a@example.com", to_addresses="b@example.com",
+            body_text="hello", received_at=datetime.utcnow(),
+        )
+        for i in range(count)
+    ]
+
+
+async def _stored(account_ids):
+    async with AsyncSessionLocal() as db:
+        emails = (await db.execute(select(func.count()).where(Email.account_id.in_(account_ids)))).scalar()
+        synced = (await db.execute(
+            select(func.count()).where(EmailAccount.id.in_(account_ids), EmailAccount.last_sync_at.is_not(None))
+        )).scalar()
+        return emails, synced
+
+
+def test_flush_when_max_rows_reached(run, folders, monkeypatch):
+    monkeypatch.setattr(settings, "write_coalesce_window_ms", LONG_WINDOW_MS)
+    monkeypatch.setattr(settings, "write_coalesce_max_rows", 5)
+    coalescer = WriteCoalescer()
+
+    async def scenario():
+        started = asyncio.get_running_loop().time()
+        counts = await asyncio.gather(*(
+            coalescer.submit(central_store, account_id, _emails(account_id, folder_id, 2), datetime.utcnow())
+            for account_id, folder_id in folders
+        ))
+        elapsed = asyncio.get_running_loop().time() - started
+        await coalescer.stop()
+        return counts, elapsed
+
+    counts, elapsed = run(scenario())
+    # 第三个请求使行数达到上限，不等时间窗口结束即在一个事务中提交
+    assert counts == [2, 2, 2]
+    assert elapsed < 2
+    assert (coalescer.flushes, coalescer.requests) == (1, 3)
+    assert run(_stored([a for a, _ in folders])) == (6, 3)
+
+
+def test_flush_when_window_expires(run, folders, monkeypatch):
+    monkeypatch.setattr(settings, "write_coalesce_window_ms", 50)
+    monkeypatch.setattr(settings, "write_coalesce_max_rows", 10_000)
+    coalescer = WriteCoalescer()
+    (account_id, folder_id), *_ = folders
+
+    async def scenario():
+        first = await coalescer.submit(central_store, account_id, _emails(account_id, folder_id, 3))
+        # 上一批已提交，下一个请求开始新的批次
+        second = await coalescer.submit(central_store, account_id, _emails(account_id, folder_id, 1))
+        await coalescer.stop()
+        return first, second
+
+    assert run(scenario()) == (3, 1)
+    assert (coalescer.flushes, coalescer.requests) == (2, 2)
+    assert run(_stored([account_id])) == (4, 0)
+
+
+def test_stop_flushes_pending_requests(run, folders, monkeypatch):
+    monkeypatch.setattr(settings, "write_coalesce_window_ms", LONG_WINDOW_MS)
+    monkeypatch.setattr(settings, "write_coalesce_max_rows", 10_000)
+    coalescer = WriteCoalescer()
+
+    async def scenario():
+        pending = [
+            asyncio.create_task(coalescer.submit(central_store, account_id, _emails(account_id, folder_id, 2)))
+            for account_id, folder_id in folders
+        ]
+        await asyncio.sleep(0.05)
+        assert not any(task.done() for task in pending)
+        started = asyncio.get_running_loop().time()
+        await coalescer.stop()
+        elapsed = asyncio.get_running_loop().time() - started
+        return await asyncio.gather(*pending), elapsed
+
+    counts, elapsed = run(scenario())
+    # 停止时不等时间窗口，写完已排队的请求后退出
+    assert counts == [2, 2, 2]
+    assert elapsed < 2
+    assert (coalescer.flushes, coalescer.requests) == (1, 3)
+    assert run(_stored([a for a, _ in folders])) == (6, 0)
+
+
+def test_failed_request_does_not_fail_batch(run, folders, monkeypatch):
+    monkeypatch.setattr(settings, "write_coalesce_window_ms", LONG_WINDOW_MS)
+    monkeypatch.setattr(settings, "write_coalesce_max_rows", 4)
+    coalescer = WriteCoalescer()
+    (good_account, good_folder), (bad_account, _), _ = folders
+
+    async def scenario():
+        results = await asyncio.gather(
+            coalescer.submit(central_store, good_account, _emails(good_account, good_folder, 2)),
+            # 不存在的文件夹：外键约束失败，整批回滚后逐个重试，只有这个请求收到异常
+            coalescer.submit(central_store, bad_account, _emails(bad_account, 10**9, 2)),
+            return_exceptions=True,
+        )
+        await coalescer.stop()
+        return results
+
+    good, bad = run(scenario())
+    assert good == 2
+    assert isinstance(bad, Exception)
+    assert run(_stored([good_account, bad_account])) == (2, 0)
@@ -79,6 +79,7 @@ export interface Email {
   cc_addresses?: string
   bcc_addresses?: string
   reply_to?: string
+  snippet?: string
   body_text?: string
   body_html?: string
   is_read: boolean